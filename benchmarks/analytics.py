@@ -0,0 +1,76 @@
+# benchmarks\analytics.py
+"""
+Compares reading the whole history the way ManageInterface.retrieve does (list(query) of model instances) with the
+streaming export of database.utils.analytics (keyset chunks of tuples written as they are read), and times the
+aggregates. Reports the time and the peak Python memory of each, measured by separate runs; the export is written
+to os.devnull. Runs against a throwaway SQLite file.
+
+Usage: python -m benchmarks.analytics [--rows 200000] [--users 20000] [--chunk 10000]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.history_storage import populate
+
+
+def profiled(fn):
+    """
+    Returns the time in seconds of one call of fn, and the peak traced memory in MiB of another: tracing slows
+    allocations down too much to time the traced call.
+    """
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak / 1024 / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--chunk', type=int, default=10000)
+    args = parser.parse_args()
+
+    from database.common.models import History
+    from database.connection import configure_database, db
+    from database.core import init_database
+    from database.utils import analytics
+    from database.utils.manage import ManageInterface
+
+    configure_database(path=os.path.join(tempfile.mkdtemp(), 'analytics.db'))
+    init_database()
+    populate(argparse.Namespace(rows=args.rows, users=args.users, titles=3000, days=90), True)
+
+    def export(output_format, titles=False):
+        chunks = analytics.iter_history(args.chunk)
+        if titles:
+            chunks = map(analytics.with_titles, chunks)
+        with open(os.devnull, 'w', newline='') as output:
+            analytics.write_rows(analytics.EXPORT_COLUMNS + (('titles',) if titles else ()), chunks, output,
+                                 output_format)
+
+    cases = [("retrieve (list of models)", lambda: ManageInterface.retrieve(History)),
+             ("export csv", lambda: export('csv')),
+             ("export jsonl", lambda: export('jsonl')),
+             ("export csv + titles", lambda: export('csv', titles=True)),
+             ("queries", lambda: list(analytics.top_queries())),
+             ("users", lambda: list(analytics.user_activity())),
+             ("hourly", lambda: list(analytics.hourly_load())),
+             ("hourly --timeline", lambda: list(analytics.hourly_load(timeline=True)))]
+    print(f"{args.rows} history records, {args.users} users")
+    for name, fn in cases:
+        elapsed, peak = profiled(fn)
+        print(f"{name:<28} {elapsed:7.2f} s  peak {peak:8.1f} MiB")
+    db.close_all()
+
+
+if __name__ == '__main__':
+    main()
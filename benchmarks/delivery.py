@@ -0,0 +1,80 @@
+# benchmarks\delivery.py
+"""
+Compares the number of Telegram calls and the end-to-end latency of delivering search results one photo at a time
+(the previous behaviour) with delivering them as a media group. Telegram is replaced by a fake bot that sleeps for
+a fixed round trip per call, so the benchmark runs offline.
+
+Usage: python -m benchmarks.delivery [--rtt 0.08]
+"""
+
+import argparse
+import time
+
+from site_API.common.models import TitleRecord
+from tg_API.utils.delivery import build_caption, send_results
+
+MENU_TEXT = 'menu'
+
+
+class FakeBot:
+    """
+    Stand-in for TeleBot that counts calls and simulates a network round trip for each of them.
+    """
+    def __init__(self, rtt: float):
+        self.rtt = rtt
+        self.calls = 0
+
+    def _call(self, *args, **kwargs):
+        self.calls += 1
+        time.sleep(self.rtt)
+
+    send_message = send_photo = send_media_group = delete_message = _call
+
+
+def fake_results(count: int):
+    """
+    Builds site API results with the fields used by the bot.
+    """
+    return [TitleRecord(i, f"Title {i}", "A synopsis & more.", 7.5, f"https://example.com/{i}.jpg")
+            for i in range(count)]
+
+
+def deliver_per_photo(bot, chat_id, header, response_json):
+    """
+    The delivery flow used before media groups: header, one photo per title, then the menu.
+    """
+    bot.delete_message(chat_id, 1)
+    bot.send_message(chat_id, header)
+    for i, title in enumerate(response_json["results"]):
+        bot.send_photo(chat_id, photo=title.img, caption=build_caption(i + 1, title))
+    bot.send_message(chat_id, text=MENU_TEXT)
+
+
+def deliver_media_group(bot, chat_id, header, response_json):
+    """
+    The current delivery flow: one media group, then the menu.
+    """
+    bot.delete_message(chat_id, 1)
+    send_results(bot, chat_id, header, response_json, MENU_TEXT)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rtt', type=float, default=0.08, help='simulated Telegram round trip in seconds')
+    args = parser.parse_args()
+
+    print(f"{'results':>7} | {'per-photo calls':>15} {'latency':>8} | {'media-group calls':>17} {'latency':>8}")
+    for count in range(1, 6):
+        response_json = {"results": fake_results(count)}
+        row = []
+        for deliver in (deliver_per_photo, deliver_media_group):
+            bot = FakeBot(args.rtt)
+            start = time.perf_counter()
+            deliver(bot, 1, f"TOP {count} MOVIES", response_json)
+            row.append((bot.calls, time.perf_counter() - start))
+        (old_calls, old_time), (new_calls, new_time) = row
+        print(f"{count:>7} | {old_calls:>15} {old_time:>7.3f}s | {new_calls:>17} {new_time:>7.3f}s")
+
+
+if __name__ == '__main__':
+    main()
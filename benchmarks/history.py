@@ -0,0 +1,96 @@
+# benchmarks\history.py
+"""
+Benchmarks the history table at production scale: the per-user "last 5" lookup with and without the
+(user_id, created_at) index, and trimming with the previous one-DELETE-per-user loop versus the single set-based
+DELETE. Runs against a throwaway SQLite file.
+
+Usage: python -m benchmarks.history [--rows 1000000] [--users 100000] [--lookups 2000] [--skip-loop]
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+
+def populate(History, db, rows: int, users: int):
+    """
+    Fills the history table with rows spread evenly over users, in chunked multi-row inserts.
+    """
+    start = datetime(2024, 1, 1)
+    chunk = []
+    with db.atomic():
+        for i in range(rows):
+            chunk.append({"user_id": i % users, "kind": "TOP", "type": "movie", "limit": 5, "title_ids": "1,2,3,4,5",
+                          "created_at": start + timedelta(seconds=i)})
+            if len(chunk) == 5000:
+                History.insert_many(chunk).execute()
+                chunk = []
+        if chunk:
+            History.insert_many(chunk).execute()
+
+
+def trim_loop(History, keep: int = 5):
+    """
+    The previous trim_user_history: one DELETE per distinct user.
+    """
+    for user in History.select(History.user_id).distinct():
+        latest_ids = (History.select(History.id)
+                      .where(History.user_id == user.user_id)
+                      .order_by(History.created_at.desc())
+                      .limit(keep))
+        History.delete().where((History.user_id == user.user_id) & (History.id.not_in(latest_ids))).execute()
+
+
+def time_lookups(Bot, users: int, lookups: int) -> float:
+    """
+    Times get_user_history for random users and returns the mean in milliseconds.
+    """
+    sample = [random.randrange(users) for _ in range(lookups)]
+    start = time.perf_counter()
+    for user_id in sample:
+        Bot.get_user_history(user_id)
+    return (time.perf_counter() - start) / lookups * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--users', type=int, default=100_000)
+    parser.add_argument('--lookups', type=int, default=2000)
+    parser.add_argument('--skip-loop', action='store_true', help='do not run the slow per-user trim loop')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    os.environ['DATABASE_PATH'] = os.path.join(workdir, 'bench.db')
+    from database.core import db, init_database
+    from database.common.models import History
+    from tg_API.core import Bot
+
+    init_database()
+
+    print(f"populating {args.rows} rows for {args.users} users ...")
+    populate(History, db, args.rows, args.users)
+
+    db.execute_sql('DROP INDEX history_user_id_created_at')
+    print(f"history lookup without index: {time_lookups(Bot, args.users, max(args.lookups // 100, 5)):9.3f} ms")
+    db.execute_sql('CREATE INDEX history_user_id_created_at ON history (user_id, created_at)')
+    print(f"history lookup with index:    {time_lookups(Bot, args.users, args.lookups):9.3f} ms")
+
+    db.execute_sql('CREATE TABLE history_copy AS SELECT * FROM history')
+    if not args.skip_loop:
+        start = time.perf_counter()
+        trim_loop(History)
+        print(f"trim, DELETE per user:        {time.perf_counter() - start:9.3f} s")
+        db.execute_sql('DELETE FROM history')
+        db.execute_sql('INSERT INTO history SELECT * FROM history_copy')
+
+    start = time.perf_counter()
+    deleted = Bot.trim_user_history()
+    print(f"trim, single DELETE:          {time.perf_counter() - start:9.3f} s ({deleted} rows deleted)")
+
+
+if __name__ == '__main__':
+    main()
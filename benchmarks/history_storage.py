@@ -0,0 +1,146 @@
+# benchmarks\history_storage.py
+"""
+Compares the history stored as text (the action and the newline-joined titles of every request) with the normalized
+records (the search fields and the ids of the titles, names kept once in the title table): database size, loading a
+user's history, and counting the popular custom searches. Then applies the retention policy to the normalized table
+and measures it again. Each database is vacuumed before its size is taken.
+
+Usage: python -m benchmarks.history_storage [--rows 200000] [--users 5000] [--titles 3000] [--days 90]
+                                           [--max-age 30] [--keep 20]
+"""
+
+import argparse
+import os
+import random
+import re
+import statistics
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+CUSTOM_ACTION_RE = re.compile(r"CUSTOM \[(\d+)-(\d+)\] \d+ (MOVIES|SERIES)")
+
+
+def searches(args):
+    """
+    Yields (user_id, created_at, kind, type, limit, low, high, title numbers) for the generated requests.
+    """
+    rng = random.Random(1)
+    start = datetime.now() - timedelta(days=args.days)
+    step = timedelta(days=args.days) / args.rows
+    for n in range(args.rows):
+        kind = rng.choice(('TOP', 'MID', 'CUSTOM'))
+        low, high = {'TOP': (None, None), 'MID': (0, 4)}.get(kind) or (rng.randint(0, 5), rng.randint(5, 10))
+        limit = rng.randint(1, 5)
+        yield (rng.randrange(args.users), start + step * n, kind, rng.choice(('movie', 'series')), limit, low, high,
+               rng.sample(range(args.titles), limit))
+
+
+def title_name(number: int) -> str:
+    return f"The Title Number {number} &#39;Extended&#39;"
+
+
+def action_text(kind, type_, limit, low, high) -> str:
+    label = 'MOVIES' if type_ == 'movie' else 'SERIES'
+    if kind == 'CUSTOM':
+        return f"CUSTOM [{low}-{high}] {limit} {label}"
+    return f"{kind} {limit} {label}"
+
+
+def populate(args, normalized: bool):
+    from database.common.models import History, Title
+    from database.connection import db
+    with db.atomic():
+        if normalized:
+            Title.insert_many([{"nfid": n, "type": "movie", "title": title_name(n)}
+                               for n in range(args.titles)]).execute()
+        chunk = []
+        for user_id, created_at, kind, type_, limit, low, high, numbers in searches(args):
+            if normalized:
+                chunk.append({"user_id": user_id, "created_at": created_at, "kind": kind, "type": type_,
+                              "limit": limit, "start_rating": low, "end_rating": high,
+                              "title_ids": ",".join(map(str, numbers))})
+            else:
+                chunk.append({"user_id": user_id, "created_at": created_at,
+                              "action": action_text(kind, type_, limit, low, high),
+                              "response": "".join(f"{title_name(n)}\n" for n in numbers)})
+            if len(chunk) == 5000:
+                History.insert_many(chunk).execute()
+                chunk = []
+        if chunk:
+            History.insert_many(chunk).execute()
+
+
+def popular_from_text(custom_limit: int = 10):
+    """
+    The previous Bot.popular_queries counting: GROUP BY the action text, then parse every distinct action.
+    """
+    from database.common.models import History
+    from peewee import fn
+    hits = Counter()
+    rows = (History.select(History.action, fn.COUNT(History.id).alias('hits'))
+            .where(History.action.startswith('CUSTOM'))
+            .group_by(History.action))
+    for row in rows:
+        match = CUSTOM_ACTION_RE.match(row.action)
+        if match is not None:
+            hits[(match.group(3), match.group(1), match.group(2))] += row.hits
+    return hits.most_common(custom_limit)
+
+
+def timed_ms(fn, number: int) -> float:
+    """
+    Returns the median time of fn over number calls, in milliseconds.
+    """
+    timings = []
+    for _ in range(number):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def measure(name: str, args, normalized: bool):
+    from database.connection import db
+    from tg_API.core import Bot
+    db.execute_sql('VACUUM')
+    size = os.path.getsize(db.database) / 1024 / 1024
+    rows = db.execute_sql('SELECT COUNT(*) FROM history').fetchone()[0]
+    users = iter(range(10 ** 9))
+    load_ms = timed_ms(lambda: Bot.load_history_entries(next(users) % args.users), 500)
+    popular_ms = timed_ms(Bot.popular_queries if normalized else popular_from_text, 5)
+    print(f"{name:<24} {rows:>8} rows {size:>8.1f} MiB | load history {load_ms:6.3f} ms | "
+          f"popular searches {popular_ms:8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--titles', type=int, default=3000, help='distinct titles the requests return')
+    parser.add_argument('--days', type=int, default=90, help='period the requests are spread over')
+    parser.add_argument('--max-age', type=float, default=30.0, help='retention: age in days of deleted records')
+    parser.add_argument('--keep', type=int, default=20, help='retention: latest records kept per user')
+    args = parser.parse_args()
+
+    from database.connection import configure_database, db
+    from database.core import init_database
+    from database.utils.retention import HistoryRetention
+
+    workdir = tempfile.mkdtemp()
+    for name, normalized in (("text", False), ("normalized", True)):
+        configure_database(path=os.path.join(workdir, f'{name}.db'))
+        init_database()
+        populate(args, normalized)
+        measure(name, args, normalized)
+
+    retention = HistoryRetention(max_age_days=args.max_age, keep_per_user=args.keep)
+    retention.run_once()
+    print(f"retention run: {retention.stats()}")
+    measure("normalized + retention", args, True)
+    db.close_all()
+
+
+if __name__ == '__main__':
+    main()
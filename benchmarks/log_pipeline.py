@@ -0,0 +1,76 @@
+# benchmarks\log_pipeline.py
+"""
+Compares the time a logging call takes on the caller's thread with the synchronous file handler and with the queued
+pipeline, while the disk stalls now and then (a slow fsync, a rotation, a busy volume). The caller sends records at
+a steady rate, like handlers under load, and the latency of every call is recorded.
+
+Usage: python -m benchmarks.log_pipeline [--records 5000] [--interval 0.0005] [--stall 0.02] [--stall-every 500]
+"""
+
+import argparse
+import logging
+import os
+import statistics
+import tempfile
+import time
+
+import log_config
+from log_config import logger
+
+
+class StallingFileHandler(logging.FileHandler):
+    """
+    File handler whose writes block for `stall` seconds every `every` records.
+    """
+    def __init__(self, path: str, stall: float, every: int):
+        super().__init__(path, delay=True)
+        self.stall, self.every, self.count = stall, every, 0
+
+    def emit(self, record):
+        self.count += 1
+        if self.count % self.every == 0:
+            time.sleep(self.stall)
+        super().emit(record)
+
+
+def run(args, handler: logging.Handler, queued: bool) -> dict:
+    """
+    Logs the records at the configured interval and returns the caller-side latency percentiles in microseconds.
+    """
+    if queued:
+        log_config.build_file_handler = lambda *_, **__: handler  # the pipeline writes through the stalling handler
+        log_config.configure_logging(handler.baseFilename, queue_size=args.records)
+    else:
+        log_config._replace_handlers(handler)
+    latencies = []
+    for i in range(args.records):
+        start = time.perf_counter()
+        logger.info("user %s pressed %s", i, "cb_high", extra={"user_id": i, "handler": "handler.cb_high"})
+        latencies.append((time.perf_counter() - start) * 1e6)
+        time.sleep(args.interval)
+    stats = log_config.logging_stats()
+    log_config.stop_logging()
+    latencies.sort()
+    return {"p50": statistics.median(latencies), "p99": latencies[int(len(latencies) * 0.99)],
+            "max": latencies[-1], "dropped": stats["dropped"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--records', type=int, default=5000)
+    parser.add_argument('--interval', type=float, default=0.0005, help='seconds between two records')
+    parser.add_argument('--stall', type=float, default=0.02, help='seconds a stalled write blocks')
+    parser.add_argument('--stall-every', type=int, default=500, help='records between two stalls')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    for name, queued in (("sync", False), ("queued", True)):
+        handler = StallingFileHandler(os.path.join(workdir, f'{name}.log'), args.stall, args.stall_every)
+        handler.setFormatter(log_config.formatter)
+        result = run(args, handler, queued)
+        print(f"{name:>7}: p50 {result['p50']:7.1f} us, p99 {result['p99']:7.1f} us, "
+              f"max {result['max'] / 1000:6.1f} ms, {result['dropped']} dropped")
+
+
+if __name__ == '__main__':
+    main()
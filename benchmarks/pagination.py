@@ -0,0 +1,76 @@
+# benchmarks\pagination.py
+"""
+Measures how long a tap on 'next' takes to answer when a user pages through search results, with and without the
+next page being prefetched while the user reads the current one. The site API is simulated with a fixed round trip
+and Telegram calls are stubbed, so only the time spent waiting for results is measured.
+
+Usage: python -m benchmarks.pagination [--pages 8] [--limit 5] [--rtt 0.8] [--read 1.5]
+"""
+
+import argparse
+import json
+import statistics
+import time
+
+from site_API.common.models import SearchQuery
+from site_API.core import SiteApi
+from site_API.utils.cache import ResponseCache
+
+
+class FakeResponse:
+    def __init__(self, payload):
+        self.content = json.dumps(payload).encode()
+
+
+class SlowApi:
+    """
+    Transport answering every search with a full page of generated titles after a fixed round trip.
+    """
+    def __init__(self, rtt: float):
+        self.rtt = rtt
+        self.requests = 0
+
+    def get(self, url, headers=None, params=None):
+        time.sleep(self.rtt)
+        self.requests += 1
+        offset, limit = int(params["offset"]), int(params["limit"])
+        return FakeResponse({"results": [{"nfid": n, "title": f"Title {n}", "synopsis": "...", "imdbrating": 7.0,
+                                          "img": f"https://example.com/{n}.jpg"} for n in range(offset, offset + limit)]})
+
+
+def browse(args, prefetch: bool) -> tuple:
+    """
+    Pages through a search like the bot's handlers do and returns (page turn latencies, upstream requests).
+    """
+    transport = SlowApi(args.rtt)
+    site = SiteApi("key", "host", transport, ResponseCache())
+    query = SearchQuery.high("movie", args.limit)
+    latencies = []
+    for page in range(args.pages):
+        start = time.perf_counter()
+        site.search(query)
+        if page:  # the first page is the initial search, not a page turn
+            latencies.append(time.perf_counter() - start)
+        if prefetch:
+            site.prefetch(query.next_page())
+        time.sleep(args.read)  # the user reads the page
+        query = query.next_page()
+    return latencies, transport.requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pages', type=int, default=8)
+    parser.add_argument('--limit', type=int, default=5)
+    parser.add_argument('--rtt', type=float, default=0.8, help='seconds the site API takes to answer')
+    parser.add_argument('--read', type=float, default=1.5, help='seconds the user spends on a page')
+    args = parser.parse_args()
+
+    for name, prefetch in (("no prefetch", False), ("prefetch", True)):
+        latencies, requests = browse(args, prefetch)
+        print(f"{name:>12}: page turn median {statistics.median(latencies) * 1000:7.1f} ms, "
+              f"max {max(latencies) * 1000:7.1f} ms, {requests} upstream requests")
+
+
+if __name__ == '__main__':
+    main()
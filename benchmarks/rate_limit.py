@@ -0,0 +1,141 @@
+# benchmarks\rate_limit.py
+"""
+Compares sending a burst of messages straight to a flood-limited endpoint against sending it through the rate
+limiter. The fake endpoint enforces a global and a per-chat limit like Telegram and answers 429 with a retry-after
+delay when they are exceeded. A third run adds background traffic to show that interactive calls keep their reserved
+capacity.
+
+Usage: python -m benchmarks.rate_limit [--messages 600] [--chats 60] [--threads 16] [--rate 30] [--chat-burst 5]
+"""
+
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from rate_limit import RateLimiter, RateLimitedBot, TokenBucket, background
+
+
+class FloodError(Exception):
+    """
+    The error raised by telebot for a 429 answer, reduced to the fields the limiter reads.
+    """
+    def __init__(self, retry_after: float):
+        super().__init__("Error code: 429. Description: Too Many Requests")
+        self.error_code = 429
+        self.result_json = {"parameters": {"retry_after": retry_after}}
+
+
+class FakeTelegram:
+    """
+    Endpoint with Telegram-like flood limits: a global rate and a per-chat rate with a small burst.
+    """
+    def __init__(self, rate: float, chat_rate: float, chat_burst: float, rtt: float):
+        self.rtt = rtt
+        self.global_bucket = TokenBucket(rate, rate)
+        self.chat_rate, self.chat_burst = chat_rate, chat_burst
+        self.chats = {}
+        self.lock = threading.Lock()
+        self.sent = 0
+        self.rejected = 0
+
+    def send_message(self, chat_id, text):
+        time.sleep(self.rtt)
+        now = time.monotonic()
+        with self.lock:
+            chat = self.chats.setdefault(chat_id, TokenBucket(self.chat_rate, self.chat_burst))
+            for bucket in (self.global_bucket, chat):
+                bucket.refill(now)
+            if self.global_bucket.tokens < 1 or chat.tokens < 1:
+                self.rejected += 1
+                raise FloodError(retry_after=1)
+            self.global_bucket.tokens -= 1
+            chat.tokens -= 1
+            self.sent += 1
+
+
+def send_naively(telegram, chat_id, retries: int = 3):
+    """
+    What the bot did before: send, and on a 429 wait for the retry-after delay and try again.
+    """
+    for attempt in range(retries + 1):
+        try:
+            return telegram.send_message(chat_id, "text")
+        except FloodError as e:
+            if attempt == retries:
+                raise
+            time.sleep(e.result_json["parameters"]["retry_after"])
+
+
+def run(args, limited: bool) -> tuple:
+    """
+    Sends every message from a thread pool and returns (elapsed seconds, sent, 429 answers, failures, limiter).
+    """
+    telegram = FakeTelegram(args.rate, 1.0, args.chat_burst, args.rtt)
+    limiter = RateLimiter(args.rate, args.rate, key_rate=1.0, key_burst=args.chat_burst, name='bench')
+    bot = RateLimitedBot(telegram, limiter)
+    failures = 0
+
+    def send(i):
+        nonlocal failures
+        try:
+            if limited:
+                bot.send_message(i % args.chats, "text")
+            else:
+                send_naively(telegram, i % args.chats)
+        except FloodError:
+            failures += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.threads) as pool:
+        list(pool.map(send, range(args.messages)))
+    return time.perf_counter() - start, telegram.sent, telegram.rejected, failures, limiter
+
+
+def run_priority(args) -> dict:
+    """
+    Runs background senders that saturate the limiter while interactive calls measure how long they wait.
+    """
+    limiter = RateLimiter(args.rate, args.rate, reserved=args.rate / 4, name='bench')
+    stop = threading.Event()
+
+    def background_sender():
+        with background():
+            while not stop.is_set():
+                limiter.acquire()
+
+    senders = [threading.Thread(target=background_sender) for _ in range(4)]
+    for sender in senders:
+        sender.start()
+    time.sleep(1.0)
+    for _ in range(20):
+        limiter.acquire()
+        time.sleep(0.5)
+    stop.set()
+    for sender in senders:
+        sender.join()
+    return limiter.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=600)
+    parser.add_argument('--chats', type=int, default=60)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--rate', type=float, default=30.0, help='global messages per second')
+    parser.add_argument('--chat-burst', type=float, default=5.0, help='messages a chat may receive at once')
+    parser.add_argument('--rtt', type=float, default=0.02, help='simulated request round trip in seconds')
+    args = parser.parse_args()
+
+    for name, limited in (("direct", False), ("limited", True)):
+        elapsed, sent, rejected, failures, limiter = run(args, limited)
+        print(f"{name:>8}: {sent / elapsed:6.1f} messages/s, {rejected:4d} answers 429, {failures:3d} messages lost")
+        if limited:
+            print(f"          wait: {limiter.stats()['interactive']}")
+    stats = run_priority(args)
+    print(f"priority: interactive wait {stats['interactive']}")
+    print(f"          background wait  {stats['background']}")
+
+
+if __name__ == '__main__':
+    main()
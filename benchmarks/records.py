@@ -0,0 +1,84 @@
+# benchmarks\records.py
+"""
+Compares the decoded API response the bot used to keep (the whole JSON document as dictionaries, unescaped again
+for every caption) with the compact title records parsed by parse_response: the time to parse a response, the time
+to parse and render it, and the memory a cached response holds. Records are parsed with orjson when it is installed
+and with the json module otherwise; both are measured.
+
+Usage: python -m benchmarks.records [--titles 10] [--number 2000]
+"""
+
+import argparse
+import html
+import json
+import time
+import tracemalloc
+
+from benchmarks.suite import api_payload
+from site_API.common import models
+from site_API.common.models import parse_response
+from tg_API.utils.delivery import render_results
+
+
+def render_dicts(results: list):
+    """
+    The rendering used before records: every caption is built from the dictionaries and unescaped.
+    """
+    return [html.unescape(f"{i + 1}. {title['title']}\n\n{title['synopsis']}\n\nimdbrating: {title['imdbrating']}")
+            for i, title in enumerate(results)]
+
+
+def per_call_us(fn, number: int) -> float:
+    """
+    Returns the best time per call of fn over three runs, in microseconds.
+    """
+    best = float('inf')
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        best = min(best, time.perf_counter() - start)
+    return best / number * 1e6
+
+
+def retained_bytes(build, copies: int = 200) -> float:
+    """
+    Returns the memory held by one object built by build(), averaged over several copies.
+    """
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = [build() for _ in range(copies)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return (after - before) / copies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--titles', type=int, default=10)
+    parser.add_argument('--number', type=int, default=2000)
+    args = parser.parse_args()
+
+    body = api_payload(args.titles)
+    fast = models.orjson
+    variants = [("dicts (json)", lambda: json.loads(body), lambda payload: render_dicts(payload["results"])),
+                ("records (json)", lambda: parse_response(body),
+                 lambda payload: render_results("TOP", payload["results"]))]
+    if fast is not None:
+        variants.append(("records (orjson)", lambda: parse_response(body),
+                         lambda payload: render_results("TOP", payload["results"])))
+
+    print(f"{args.titles} titles per response, {len(body)} bytes")
+    print(f"{'':>18} | {'parse':>9} | {'parse + render':>14} | {'cached response':>15}")
+    for name, parse, render in variants:
+        models.orjson = fast if 'orjson' in name else None
+        parse_us = per_call_us(parse, args.number)
+        total_us = per_call_us(lambda: render(parse()), args.number)
+        size = retained_bytes(parse)
+        print(f"{name:>18} | {parse_us:6.1f} us | {total_us:11.1f} us | {size / 1024:9.1f} KiB")
+    models.orjson = fast
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+# benchmarks\sqlite_profiles.py
+"""
+Measures history insert and read throughput under concurrent threads for every SQLite PRAGMA profile. Writer threads
+log single actions, each in its own transaction like the bot does without the batch writer, while reader threads
+fetch the latest entries of random users. Every profile runs against its own throwaway SQLite file.
+
+Usage: python -m benchmarks.sqlite_profiles [--seconds 5] [--writers 4] [--readers 4] [--users 1000] [--seed 20000]
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+
+def seed(History, db, rows: int, users: int):
+    """
+    Fills the history table so that reads have something to find.
+    """
+    start = datetime(2024, 1, 1)
+    with db.atomic():
+        for i in range(0, rows, 5000):
+            History.insert_many([{"user_id": n % users, "kind": "TOP", "type": "movie", "limit": 5,
+                                  "title_ids": "1,2,3,4,5", "created_at": start + timedelta(seconds=n)}
+                                 for n in range(i, min(i + 5000, rows))]).execute()
+
+
+def run_profile(profile: str, args) -> dict:
+    """
+    Runs writers and readers for a fixed time against a fresh database configured with the profile.
+    """
+    from database.connection import configure_database, db
+    from database.common.models import History
+    from database.utils.manage import ManageInterface
+    from tg_API.core import Bot
+
+    pragmas = configure_database(profile, path=os.path.join(tempfile.mkdtemp(), f'{profile}.db'),
+                                 max_connections=args.writers + args.readers + 1)
+    db.create_tables([History])
+    seed(History, db, args.seed, args.users)
+    db.close()
+
+    counts = {"inserts": 0, "reads": 0}
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def writer():
+        done = 0
+        while not stop.is_set():
+            ManageInterface.store(db, History, [{"user_id": random.randrange(args.users), "kind": "TOP",
+                                                 "type": "movie", "limit": 5, "title_ids": "1,2,3,4,5",
+                                                 "created_at": datetime.now()}])
+            done += 1
+        db.close()
+        with lock:
+            counts["inserts"] += done
+
+    def reader():
+        done = 0
+        while not stop.is_set():
+            Bot.get_user_history(random.randrange(args.users))
+            done += 1
+        db.close()
+        with lock:
+            counts["reads"] += done
+
+    threads = ([threading.Thread(target=writer) for _ in range(args.writers)] +
+               [threading.Thread(target=reader) for _ in range(args.readers)])
+    for thread in threads:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    db.close_all()
+    return {"profile": profile, "pragmas": pragmas,
+            "inserts": counts["inserts"] / args.seconds, "reads": counts["reads"] / args.seconds}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=5.0, help='duration of each profile run')
+    parser.add_argument('--writers', type=int, default=4, help='threads logging actions')
+    parser.add_argument('--readers', type=int, default=4, help='threads reading user histories')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=20000, help='history rows written before measuring')
+    parser.add_argument('--profiles', nargs='+', default=None, help='profiles to run, all by default')
+    args = parser.parse_args()
+
+    os.environ.setdefault('DATABASE_PATH', os.path.join(tempfile.mkdtemp(), 'bench.db'))
+    from database.connection import PRAGMA_PROFILES
+
+    for profile in args.profiles or list(PRAGMA_PROFILES):
+        result = run_profile(profile, args)
+        print(f"{profile:>8}: {result['inserts']:9.1f} inserts/s, {result['reads']:9.1f} reads/s")
+
+
+if __name__ == '__main__':
+    main()
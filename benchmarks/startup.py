@@ -0,0 +1,102 @@
+# benchmarks\startup.py
+"""
+Measures the startup time of the bot in fresh interpreters: the bare interpreter, importing main and tg_API.core,
+and the time from launching the process to the first handled update (schema setup, bot construction and handler
+registration included). Nothing touches Telegram or the site API. With --breakdown, the slowest imports of main are
+listed from python -X importtime.
+
+Usage: python -m benchmarks.startup [--repeat 5] [--breakdown]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FIRST_UPDATE = r'''
+import json
+import sys
+import time
+
+from database.core import init_database
+from telebot.types import Update
+from tg_API.core import Bot
+
+imported = time.time()
+init_database()
+bot = Bot('0:offline', site=None, threaded=False)
+bot.bot.send_message = bot.bot.delete_message = lambda *args, **kwargs: None
+bot.setup_handlers()
+bot.add_filters()
+ready = time.time()
+user = {"id": 1, "is_bot": False, "first_name": "u"}
+bot.bot.process_new_updates([Update.de_json({
+    "update_id": 1,
+    "message": {"message_id": 1, "date": 1, "chat": {"id": 1, "type": "private"}, "from": user, "text": "/start",
+                "entities": [{"type": "bot_command", "offset": 0, "length": 6}]}})])
+print(json.dumps({"imported": imported, "ready": ready, "handled": time.time()}))
+'''
+
+
+def launch(code: str, env: dict) -> tuple:
+    """
+    Runs code in a new interpreter and returns (launch time, seconds until it exited, its standard output).
+    """
+    start = time.time()
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, env=env, capture_output=True, text=True,
+                            check=True)
+    return start, time.time() - start, result.stdout
+
+
+def breakdown(env: dict, top: int = 12):
+    """
+    Prints the imports of main with the largest cumulative time.
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import main'], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative_us, name = line.split('|')
+        if name.startswith('   ') and name[3] != ' ':  # direct imports of main are indented by one level
+            rows.append((int(cumulative_us), name.strip()))
+    print("\nslowest imports of main (cumulative):")
+    for cumulative_us, name in sorted(rows, reverse=True)[:top]:
+        print(f"  {name:<40} {cumulative_us / 1000:8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--breakdown', action='store_true', help='list the slowest imports of main')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    env = dict(os.environ, DATABASE_PATH=os.path.join(workdir, 'startup.db'))
+    timings = {"interpreter": [], "import main": [], "import tg_API.core": [],
+               "ready": [], "first update": []}
+    for _ in range(args.repeat):
+        timings["interpreter"].append(launch('pass', env)[1])
+        timings["import main"].append(launch('import main', env)[1])
+        timings["import tg_API.core"].append(launch('import tg_API.core', env)[1])
+        start, _, output = launch(FIRST_UPDATE, env)
+        phases = json.loads(output)
+        timings["ready"].append(phases["ready"] - start)
+        timings["first update"].append(phases["handled"] - start)
+        os.remove(env['DATABASE_PATH'])  # every run sets up the schema of a new database
+
+    for name, values in timings.items():
+        print(f"{name:<22} {min(values) * 1000:8.1f} ms (median {statistics.median(values) * 1000:.1f})")
+    if args.breakdown:
+        breakdown(env)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,271 @@
+# benchmarks\suite.py
+"""
+Offline microbenchmarks of the bot's hot paths: site API response parsing and caption building, history storage and
+retrieval at realistic table sizes, history trimming, history display, keyboard generation and the overhead of the
+metrics instrumentation. Results are written as JSON and can be compared against a saved baseline; the run fails
+when a benchmark is slower than the baseline by more than the threshold.
+
+Usage: python -m benchmarks.suite [--quick] [--only NAME ...] [--output benchmarks/results/latest.json]
+                                  [--baseline benchmarks/results/baseline.json] [--save-baseline] [--threshold 0.25]
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+
+BENCHMARKS = []
+
+
+def benchmark(name: str, number: int = 1000):
+    """
+    Registers a benchmark. The decorated function receives the suite context and returns the callable to time,
+    optionally with a setup callable run untimed before every repetition.
+
+    :param name: Name of the benchmark in the results.
+    :param number: Calls of the timed callable per repetition.
+    """
+    def register(factory):
+        BENCHMARKS.append((name, number, factory))
+        return factory
+    return register
+
+
+def measure(fn: Callable, setup: Optional[Callable], number: int, repeat: int) -> Dict:
+    """
+    Times `number` calls of fn, `repeat` times. The garbage collector is paused while timing, as timeit does.
+
+    :return: A dictionary with the median, minimum and maximum time per call in microseconds.
+    """
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            for _ in range(number):
+                fn()
+            timings.append((time.perf_counter() - start) / number * 1e6)
+        finally:
+            gc.enable()
+    return {"median_us": round(statistics.median(timings), 3),
+            "min_us": round(min(timings), 3),
+            "max_us": round(max(timings), 3),
+            "number": number,
+            "repeat": repeat}
+
+
+class Context:
+    """
+    Shared fixtures: a throwaway database with a populated history table and a bot instance.
+    """
+    def __init__(self, rows: int, users: int):
+        self.rows = rows
+        self.users = users
+        os.environ['DATABASE_PATH'] = os.path.join(tempfile.mkdtemp(), 'suite.db')
+        from database.core import db, init_database
+        from database.common.models import History, Title
+        from tg_API.core import Bot
+
+        init_database()
+
+        self.db = db
+        self.History = History
+        self.Title = Title
+        self.Bot = Bot
+        self.bot = Bot('0:offline', site=None)
+        self.populate()
+        db.execute_sql('CREATE TABLE history_copy AS SELECT * FROM history')
+
+    def populate(self):
+        start = datetime(2024, 1, 1)
+        with self.db.atomic():
+            self.Title.insert_many([{"nfid": n, "type": "movie", "title": f"Title {n}"} for n in range(1, 6)]).execute()
+            for i in range(0, self.rows, 5000):
+                self.History.insert_many(
+                    [{"user_id": n % self.users, "kind": "TOP", "type": "movie", "limit": 5, "title_ids": "1,2,3,4,5",
+                      "created_at": start + timedelta(seconds=n)}
+                     for n in range(i, min(i + 5000, self.rows))]).execute()
+
+    def restore_history(self):
+        """
+        Puts the history table back in its populated state.
+        """
+        with self.db.atomic():
+            self.db.execute_sql('DELETE FROM history')
+            self.db.execute_sql('INSERT INTO history SELECT * FROM history_copy')
+
+
+def api_payload(count: int) -> bytes:
+    """
+    Builds a site API response body with the fields the API returns for each title.
+    """
+    results = [{"id": i, "title": f"Title &#39;{i}&#39;", "img": f"https://example.com/{i}.jpg", "vtype": "movie",
+                "nfid": 80000000 + i, "synopsis": "A long synopsis &amp; more, " * 8, "year": 2020,
+                "runtime": 5400, "imdbid": f"tt{i:07d}", "poster": f"https://example.com/{i}.jpg",
+                "imdbrating": 7.5, "top250": 0, "top250tv": 0, "clist": "\"US\":\"United States\"",
+                "titledate": "2020-01-01"} for i in range(count)]
+    return json.dumps({"Object": {"total": count, "limit": count}, "results": results}).encode()
+
+
+@benchmark('site_api.parse_response[100]', number=200)
+def bench_parse(ctx: Context):
+    from site_API.common.models import parse_response
+    body = api_payload(100)
+    return lambda: parse_response(body)
+
+
+@benchmark('delivery.render_results[10]', number=2000)
+def bench_render(ctx: Context):
+    from site_API.common.models import parse_response
+    from tg_API.utils.delivery import render_results
+    results = parse_response(api_payload(10))["results"]
+    return lambda: render_results("TOP 10 MOVIES", results)
+
+
+@benchmark('delivery.build_caption', number=20000)
+def bench_caption(ctx: Context):
+    from site_API.common.models import parse_response
+    from tg_API.utils.delivery import build_caption
+    title = parse_response(api_payload(1))["results"][0]
+    return lambda: build_caption(1, title)
+
+
+@benchmark('manage.store_history', number=500)
+def bench_store(ctx: Context):
+    from database.utils.manage import ManageInterface
+    from site_API.common.models import TitleRecord
+    titles = [TitleRecord(n, f"Title {n}", "", 7.5, "") for n in (1, 2)]
+    record = {"user_id": 1, "kind": "TOP", "type": "movie", "limit": 2, "title_ids": "1,2", "created_at": datetime.now(),
+              "titles": titles}
+    return lambda: ManageInterface.store_history(ctx.db, [record])
+
+
+@benchmark('manage.retrieve[last 5]', number=2000)
+def bench_retrieve(ctx: Context):
+    from database.utils.manage import ManageInterface
+    History = ctx.History
+    users = iter(range(10 ** 9))
+    return lambda: ManageInterface.retrieve(History, History.user_id == next(users) % ctx.users,
+                                            order_by=[History.created_at.desc()], limit=5)
+
+
+@benchmark('bot.trim_user_history', number=1)
+def bench_trim(ctx: Context):
+    return ctx.Bot.trim_user_history, ctx.restore_history
+
+
+@benchmark('bot.format_history_for_display[cached]', number=20000)
+def bench_format_cached(ctx: Context):
+    ctx.bot.format_history_for_display(1)  # loads the user into the history ring
+    return lambda: ctx.bot.format_history_for_display(1)
+
+
+@benchmark('bot.load_history_entries', number=2000)
+def bench_format_cold(ctx: Context):
+    users = iter(range(10 ** 9))
+    return lambda: ctx.Bot.load_history_entries(next(users) % ctx.users)
+
+
+@benchmark('keyboard.gen_inline_menu', number=20000)
+def bench_menu(ctx: Context):
+    return ctx.Bot.gen_inline_menu
+
+
+@benchmark('keyboard.gen_rating_choice', number=5000)
+def bench_rating(ctx: Context):
+    return ctx.Bot.gen_rating_choice
+
+
+@benchmark('keyboard.gen_numeric_choice[1-10]', number=5000)
+def bench_numeric(ctx: Context):
+    return lambda: ctx.Bot.gen_numeric_choice(1, 10, 'cb_low')
+
+
+@benchmark('metrics.instrument[overhead]', number=20000)
+def bench_metrics(ctx: Context):
+    import metrics
+    return metrics.instrument(lambda: None, 'benchmark', 'noop')
+
+
+def compare(results: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """
+    Prints the change of every benchmark's fastest repetition against the baseline.
+
+    :return: The names of the benchmarks slower than the baseline by more than the threshold.
+    """
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get("results", {}).get(name)
+        if before is None:
+            print(f"{name:<40} {'new':>10}")
+            continue
+        ratio = result["min_us"] / before["min_us"]  # the minimum is the least disturbed by other load
+        flag = ''
+        if ratio > 1 + threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        elif ratio < 1 - threshold:
+            flag = '  faster'
+        print(f"{name:<40} {before['min_us']:>12.2f} -> {result['min_us']:>12.2f} us  {ratio:6.2f}x{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--quick', action='store_true', help='smaller tables and fewer repetitions')
+    parser.add_argument('--only', nargs='+', help='run the benchmarks whose name starts with one of these')
+    parser.add_argument('--output', default=os.path.join(RESULTS_DIR, 'latest.json'))
+    parser.add_argument('--baseline', default=os.path.join(RESULTS_DIR, 'baseline.json'))
+    parser.add_argument('--save-baseline', action='store_true', help='store this run as the new baseline')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed slowdown, 0.25 = 25%%')
+    args = parser.parse_args()
+
+    rows, users, repeat = (20_000, 2_000, 5) if args.quick else (200_000, 20_000, 9)
+    ctx = Context(rows, users)
+    results = {}
+    for name, number, factory in BENCHMARKS:
+        if args.only and not name.startswith(tuple(args.only)):
+            continue
+        target = factory(ctx)
+        fn, setup = target if isinstance(target, tuple) else (target, None)
+        results[name] = measure(fn, setup, number, repeat)
+        print(f"{name:<40} {results[name]['min_us']:>12.2f} us (median {results[name]['median_us']:.2f})")
+
+    report = {"meta": {"date": datetime.now().isoformat(timespec='seconds'),
+                       "python": platform.python_version(),
+                       "platform": platform.platform(),
+                       "rows": rows, "users": users},
+              "results": results}
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"baseline saved to {args.baseline}")
+        return
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"\ncompared with the baseline of {baseline['meta']['date']}:")
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+# benchmarks\supervisor.py
+"""
+Measures how update throughput scales with the number of worker processes in multiprocess mode. Updates from many
+users are dispatched by the supervisor to workers whose handlers burn a fixed amount of CPU, so the single process
+run shows the GIL-bound ceiling. Each run also checks that every user's updates were handled in order, and one run
+kills a worker midway to show the restart.
+
+Usage: python -m benchmarks.supervisor [--updates 2000] [--users 500] [--work 0.002] [--processes 1 2 4]
+"""
+
+import argparse
+import os
+import time
+
+from tg_API.supervisor import Supervisor, WorkerChannel
+
+
+class CpuBoundBot:
+    """
+    Stand-in for TeleBot whose handlers spin for a fixed time and check that each user's updates arrive in order.
+    """
+    def __init__(self, work: float):
+        self.work = work
+        self.last_seen = {}
+        self.out_of_order = 0
+
+    def process_new_updates(self, updates):
+        for update in updates:
+            user_id = update.callback_query.from_user.id
+            if update.update_id < self.last_seen.get(user_id, -1):
+                self.out_of_order += 1
+            self.last_seen[user_id] = update.update_id
+            deadline = time.perf_counter() + self.work
+            while time.perf_counter() < deadline:
+                pass
+
+
+def run_worker(work: float, channel: WorkerChannel):
+    """
+    Worker process entry point.
+    """
+    bot = CpuBoundBot(work)
+    channel.serve(bot)
+    if bot.out_of_order:
+        print(f"worker {channel.index}: {bot.out_of_order} updates out of order")
+
+
+def make_update(update_id: int, user_id: int) -> dict:
+    """
+    Builds a raw callback query update.
+    """
+    user = {"id": user_id, "is_bot": False, "first_name": "u"}
+    return {"update_id": update_id,
+            "callback_query": {"id": str(update_id), "from": user, "chat_instance": "x", "data": "cb_high",
+                               "message": {"message_id": 1, "date": 1, "chat": {"id": user_id, "type": "private"},
+                                           "text": "menu"}}}
+
+
+def bench(processes: int, args, crash: bool = False) -> float:
+    """
+    Dispatches every update and waits until all of them were handled; returns updates per second.
+    """
+    supervisor = Supervisor("unused", run_worker, args=(args.work,), processes=processes,
+                            queue_size=args.updates, report_interval=3600)
+    started = time.time()
+    supervisor.start()
+    while any(channel.heartbeat.value <= started for channel in supervisor.channels):
+        time.sleep(0.01)  # wait for the spawned interpreters to reach serve()
+    start = time.perf_counter()
+    for update_id in range(args.updates):
+        supervisor.dispatch(make_update(update_id, update_id % args.users))
+        if crash and update_id == args.updates // 2:
+            os.kill(supervisor.workers[0].pid, 9)
+    expected = args.updates - 1 if crash else args.updates  # the update being handled by the killed worker is lost
+    while sum(channel.handled.value for channel in supervisor.channels) < expected:
+        time.sleep(0.01)  # the monitor thread restarts the killed worker
+    elapsed = time.perf_counter() - start
+    stats = supervisor.stats()
+    supervisor.stop()
+    if crash:
+        print(f"  restarts: {[worker['restarts'] for worker in stats['workers']]}")
+    return args.updates / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--updates', type=int, default=2000)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--work', type=float, default=0.002, help='seconds of CPU work per update')
+    parser.add_argument('--processes', type=int, nargs='+', default=[1, 2, 4])
+    args = parser.parse_args()
+
+    for processes in args.processes:
+        print(f"{processes} worker process(es): {bench(processes, args):8.1f} updates/s")
+    print("2 worker processes, worker 0 killed midway:")
+    print(f"  {bench(2, args, crash=True):8.1f} updates/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+# benchmarks\webhook.py
+"""
+Measures update throughput and latency of the webhook server against a long-polling loop. A local fake Telegram
+sender pushes updates, and handlers are replaced by a fixed amount of simulated work, so no network access is needed.
+
+Usage: python -m benchmarks.webhook [--updates 2000] [--senders 16] [--workers 8] [--work 0.005] [--rtt 0.05]
+"""
+
+import argparse
+import json
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from tg_API.webhook import WebhookServer
+
+
+class FakeBot:
+    """
+    Stand-in for TeleBot whose handlers take a fixed time and record when each update was handled.
+    """
+    def __init__(self, work: float, total: int):
+        self.work = work
+        self.total = total
+        self.latencies = []
+        self._lock = threading.Lock()
+        self.done = threading.Event()
+
+    def process_new_updates(self, updates):
+        for update in updates:
+            time.sleep(self.work)
+            with self._lock:
+                self.latencies.append(time.perf_counter() - update.sent_at)
+                if len(self.latencies) == self.total:
+                    self.done.set()
+
+
+def make_update(update_id: int) -> dict:
+    """
+    Builds a callback query update like the ones produced by the bot's inline keyboards.
+    """
+    user = {"id": update_id % 500, "is_bot": False, "first_name": "u"}
+    return {"update_id": update_id,
+            "callback_query": {"id": str(update_id), "from": user, "chat_instance": "x", "data": "cb_high",
+                               "message": {"message_id": 1, "date": 1, "chat": {"id": user["id"], "type": "private"},
+                                           "text": "menu"}}}
+
+
+def bench_webhook(args) -> tuple:
+    """
+    Sends every update to the webhook server over HTTP from several sender threads.
+    """
+    bot = FakeBot(args.work, args.updates)
+    server = WebhookServer(bot, listen="127.0.0.1", port=0, secret_token="secret",
+                           workers=args.workers, queue_size=args.updates)
+    # the fake bot reads the send time from the update, so it is attached when the update is decoded
+    submit = server.submit
+
+    def submit_with_time(update):
+        update.sent_at = sent_at[update.update_id]
+        return submit(update)
+
+    server.submit = submit_with_time
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = "http://%s:%s/webhook" % server.address
+    sent_at = {}
+
+    def send(update_id):
+        body = json.dumps(make_update(update_id)).encode()
+        request = urllib.request.Request(url, data=body, method="POST",
+                                         headers={"Content-Type": "application/json",
+                                                  WebhookServer.SECRET_HEADER: "secret"})
+        sent_at[update_id] = time.perf_counter()
+        urllib.request.urlopen(request).read()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.senders) as senders:
+        list(senders.map(send, range(args.updates)))
+    bot.done.wait()
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+    return elapsed, bot.latencies
+
+
+def bench_polling(args) -> tuple:
+    """
+    Simulates infinity_polling: one loop fetches batches of up to 100 pending updates, paying a round trip per
+    getUpdates call, and hands them to a worker pool of the same size as the webhook's.
+    """
+    from telebot.types import Update
+
+    bot = FakeBot(args.work, args.updates)
+    pending = []
+    lock = threading.Lock()
+    pool = ThreadPoolExecutor(args.workers)
+
+    def produce():
+        for update_id in range(args.updates):
+            update = Update.de_json(make_update(update_id))
+            update.sent_at = time.perf_counter()
+            with lock:
+                pending.append(update)
+            time.sleep(0)
+
+    start = time.perf_counter()
+    threading.Thread(target=produce, daemon=True).start()
+    received = 0
+    while received < args.updates:
+        time.sleep(args.rtt)  # getUpdates round trip
+        with lock:
+            batch, pending[:] = pending[:100], pending[100:]
+        received += len(batch)
+        for update in batch:
+            pool.submit(bot.process_new_updates, [update])
+    bot.done.wait()
+    elapsed = time.perf_counter() - start
+    pool.shutdown()
+    return elapsed, bot.latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--updates', type=int, default=2000)
+    parser.add_argument('--senders', type=int, default=16, help='concurrent fake Telegram connections')
+    parser.add_argument('--workers', type=int, default=8, help='threads handling updates')
+    parser.add_argument('--work', type=float, default=0.005, help='seconds of simulated handler work')
+    parser.add_argument('--rtt', type=float, default=0.05, help='simulated getUpdates round trip in seconds')
+    args = parser.parse_args()
+
+    for name, bench in (("polling", bench_polling), ("webhook", bench_webhook)):
+        elapsed, latencies = bench(args)
+        latencies.sort()
+        print(f"{name:>8}: {args.updates / elapsed:8.1f} updates/s, "
+              f"latency p50 {latencies[len(latencies) // 2] * 1000:6.1f} ms, "
+              f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:6.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
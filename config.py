@@ -1,14 +1,11 @@
 # # config.py
 
-from pydantic import SecretStr, StrictStr
+from typing import List, Optional
+
+from pydantic import SecretStr, StrictStr, ValidationError
 from pydantic_settings import BaseSettings
 from dotenv import find_dotenv, load_dotenv
 
-if not find_dotenv():  # searches for .env
-    exit("Переменные окружения не загружены, так как отсутствует файл .env")
-else:
-    load_dotenv()  # reads it and defines the environmental variables atp
-
 
 class AppSettings(BaseSettings):
     """
@@ -18,6 +15,89 @@ class AppSettings(BaseSettings):
     site_api: SecretStr  # Automatically gets value from SITE_API env variable
     host_api: StrictStr  # Automatically gets value from HOST_API env variable
     bot_token: SecretStr  # Token for Telegram bot, secured as a secret
+    bot_mode: str = 'sync'  # 'sync' polls with the threaded bot, 'webhook' serves a webhook, 'async' the asyncio bot
+    bot_workers: int = 4  # Worker threads handling Telegram updates in parallel
+    # 'multiprocess' polls once and shards updates by user over worker processes
+    bot_processes: int = 2  # Worker processes in multiprocess mode, up to one per core
+    bot_process_queue: int = 1000  # Updates allowed to wait for each worker process
+    bot_heartbeat_timeout: float = 60.0  # Seconds without a heartbeat before a worker process is restarted
+
+    webhook_url: Optional[str] = None  # Public HTTPS URL of the webhook, required in webhook mode
+    webhook_listen: str = '0.0.0.0'  # Address the webhook server listens on
+    webhook_port: int = 8443  # Port the webhook server listens on
+    webhook_secret: Optional[SecretStr] = None  # Secret token Telegram must send with every update
+    webhook_workers: int = 8  # Threads handling webhook updates
+    webhook_queue: int = 100  # Updates allowed to wait for a free webhook worker
+
+    history_batch_size: int = 100  # History records stored by one insert
+    history_flush_interval: float = 1.0  # Maximum seconds a history record waits before being stored
+    history_queue_size: int = 10000  # History records allowed to wait for the background writer
+    history_cache_users: int = 10000  # Users whose latest history entries are kept in memory
+    history_retention_enabled: bool = True  # Delete old history records in a background job
+    history_retention_days: float = 30.0  # Age in days after which history records are deleted, 0 to keep them
+    history_keep_per_user: int = 20  # Latest history records kept per user, trimmed on write too; 0 keeps all
+    history_retention_interval: float = 3600.0  # Seconds between two runs of the retention job
+
+    state_storage: str = 'sqlite'  # Where conversation states are kept: 'memory' or 'sqlite' (survives restarts)
+    # Bot processes may share the sqlite states: every read checks the row for changes made by another process,
+    # except in multiprocess mode, whose workers each own their users
+    state_ttl: float = 86400.0  # Seconds after which an abandoned conversation is forgotten
+    state_flush_interval: float = 1.0  # Maximum seconds a conversation change waits before being persisted
+
+    sqlite_profile: str = 'fast'  # PRAGMA profile of the database: 'default', 'safe' or 'fast'
+    sqlite_max_connections: int = 5  # Pooled database connections
+    sqlite_journal_mode: Optional[str] = None  # The options below override single pragmas of the profile
+    sqlite_synchronous: Optional[str] = None
+    sqlite_cache_size: Optional[int] = None
+    sqlite_mmap_size: Optional[int] = None
+    sqlite_busy_timeout: Optional[int] = None
+    sqlite_temp_store: Optional[str] = None
+
+    telegram_rate: float = 30.0  # Messages per second the bot sends in total (Telegram allows about 30)
+    telegram_burst: float = 30.0  # Messages sent at once before the rate applies
+    telegram_chat_rate: float = 1.0  # Messages per second sent to one chat
+    telegram_chat_burst: float = 5.0  # Messages sent at once to one chat (a result page sends
+    # the media group and the menu; deleting the previous menu only counts towards telegram_rate)
+    telegram_reserved: float = 5.0  # Tokens of the global burst kept for replies to users
+    site_rate: float = 5.0  # Requests per second sent to the site API (the RapidAPI plan limit)
+    site_burst: float = 5.0  # Requests sent at once to the site API
+    site_reserved: float = 2.0  # Tokens of the site API burst kept for users' searches over prefetching
+
+    metrics_enabled: bool = True  # Serve the Prometheus text endpoint
+    metrics_listen: str = '127.0.0.1'  # Address of the metrics endpoint
+    metrics_port: int = 9108  # Port of the metrics endpoint; worker processes use the following ports
+    admin_ids: List[int] = []  # Telegram user IDs allowed to use the /metrics command, e.g. [12345]
+
+    log_file: str = 'app.log'  # Log file, written by a background thread
+    log_level: str = 'INFO'  # Minimum level logged; DEBUG adds one event per handler, API and database call
+    log_json: bool = False  # Write JSON lines with user_id, handler and latency_ms fields instead of text lines
+    log_max_bytes: int = 10485760  # Size after which the log file is rotated
+    log_rotate_when: Optional[str] = None  # Rotate by time instead of size, e.g. 'midnight'
+    log_backup_count: int = 5  # Rotated log files kept
+    log_queue_size: int = 10000  # Log records allowed to wait for the writer; further ones are dropped
+    log_debug_sample_rate: float = 0.1  # Fraction of the DEBUG events kept
+
+    http_pool_size: int = 10  # Keep-alive connections kept open to the site API host
+    http_connect_timeout: float = 3.05  # Seconds to establish a connection to the site API
+    http_read_timeout: float = 15.0  # Seconds to wait for the site API to answer
+    http_retries: int = 2  # Retries for failed site API requests
+    http_backoff: float = 0.5  # Backoff factor between retries
+
+    cache_size: int = 256  # Site API responses kept in memory
+    cache_ttl: float = 3600.0  # Seconds a cached response stays valid
+    cache_disk: bool = False  # Also keep cached responses in the database so they survive restarts
+    poster_cache_enabled: bool = True  # Send posters already uploaded to Telegram by file_id instead of by URL
+    poster_cache_size: int = 5000  # Poster file_ids kept in memory
+    poster_cache_rows: int = 100000  # Poster file_ids kept in the database, least recently used are deleted
+
+    catalog_enabled: bool = True  # Answer searches from the local title catalog when it covers them
+    catalog_max_age: float = 86400.0  # Seconds after which catalog data is refreshed from the site API
+
+    prefetch_enabled: bool = True  # Keep popular searches warm in the response cache
+    prefetch_budget: int = 30  # Maximum prefetch requests sent to the site API per minute
+    prefetch_interval: float = 60.0  # Seconds between two prefetch rounds
+    prefetch_margin: float = 300.0  # Refresh cached searches expiring within this many seconds
+    prefetch_custom: int = 10  # Most requested custom rating ranges kept warm
 
     class Config:
         """
@@ -26,3 +106,22 @@ class AppSettings(BaseSettings):
         env_file = '.env'  # Specifies that environment variables should be loaded from .env
         env_file_encoding = 'utf-8'
         extra = "ignore"  # This tells Pydantic to ignore any extra fields in the .env file
+
+
+def load_settings() -> AppSettings:
+    """
+    Loads the .env file, if there is one, into the environment (DATABASE_PATH is read from it outside the settings)
+    and validates the settings. Nothing happens when this module is imported, so tools can import the application
+    without a .env file.
+
+    :return: The application settings.
+    """
+    dotenv_path = find_dotenv()  # searches for .env
+    if dotenv_path:
+        load_dotenv(dotenv_path)  # reads it and defines the environmental variables
+    try:
+        return AppSettings()
+    except ValidationError as e:
+        if not dotenv_path:
+            exit("Переменные окружения не загружены, так как отсутствует файл .env")
+        exit(f"Invalid settings in {dotenv_path}: {e}")
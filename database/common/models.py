@@ -28,16 +28,29 @@ class ModelBase(pw.Model):
 
 class History(ModelBase):
     """
-    Model to store user history including actions and responses.
+    Model to store user history in a compact form: the search the user made and references to the titles that were
+    sent. Display text is rendered when the history is shown, from these fields and the title table.
 
     Attributes:
         user_id (IntegerField): Identifier of the user, corresponds to the Telegram user ID.
-        action (TextField): Text describing the action performed by the user.
-        response (TextField): Text describing the bot's response to the user's action.
+        kind (CharField): The kind of search ('TOP', 'MID' or 'CUSTOM').
+        type (CharField): The type of content searched ('movie' or 'series').
+        limit (IntegerField): The number of results requested.
+        start_rating (IntegerField): The lowest rating of a custom search.
+        end_rating (IntegerField): The highest rating of a custom search.
+        title_ids (TextField): Comma-separated nfids of the titles sent, referencing the title table.
+        action (TextField): Text of the action, only set on records stored before history was normalized.
+        response (TextField): Text of the response, only set on records stored before history was normalized.
     """
     user_id = pw.IntegerField()
-    action = pw.TextField()
-    response = pw.TextField()
+    kind = pw.CharField(null=True)
+    type = pw.CharField(null=True)
+    limit = pw.IntegerField(null=True)
+    start_rating = pw.IntegerField(null=True)
+    end_rating = pw.IntegerField(null=True)
+    title_ids = pw.TextField(default='')
+    action = pw.TextField(null=True)
+    response = pw.TextField(null=True)
 
     class Meta:
         """
@@ -45,5 +58,155 @@ class History(ModelBase):
 
         Attributes:
             table_name (str): Specifies the name of the table used to store history records.
+            indexes (tuple): Composite indexes serving the per-user "latest records" queries and the counting of
+                             popular searches, which is answered from the second index alone.
         """
         table_name = 'history'
+        indexes = ((('user_id', 'created_at'), False),
+                   (('kind', 'type', 'start_rating', 'end_rating'), False))
+
+
+class Title(ModelBase):
+    """
+    Model storing movies and series returned by the site API, so searches can be answered locally.
+
+    Attributes:
+        nfid (IntegerField): Netflix identifier of the title, unique.
+        type (CharField): The type of content ('movie' or 'series').
+        title (TextField): The name of the title.
+        synopsis (TextField): Short description of the title.
+        imdbrating (FloatField): IMDb rating of the title, if known.
+        img (TextField): URL of the poster image.
+        updated_at (DateTimeField): Timestamp of the last time the title was received from the API.
+    """
+    nfid = pw.IntegerField(unique=True)
+    type = pw.CharField()
+    title = pw.TextField()
+    synopsis = pw.TextField(default='')
+    imdbrating = pw.FloatField(null=True)
+    img = pw.TextField(default='')
+    updated_at = pw.DateTimeField(default=datetime.now)
+
+    class Meta:
+        """
+        Meta class specifying additional configurations for the title table.
+
+        Attributes:
+            table_name (str): Specifies the name of the table used to store titles.
+            indexes (tuple): Composite index serving rating range queries per content type.
+        """
+        table_name = 'title'
+        indexes = ((('type', 'imdbrating'), False),)
+
+
+class CatalogSync(pw.Model):
+    """
+    Model recording how much of each search has been copied from the site API into the title table.
+
+    Attributes:
+        key (CharField): Normalized search (type and rating range) the record belongs to.
+        depth (IntegerField): Number of leading results of the search that are stored locally.
+        complete (BooleanField): True if the API returned every result of the search.
+        fetched_at (DateTimeField): Timestamp of the last synchronization with the API.
+    """
+    key = pw.CharField(primary_key=True)
+    depth = pw.IntegerField(default=0)
+    complete = pw.BooleanField(default=False)
+    fetched_at = pw.DateTimeField(default=datetime.now)
+
+    class Meta:
+        """
+        Meta class specifying additional configurations for the catalog synchronization table.
+
+        Attributes:
+            database (SqliteDatabase): The database instance that this model will use for all database operations.
+            table_name (str): Specifies the name of the table used to store synchronization records.
+        """
+        database = db
+        table_name = 'catalog_sync'
+
+
+class CachedResponse(pw.Model):
+    """
+    Model backing the on-disk tier of the site API response cache, so cached searches survive restarts.
+
+    Attributes:
+        key (CharField): Normalized query parameters the response belongs to (without the limit).
+        limit (IntegerField): The limit the response was fetched with.
+        payload (TextField): The JSON encoded title records of the API response.
+        expires_at (DateTimeField): Time after which the entry is no longer served.
+    """
+    key = pw.CharField(primary_key=True)
+    limit = pw.IntegerField()
+    payload = pw.TextField()
+    expires_at = pw.DateTimeField(index=True)
+
+    class Meta:
+        """
+        Meta class specifying additional configurations for the response cache table.
+
+        Attributes:
+            database (SqliteDatabase): The database instance that this model will use for all database operations.
+            table_name (str): Specifies the name of the table used to store cached responses.
+        """
+        database = db
+        table_name = 'response_cache'
+
+
+class ConversationState(pw.Model):
+    """
+    Model persisting the users' conversation states, so in-progress searches survive restarts and can be picked up
+    by another bot process.
+
+    Attributes:
+        chat_id (BigIntegerField): Identifier of the Telegram chat.
+        user_id (BigIntegerField): Identifier of the Telegram user.
+        state (CharField): Name of the current state, e.g. 'MyStates:custom_low_set'; null if only data is set.
+        data (TextField): The JSON encoded data collected during the conversation.
+        updated_at (FloatField): UNIX timestamp of the last change, used to expire abandoned conversations and to
+                                 keep an older write from replacing a newer one.
+    """
+    chat_id = pw.BigIntegerField()
+    user_id = pw.BigIntegerField()
+    state = pw.CharField(null=True)
+    data = pw.TextField(default='{}')
+    updated_at = pw.FloatField(index=True)
+
+    class Meta:
+        """
+        Meta class specifying additional configurations for the conversation state table.
+
+        Attributes:
+            database (SqliteDatabase): The database instance that this model will use for all database operations.
+            table_name (str): Specifies the name of the table used to store conversation states.
+            primary_key (CompositeKey): A conversation is identified by its chat and user.
+        """
+        database = db
+        table_name = 'conversation_state'
+        primary_key = pw.CompositeKey('chat_id', 'user_id')
+
+
+class PosterFile(pw.Model):
+    """
+    Model mapping poster URLs to the file_id Telegram assigned to the image after its first upload, so later sends
+    reuse the stored file instead of having Telegram download the URL again.
+
+    Attributes:
+        url (TextField): URL of the poster image.
+        file_id (TextField): Telegram file identifier of the largest size of the uploaded photo.
+        used_at (DateTimeField): Last time the entry was loaded or stored, used to evict the least recently used rows.
+    """
+    url = pw.TextField(primary_key=True)
+    file_id = pw.TextField()
+    used_at = pw.DateTimeField(default=datetime.now, index=True)
+
+    class Meta:
+        """
+        Meta class specifying additional configurations for the poster file table.
+
+        Attributes:
+            database (SqliteDatabase): The database instance that this model will use for all database operations.
+            table_name (str): Specifies the name of the table used to store poster file identifiers.
+        """
+        database = db
+        table_name = 'poster_file'
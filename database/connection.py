@@ -2,13 +2,60 @@
 
 import os
 import sys
+from typing import Optional
 from log_config import logger
 from playhouse.pool import PooledSqliteDatabase
 
 
 # Load database path from an environment variable
 database_path = os.getenv('DATABASE_PATH', 'default.db')
-db = PooledSqliteDatabase(database_path, max_connections=5)
+# Pooled connections are handed from thread to thread, one at a time, so sqlite3's same-thread check is disabled
+db = PooledSqliteDatabase(database_path, max_connections=5, check_same_thread=False)
+
+# Named PRAGMA sets applied to every pooled connection, see configure_database()
+PRAGMA_PROFILES = {
+    # SQLite defaults: rollback journal, full sync, small page cache, no mmap
+    'default': {},
+    # WAL lets readers run alongside the writer; full sync keeps every commit durable
+    'safe': {'journal_mode': 'wal',
+             'synchronous': 'full',
+             'busy_timeout': 5000},
+    # WAL with normal sync (a power loss can drop the last commits, never corrupt), 64 MB page cache,
+    # 256 MB memory map and in-memory temporary tables
+    'fast': {'journal_mode': 'wal',
+             'synchronous': 'normal',
+             'cache_size': -64000,
+             'mmap_size': 268435456,
+             'busy_timeout': 5000,
+             'temp_store': 'memory'},
+}
+
+
+def configure_database(profile: str = 'default', path: Optional[str] = None, max_connections: int = 5,
+                       **overrides):
+    """
+    Re-initializes the pooled database with a PRAGMA profile. Pragmas are applied by peewee to every new pooled
+    connection, so open connections are closed first.
+
+    :param profile: Name of a profile in PRAGMA_PROFILES.
+    :param path: Database file; defaults to the DATABASE_PATH environment variable, read now so a .env file loaded
+                 after this module was imported is honoured.
+    :param max_connections: Maximum number of pooled connections.
+    :param overrides: Individual pragmas (journal_mode, synchronous, cache_size, mmap_size, busy_timeout,
+                      temp_store) replacing the profile's values; None values are ignored.
+    :return: The pragmas in effect.
+    """
+    if profile not in PRAGMA_PROFILES:
+        raise ValueError(f"Unknown SQLite profile {profile!r}, expected one of {sorted(PRAGMA_PROFILES)}")
+    pragmas = dict(PRAGMA_PROFILES[profile])
+    pragmas.update({name: value for name, value in overrides.items() if value is not None})
+    if not db.is_closed():
+        db.close()
+    db.close_all()
+    db.init(path or os.getenv('DATABASE_PATH', database_path), max_connections=max_connections, pragmas=pragmas,
+            check_same_thread=False)
+    logger.info("Database %s configured with SQLite profile %r: %s", db.database, profile, pragmas)
+    return pragmas
 
 
 def connect_to_database():
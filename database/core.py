@@ -1,8 +1,36 @@
+import threading
+
 from database.utils.manage import ManageInterface
-from database.common.models import History
+from database.common.models import History, CachedResponse, Title, CatalogSync, ConversationState, PosterFile
 from database.connection import db, connect_to_database
+from database.utils.migrations import apply_migrations
+
+MODELS = [History, CachedResponse, Title, CatalogSync, ConversationState, PosterFile]
+
+_initialized = set()  # database files whose schema is up to date in this process
+_init_lock = threading.Lock()
+
+
+def init_database():
+    """
+    Brings the schema of the configured database up to date: applies the migrations and creates missing tables.
+    Runs once per database file and process; later calls return at once. Call it after configure_database() and
+    before the first query; connections are opened by the pool on first use.
+
+    :return: None
+    """
+    if db.database in _initialized:
+        return
+    with _init_lock:
+        if db.database in _initialized:
+            return
+        connect_to_database()
+        try:
+            apply_migrations(db)
+            db.create_tables(MODELS)
+        finally:
+            db.close()  # returns the connection to the pool
+        _initialized.add(db.database)
 
-connect_to_database()
-db.create_tables([History])
 
 db_manage = ManageInterface()
@@ -0,0 +1,285 @@
+# database-utils-analytics.py
+"""
+Streaming analytics and export of the history table. Aggregates are computed by SQLite (GROUP BY) and read back with
+peewee iterators; the export reads the table a chunk at a time by primary key. Neither materializes the table, so
+memory stays constant whatever the number of records. The database is only read: its schema is not migrated, and
+the command stops if the bot has not brought it up to date yet.
+
+Usage: python -m database.utils.analytics [--database default.db] [--profile default] [--since DATE] [--until DATE]
+                                          [--format table|csv|jsonl] [--output FILE]
+                                          {queries,users,hourly,export} [options]
+    queries [--limit 20]           the most requested searches, to tune the response cache
+    users [--limit 20]             the most active users
+    hourly [--timeline]            requests per hour of the day, or per hour over the whole period
+    export [--chunk 10000] [--titles]   every record, with the names of the titles sent if --titles is set
+"""
+
+import argparse
+import csv
+import os
+import sys
+import time
+from datetime import datetime
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional, Sequence, TextIO, Tuple
+
+from peewee import Case, Database, fn
+
+from database.common.models import History, Title
+from site_API.common.models import dumps
+
+QUERY_COLUMNS = ('kind', 'type', 'start_rating', 'end_rating', 'action', 'requests', 'users', 'max_limit', 'last_at')
+USER_COLUMNS = ('user_id', 'requests', 'custom', 'active_days', 'first_at', 'last_at')
+HOURLY_COLUMNS = ('hour', 'requests', 'users')
+EXPORT_FIELDS = (History.id, History.user_id, History.created_at, History.kind, History.type, History.limit,
+                 History.start_rating, History.end_rating, History.title_ids, History.action, History.response)
+EXPORT_COLUMNS = tuple(field.name for field in EXPORT_FIELDS)
+
+TITLE_LOOKUP_SIZE = 500  # nfids per title name query, below SQLite's bound parameter limit
+
+
+def _window(query, since: Optional[datetime], until: Optional[datetime]):
+    """
+    Restricts a history query to the records created in [since, until).
+
+    :param query: The history query.
+    :param since: Earliest creation time, or None.
+    :param until: Creation time the records must precede, or None.
+    :return: The restricted query.
+    """
+    if since is not None:
+        query = query.where(History.created_at >= since)
+    if until is not None:
+        query = query.where(History.created_at < until)
+    return query
+
+
+def top_queries(limit: int = 20, since: Optional[datetime] = None,
+                until: Optional[datetime] = None) -> Iterator[Tuple]:
+    """
+    Streams the most requested searches. Searches differing only by their limit are counted together, as they share
+    a response cache entry; the largest limit requested is reported. Records stored before history was normalized
+    and whose action could not be parsed are grouped by their action text.
+
+    :param limit: Number of searches returned.
+    :param since: Earliest creation time of the counted records, or None.
+    :param until: Creation time the counted records must precede, or None.
+    :return: An iterator of tuples ordered by number of requests, see QUERY_COLUMNS.
+    """
+    requests = fn.COUNT(History.id)
+    query = (History.select(History.kind, History.type, History.start_rating, History.end_rating, History.action,
+                            requests, fn.COUNT(fn.DISTINCT(History.user_id)), fn.MAX(History.limit),
+                            fn.MAX(History.created_at))
+             .group_by(History.kind, History.type, History.start_rating, History.end_rating, History.action)
+             .order_by(requests.desc())
+             .limit(limit))
+    return _window(query, since, until).tuples().iterator()
+
+
+def user_activity(limit: int = 20, since: Optional[datetime] = None,
+                  until: Optional[datetime] = None) -> Iterator[Tuple]:
+    """
+    Streams the most active users. The grouping follows the (user_id, created_at) index.
+
+    :param limit: Number of users returned.
+    :param since: Earliest creation time of the counted records, or None.
+    :param until: Creation time the counted records must precede, or None.
+    :return: An iterator of tuples ordered by number of requests, see USER_COLUMNS.
+    """
+    requests = fn.COUNT(History.id)
+    query = (History.select(History.user_id, requests, fn.SUM(Case(None, [(History.kind == 'CUSTOM', 1)], 0)),
+                            fn.COUNT(fn.DISTINCT(fn.date(History.created_at))),
+                            fn.MIN(History.created_at), fn.MAX(History.created_at))
+             .group_by(History.user_id)
+             .order_by(requests.desc())
+             .limit(limit))
+    return _window(query, since, until).tuples().iterator()
+
+
+def hourly_load(timeline: bool = False, since: Optional[datetime] = None,
+                until: Optional[datetime] = None) -> Iterator[Tuple]:
+    """
+    Streams the number of requests and of distinct users per hour.
+
+    :param timeline: If True, one row per hour of the period ('2024-05-01 13:00'), else one per hour of the day
+                     ('13') over the whole period.
+    :param since: Earliest creation time of the counted records, or None.
+    :param until: Creation time the counted records must precede, or None.
+    :return: An iterator of tuples ordered by hour, see HOURLY_COLUMNS.
+    """
+    hour = fn.strftime('%Y-%m-%d %H:00' if timeline else '%H', History.created_at)
+    query = (History.select(hour, fn.COUNT(History.id), fn.COUNT(fn.DISTINCT(History.user_id)))
+             .group_by(hour)
+             .order_by(hour))
+    return _window(query, since, until).tuples().iterator()
+
+
+def iter_history(chunk: int = 10000, since: Optional[datetime] = None,
+                 until: Optional[datetime] = None) -> Iterator[List[Tuple]]:
+    """
+    Reads the history records a chunk at a time, in primary key order. Every chunk is a separate query starting
+    after the last id read, so no read transaction stays open across the export and the bot keeps writing.
+
+    :param chunk: Maximum number of records per chunk.
+    :param since: Earliest creation time of the records, or None.
+    :param until: Creation time the records must precede, or None.
+    :return: An iterator of lists of tuples, see EXPORT_COLUMNS.
+    """
+    last_id = 0
+    while True:
+        query = (History.select(*EXPORT_FIELDS)
+                 .where(History.id > last_id)
+                 .order_by(History.id)
+                 .limit(chunk))
+        rows = list(_window(query, since, until).tuples())
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+
+def with_titles(rows: List[Tuple]) -> List[Tuple]:
+    """
+    Appends the names of the titles each record references, looked up for the whole chunk at once.
+
+    :param rows: A chunk from iter_history.
+    :return: The rows, each with the list of title names appended.
+    """
+    nfids = sorted({int(nfid) for row in rows for nfid in (row[8] or '').split(',') if nfid})
+    names = {}
+    for start in range(0, len(nfids), TITLE_LOOKUP_SIZE):
+        batch = nfids[start:start + TITLE_LOOKUP_SIZE]
+        names.update(Title.select(Title.nfid, Title.title).where(Title.nfid.in_(batch)).tuples())
+    return [row + ([names.get(int(nfid), '') for nfid in (row[8] or '').split(',') if nfid],) for row in rows]
+
+
+def _plain(value):
+    """
+    Converts a value to a type CSV and JSON writers accept.
+    """
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+    return value
+
+
+def write_rows(columns: Sequence[str], chunks: Iterable[List[Tuple]], output: TextIO, output_format: str) -> int:
+    """
+    Writes rows to output chunk by chunk.
+
+    :param columns: Names of the columns.
+    :param chunks: Iterable of lists of rows.
+    :param output: The text stream written to.
+    :param output_format: 'table' (aligned columns), 'csv' (with a header row) or 'jsonl' (one object per row).
+    :return: The number of rows written.
+    """
+    written = 0
+    if output_format == 'csv':
+        writer = csv.writer(output)
+        writer.writerow(columns)
+        for rows in chunks:
+            writer.writerows([' | '.join(value) if isinstance(value, list) else _plain(value) for value in row]
+                             for row in rows)
+            written += len(rows)
+    elif output_format == 'jsonl':
+        for rows in chunks:
+            output.write(''.join(dumps({column: _plain(value) for column, value in zip(columns, row)}) + '\n'
+                                 for row in rows))
+            written += len(rows)
+    else:
+        widths = [max(len(column), 10) for column in columns]
+        output.write('  '.join(column.rjust(width) for column, width in zip(columns, widths)) + '\n')
+        for rows in chunks:
+            output.write(''.join('  '.join(str(_plain(value)).rjust(width) for value, width in zip(row, widths))
+                                 + '\n' for row in rows))
+            written += len(rows)
+    return written
+
+
+def check_schema(database: Database) -> List[str]:
+    """
+    Compares the history and title tables with their models, without changing them.
+
+    :param database: The database connection to use.
+    :return: A description of every missing table or column; empty if the schema is current.
+    """
+    problems = []
+    for model in (History, Title):
+        table = model._meta.table_name
+        if not database.table_exists(table):
+            problems.append(f"table {table} is missing")
+            continue
+        columns = {column.name for column in database.get_columns(table)}
+        missing = [field.column_name for field in model._meta.sorted_fields if field.column_name not in columns]
+        if missing:
+            problems.append(f"table {table} lacks the columns {', '.join(missing)}")
+    return problems
+
+
+def chunked(rows: Iterator[Tuple], size: int = 1000) -> Iterator[List[Tuple]]:
+    """
+    Groups a row iterator into lists of at most size rows.
+    """
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def main():
+    """
+    Runs the command given on the command line against the configured database and writes its rows, see the module
+    docstring.
+
+    :return: None
+    """
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database', help='database file, defaults to the DATABASE_PATH environment variable')
+    parser.add_argument('--profile', default='default', help='SQLite PRAGMA profile, see PRAGMA_PROFILES')
+    parser.add_argument('--since', type=datetime.fromisoformat, help='only records created at or after this time')
+    parser.add_argument('--until', type=datetime.fromisoformat, help='only records created before this time')
+    parser.add_argument('--format', dest='output_format', choices=('table', 'csv', 'jsonl'),
+                        help='output format, table by default and csv for export')
+    parser.add_argument('--output', help='file written to, standard output by default')
+    commands = parser.add_subparsers(dest='command', required=True)
+    for name in ('queries', 'users'):
+        commands.add_parser(name).add_argument('--limit', type=int, default=20)
+    commands.add_parser('hourly').add_argument('--timeline', action='store_true',
+                                               help='one row per hour of the period instead of per hour of the day')
+    export = commands.add_parser('export')
+    export.add_argument('--chunk', type=int, default=10000, help='records read and written at a time')
+    export.add_argument('--titles', action='store_true', help='add the names of the titles sent')
+    args = parser.parse_args()
+
+    from database.connection import configure_database, db
+    configure_database(args.profile, path=args.database)
+    if not os.path.exists(db.database):
+        sys.exit(f"Database {db.database} does not exist")
+    problems = check_schema(db)
+    if problems:
+        sys.exit(f"Database {db.database} is not up to date ({'; '.join(problems)}): start the bot once to migrate it")
+
+    if args.command == 'queries':
+        columns, chunks = QUERY_COLUMNS, chunked(top_queries(args.limit, args.since, args.until))
+    elif args.command == 'users':
+        columns, chunks = USER_COLUMNS, chunked(user_activity(args.limit, args.since, args.until))
+    elif args.command == 'hourly':
+        columns, chunks = HOURLY_COLUMNS, chunked(hourly_load(args.timeline, args.since, args.until))
+    else:
+        columns, chunks = EXPORT_COLUMNS, iter_history(args.chunk, args.since, args.until)
+        if args.titles:
+            columns, chunks = columns + ('titles',), map(with_titles, chunks)
+    output_format = args.output_format or ('csv' if args.command == 'export' else 'table')
+
+    start = time.perf_counter()
+    output = open(args.output, 'w', newline='', encoding='utf-8') if args.output else sys.stdout
+    try:
+        written = write_rows(columns, chunks, output, output_format)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    print(f"{written} rows written in {time.perf_counter() - start:.2f} s", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
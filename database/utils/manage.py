@@ -2,27 +2,68 @@
 
 from typing import Any, Dict, List, TypeVar
 from peewee import SqliteDatabase, ModelSelect
-from database.common.models import ModelBase
+from database.common.models import History, ModelBase, Title
 from database.connection import db
+from database.utils.retention import trim_history
 from log_config import logger
+from metrics import record_error, timed
 
 T = TypeVar("T", bound=ModelBase)  # type variable bound to subclasses of ModelBase
 
 
-def _store_data(dataBase: SqliteDatabase, model: T, *data) -> None:
+def _store_data(dataBase: SqliteDatabase, model: T, *data) -> bool:
     """
     Stores multiple records in the database for the specified model. This operation is atomic.
 
     :param dataBase: The database connection to use.
     :param model: The Peewee model class that defines the table where data will be inserted.
     :param data: Variable number of dictionaries containing the data to be inserted.
-    :return: None
+    :return: True if the records were stored, False if the insert failed.
     """
     try:
         with dataBase.atomic():  # inside block is treated as a single operation - performance & data integrity
             model.insert_many(*data).execute()
     except Exception as e:
+        record_error('database', 'store')
         logger.error("Failed to store data: %s", e)
+        return False
+    return True
+
+
+def _store_history(dataBase: SqliteDatabase, records: List[Dict], keep: int = 0) -> bool:
+    """
+    Stores history records together with the titles they reference, in one transaction. Each record may carry the
+    title records it references under 'titles'; titles missing from the title table are added, existing ones are
+    left to the catalog. The users of the records are then trimmed to their latest records, so a user's history
+    stays bounded as it is written.
+
+    :param dataBase: The database connection to use.
+    :param records: Dictionaries with the History fields, plus the optional 'titles' list.
+    :param keep: Number of latest records kept for each user of the batch; 0 keeps them all.
+    :return: True if the records were stored, False if the transaction failed.
+    """
+    titles = {}
+    rows = []
+    for record in records:
+        row = dict(record)
+        for title in row.pop('titles', None) or ():
+            if title.nfid is not None:
+                titles[title.nfid] = {"nfid": title.nfid, "type": row.get("type") or 'movie', "title": title.title,
+                                      "synopsis": title.synopsis, "imdbrating": title.imdbrating, "img": title.img,
+                                      "updated_at": row.get("created_at")}
+        rows.append(row)
+    try:
+        with dataBase.atomic():
+            if titles:
+                Title.insert_many(list(titles.values())).on_conflict_ignore().execute()
+            History.insert_many(rows).execute()
+            if keep > 0:
+                trim_history(keep, {row["user_id"] for row in rows})
+    except Exception as e:
+        record_error('database', 'store_history')
+        logger.error("Failed to store history: %s", e)
+        return False
+    return True
 
 
 def _retrieve_data(model: T, *conditions, order_by=None, limit=None):
@@ -45,6 +86,7 @@ def _retrieve_data(model: T, *conditions, order_by=None, limit=None):
     try:
         return list(query)
     except Exception as e:
+        record_error('database', 'retrieve')
         logger.error("Failed to retrieve data: %s", e)
         return None
 
@@ -89,6 +131,7 @@ class ManageInterface:
     Provides interface methods for interacting with the database. It supports basic CRUD operations.
     """
     @staticmethod
+    @timed('database')
     def store(database: SqliteDatabase, model: T, data: List[Dict]):
         """
         Stores multiple new records in the database for the given model.
@@ -96,10 +139,26 @@ class ManageInterface:
         :param database: The database connection instance.
         :param model: The database model class where records will be stored.
         :param data: A list of dictionaries representing the data to be stored.
+        :return: True if the records were stored, False if the insert failed.
+        """
+        return _store_data(database, model, data)
+
+    @staticmethod
+    @timed('database')
+    def store_history(database: SqliteDatabase, data: List[Dict], keep: int = 0):
+        """
+        Stores history records, adds the titles they reference to the title table and trims the history of their
+        users.
+
+        :param database: The database connection instance.
+        :param data: A list of dictionaries with the History fields and an optional 'titles' list of TitleRecord.
+        :param keep: Number of latest records kept for each user of the batch; 0 keeps them all.
+        :return: True if the records were stored, False if the transaction failed.
         """
-        _store_data(database, model, data)
+        return _store_history(database, data, keep)
 
     @staticmethod
+    @timed('database')
     def retrieve(model: T, *conditions, order_by=None, limit=None):
         """
         Retrieves records from the database that meet the specified conditions.
@@ -113,6 +172,7 @@ class ManageInterface:
         return _retrieve_data(model, *conditions, order_by=order_by, limit=limit)
 
     @staticmethod
+    @timed('database')
     def delete(model: T, **conditions):
         """
         Deletes records from the database that meet the specified conditions.
@@ -124,6 +184,7 @@ class ManageInterface:
         return _delete_specific(model, **conditions)
 
     @staticmethod
+    @timed('database')
     def clear_all(model: T):
         """
         Deletes all records from the database for the given model.
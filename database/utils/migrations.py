@@ -0,0 +1,102 @@
+# database-utils-migrations.py
+
+import re
+
+from peewee import CharField, IntegerField, SqliteDatabase, TextField
+from playhouse.migrate import SqliteMigrator, migrate
+
+from log_config import logger
+
+# actions logged before history was normalized, e.g. "TOP 5 MOVIES" or "CUSTOM [3-7] 5 SERIES"
+LEGACY_ACTION_RE = re.compile(r"(?:(TOP|MID|None)|CUSTOM \[(\d+)-(\d+)\]) (\d+) (MOVIES|SERIES)$")
+
+
+def _add_history_user_created_index(database: SqliteDatabase, migrator: SqliteMigrator):
+    """
+    Adds the composite (user_id, created_at) index to history tables created before it was declared on the model.
+
+    :param database: The database connection to use.
+    :param migrator: The schema migrator bound to the database.
+    :return: None
+    """
+    if not database.table_exists('history'):
+        return  # the table will be created with the index
+    if any(index.name == 'history_user_id_created_at' for index in database.get_indexes('history')):
+        return
+    migrate(migrator.add_index('history', ('user_id', 'created_at'), False))
+    logger.info("Migration: added index history_user_id_created_at")
+
+
+def _normalize_history(database: SqliteDatabase, migrator: SqliteMigrator):
+    """
+    Adds the structured search columns and the title references to history tables that only stored text, and fills
+    the search columns of the existing records from their action text. Their response text is kept, since it cannot
+    be mapped back to title ids, and is rendered as before until the retention job deletes them.
+
+    :param database: The database connection to use.
+    :param migrator: The schema migrator bound to the database.
+    :return: None
+    """
+    if not database.table_exists('history'):
+        return
+    if any(column.name == 'title_ids' for column in database.get_columns('history')):
+        return
+    migrate(migrator.add_column('history', 'kind', CharField(null=True)),
+            migrator.add_column('history', 'type', CharField(null=True)),
+            migrator.add_column('history', 'limit', IntegerField(null=True)),
+            migrator.add_column('history', 'start_rating', IntegerField(null=True)),
+            migrator.add_column('history', 'end_rating', IntegerField(null=True)),
+            migrator.add_column('history', 'title_ids', TextField(default='')),
+            migrator.drop_not_null('history', 'action'),
+            migrator.drop_not_null('history', 'response'))
+    converted = 0
+    for action, in database.execute_sql('SELECT DISTINCT action FROM history').fetchall():
+        match = LEGACY_ACTION_RE.match(action or '')
+        if match is None:
+            continue  # rendered from its text
+        kind, low, high, limit, label = match.groups()
+        kind = 'CUSTOM' if low is not None else None if kind == 'None' else kind
+        if kind == 'MID':
+            low, high = 0, 4  # the rating range of SearchQuery.low(), stored on new MID records
+        cursor = database.execute_sql(
+            'UPDATE history SET kind = ?, type = ?, "limit" = ?, start_rating = ?, end_rating = ?, action = NULL '
+            'WHERE action = ?',
+            (kind, 'movie' if label == 'MOVIES' else 'series', int(limit),
+             int(low) if low is not None else None, int(high) if high is not None else None, action))
+        converted += cursor.rowcount
+    logger.info("Migration: normalized history, %s existing records converted", converted)
+
+
+def _add_history_search_index(database: SqliteDatabase, migrator: SqliteMigrator):
+    """
+    Adds the (kind, type, start_rating, end_rating) index, which covers the popular searches query, to history
+    tables created before it was declared on the model.
+
+    :param database: The database connection to use.
+    :param migrator: The schema migrator bound to the database.
+    :return: None
+    """
+    if not database.table_exists('history'):
+        return  # the table will be created with the index
+    index_name = 'history_kind_type_start_rating_end_rating'
+    if any(index.name == index_name for index in database.get_indexes('history')):
+        return
+    migrate(migrator.add_index('history', ('kind', 'type', 'start_rating', 'end_rating'), False))
+    logger.info("Migration: added index %s", index_name)
+
+
+MIGRATIONS = [_add_history_user_created_index, _normalize_history, _add_history_search_index]
+
+
+def apply_migrations(database: SqliteDatabase):
+    """
+    Brings the schema of an existing database up to date. Every migration checks whether it is still needed,
+    so this can run at every start.
+
+    :param database: The database connection to use.
+    :return: None
+    """
+    migrator = SqliteMigrator(database)
+    with database.atomic():
+        for migration in MIGRATIONS:
+            migration(database, migrator)
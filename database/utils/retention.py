@@ -0,0 +1,135 @@
+# database-utils-retention.py
+
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional
+
+from peewee import Select, fn
+
+from database.common.models import History
+from log_config import logger
+
+
+def trim_history(keep: int = 5, user_ids: Optional[Iterable[int]] = None) -> int:
+    """
+    Trims the history to the latest records of every user. All users are trimmed by a single DELETE: a window
+    function ranks every user's records by age.
+
+    :param keep: Number of latest records kept for every user.
+    :param user_ids: Only trim these users, e.g. the ones a batch of records was just stored for; the
+                     (user_id, created_at) index then limits the ranking to their records. All users by default.
+    :return: The number of deleted records.
+    """
+    rank = fn.ROW_NUMBER().over(partition_by=[History.user_id],
+                                order_by=[History.created_at.desc(), History.id.desc()])
+    ranked = History.select(History.id, rank.alias('rn'))
+    if user_ids is not None:
+        ranked = ranked.where(History.user_id.in_(list(user_ids)))
+    ranked = ranked.alias('ranked')
+    stale = Select([ranked], [ranked.c.id]).where(ranked.c.rn > keep)
+    return History.delete().where(History.id.in_(stale)).execute()
+
+
+def delete_history_before(cutoff: datetime, chunk: int = 5000) -> int:
+    """
+    Deletes the history records older than cutoff, a chunk at a time, so the write lock is released between chunks
+    and the bot's own writes are not held up by a large deletion.
+
+    :param cutoff: Records created before this time are deleted.
+    :param chunk: Maximum number of records deleted by one statement.
+    :return: The number of deleted records.
+    """
+    deleted = 0
+    while True:
+        batch = History.select(History.id).where(History.created_at < cutoff).limit(chunk)
+        count = History.delete().where(History.id.in_(batch)).execute()
+        deleted += count
+        if count < chunk:
+            return deleted
+
+
+class HistoryRetention:
+    """
+    Background job applying the history retention policy: records older than max_age_days are deleted, then every
+    user's history is trimmed to its keep_per_user latest records. SQLite reuses the freed pages, so the database
+    file stops growing instead of shrinking; run VACUUM offline to give the space back to the file system.
+    """
+    def __init__(self, max_age_days: float = 30.0, keep_per_user: int = 20, interval: float = 3600.0):
+        """
+        Initializes the job without starting it.
+
+        :param max_age_days: Age in days after which records are deleted; 0 keeps records of any age.
+        :param keep_per_user: Number of latest records kept for every user; 0 keeps them all. The history view
+                              shows 5, older records still count towards the popular searches.
+        :param interval: Seconds between two runs.
+        """
+        self.max_age_days = max_age_days
+        self.keep_per_user = keep_per_user
+        self.interval = interval
+        self.expired = 0
+        self.trimmed = 0
+        self.runs = 0
+        self.last_duration = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="history-retention", daemon=True)
+
+    def start(self):
+        """
+        Starts the job thread. The first run happens right away.
+
+        :return: None
+        """
+        self._thread.start()
+        logger.info("History retention started: max age %s days, %s records per user",
+                    self.max_age_days, self.keep_per_user)
+
+    def stop(self):
+        """
+        Stops the job thread and waits for the current run to finish.
+
+        :return: None
+        """
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        logger.info("History retention stopped: %s", self.stats())
+
+    def run_once(self):
+        """
+        Applies the retention policy once.
+
+        :return: None
+        """
+        start = time.perf_counter()
+        try:
+            if self.max_age_days > 0:
+                self.expired += delete_history_before(datetime.now() - timedelta(days=self.max_age_days))
+            if self.keep_per_user > 0:
+                self.trimmed += trim_history(self.keep_per_user)
+        except Exception as e:
+            logger.error("History retention failed: %s", e)
+        self.runs += 1
+        self.last_duration = time.perf_counter() - start
+
+    def _run(self):
+        """
+        Job loop executed by the background thread.
+
+        :return: None
+        """
+        while not self._stop.is_set():
+            self.run_once()
+            logger.info("History retention run finished: %s", self.stats())
+            self._stop.wait(self.interval)
+
+    def stats(self) -> Dict:
+        """
+        Returns the retention counters.
+
+        :return: A dictionary with the records deleted for age and per-user trimming, runs and the last run time.
+        """
+        return {"expired": self.expired,
+                "trimmed": self.trimmed,
+                "runs": self.runs,
+                "last_duration_ms": round(self.last_duration * 1000, 1)}
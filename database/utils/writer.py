@@ -0,0 +1,191 @@
+# database-utils-writer.py
+
+import queue
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from peewee import SqliteDatabase
+
+from database.utils.manage import ManageInterface, T
+from log_config import logger
+
+
+class BatchWriter:
+    """
+    Write-behind sink for a model: callers enqueue records and return immediately, and a background thread stores
+    them with one multi-row insert per batch. A batch is written when it reaches batch_size records or when
+    flush_interval seconds have passed since its first record.
+
+    The queue is bounded. When it is full, write() waits up to put_timeout seconds for room and then stores the
+    record synchronously, so a stalled database slows callers down instead of exhausting memory. Records of a batch
+    that could not be stored are logged by the store function and counted as failed; they are not retried.
+    """
+    def __init__(self, database: SqliteDatabase, model: T, batch_size: int = 100, flush_interval: float = 1.0,
+                 max_queue: int = 10000, put_timeout: float = 0.5,
+                 store: Optional[Callable[[SqliteDatabase, List[Dict]], bool]] = None):
+        """
+        Initializes the writer without starting it.
+
+        :param database: The database connection to use.
+        :param model: The model whose records are written.
+        :param batch_size: Maximum number of records stored by one insert.
+        :param flush_interval: Maximum number of seconds a record waits before being stored.
+        :param max_queue: Maximum number of records waiting to be stored.
+        :param put_timeout: Seconds write() waits for room in a full queue before storing synchronously.
+        :param store: Function storing a batch in one transaction and returning False if it failed, e.g.
+                      ManageInterface.store_history; a plain multi-row insert into the model when omitted.
+        """
+        self.database = database
+        self.model = model
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.store = store
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"{model.__name__.lower()}-writer", daemon=True)
+        self._lock = threading.Lock()
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+        self.overflow = 0
+
+    def start(self):
+        """
+        Starts the background flusher.
+
+        :return: None
+        """
+        self._thread.start()
+
+    def write(self, record: Dict):
+        """
+        Enqueues a record to be stored by the flusher.
+
+        :param record: A dictionary with the field values of the record.
+        :return: None
+        """
+        try:
+            self._queue.put(record, timeout=self.put_timeout)
+        except queue.Full:
+            with self._lock:
+                self.overflow += 1
+            logger.warning("%s write queue is full, storing record synchronously", self.model.__name__)
+            self._store([record])
+
+    def flush(self, timeout: float = None):
+        """
+        Waits until every record enqueued so far has been stored.
+
+        :param timeout: Maximum number of seconds to wait, also for room in a full queue; None to wait indefinitely.
+        :return: True if the records were stored in time, False if the wait timed out.
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(max(deadline - time.monotonic(), 0) if deadline is not None else None)
+
+    def close(self):
+        """
+        Stores every pending record and stops the flusher. Call it on shutdown.
+
+        :return: None
+        """
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        else:
+            self._drain()
+        logger.info("%s writer closed: %s", self.model.__name__, self.stats())
+
+    def _store(self, batch: List[Dict]):
+        """
+        Stores a batch in a single transaction.
+
+        :param batch: The records to store.
+        :return: None
+        """
+        try:
+            if self.store is not None:
+                stored = self.store(self.database, batch)
+            else:
+                stored = ManageInterface.store(self.database, self.model, batch)
+        except Exception as e:
+            logger.error("Failed to store %s %s records: %s", len(batch), self.model.__name__, e)
+            stored = False
+        with self._lock:
+            if stored is False:
+                self.failed += len(batch)
+            else:
+                self.written += len(batch)
+                self.batches += 1
+
+    def _drain(self):
+        """
+        Stores whatever is left in the queue after the flusher stopped.
+
+        :return: None
+        """
+        batch = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(item, threading.Event):
+                item.set()
+            else:
+                batch.append(item)
+        for i in range(0, len(batch), self.batch_size):
+            self._store(batch[i:i + self.batch_size])
+
+    def _run(self):
+        """
+        Flusher loop executed by the background thread.
+
+        :return: None
+        """
+        while not self._stop.is_set():
+            batch, waiters = [], []
+            try:
+                item = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if isinstance(item, threading.Event):
+                    waiters.append(item)  # a flush() request: write what we have now
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if batch:
+                self._store(batch)
+            for waiter in waiters:
+                waiter.set()
+        self._drain()
+
+    def stats(self) -> Dict:
+        """
+        Returns the writer counters.
+
+        :return: A dictionary with stored records, records lost to failed stores, batches, synchronous overflow
+                 writes and the queue depth.
+        """
+        with self._lock:
+            return {"written": self.written,
+                    "failed": self.failed,
+                    "batches": self.batches,
+                    "overflow": self.overflow,
+                    "queued": self._queue.qsize()}
@@ -2,14 +2,224 @@
 For some reason I had trouble using logging.basicConfig(), if it works for you, you do not need this file.
 However, all the loggers in the project use this logger, so you will need to refactor all every
 logger.info() to logging.info (just keep using this logeer)
+
+Until configure_logging() is called, records are written synchronously to app.log. configure_logging() moves the
+file I/O to a background thread: the logging call only puts the record in a bounded queue, and a listener thread
+writes it to a rotating file, as text or as JSON lines.
 """
 
+import json
 import logging
+import queue
+import random
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
+from typing import Optional
 
 logger = logging.getLogger('mylogger')
 logger.setLevel(logging.INFO)
-fh = logging.FileHandler('app.log')
+fh = logging.FileHandler('app.log', delay=True)  # the file is only created by the first record
 fh.setLevel(logging.INFO)
 formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
 fh.setFormatter(formatter)
 logger.addHandler(fh)
+
+_listeners = []  # running QueueListener instances, stopped by stop_logging()
+_queue_handler: Optional['NonBlockingQueueHandler'] = None
+_file_handler: logging.Handler = fh  # the handler writing the file, used by the listeners
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats a record as one JSON object per line, with the structured fields passed through `extra`, e.g.
+    logger.info("...", extra={"user_id": 1, "handler": "handler.send_welcome", "latency_ms": 3.2}).
+
+    Attributes:
+        FIELDS (tuple): Record attributes copied to the JSON object when they are set.
+    """
+    FIELDS = ('user_id', 'chat_id', 'handler', 'latency_ms', 'update_id', 'worker')
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {"time": self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+                 "level": record.levelname,
+                 "message": record.getMessage()}
+        for field in self.FIELDS:
+            value = record.__dict__.get(field)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class DebugSampler(logging.Filter):
+    """
+    Keeps only a random fraction of the DEBUG records, so per-request debug events stay affordable under load.
+    Records above DEBUG always pass.
+
+    Attributes:
+        rate (float): Fraction of the DEBUG records kept, between 0 and 1.
+        dropped (int): DEBUG records dropped so far.
+    """
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+        self.dropped = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or self.rate >= 1.0 or random.random() < self.rate:
+            return True
+        self.dropped += 1
+        return False
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    Queue handler that never blocks the logging thread: when the queue is full, the record is dropped and counted.
+
+    Attributes:
+        dropped (int): Records dropped because the queue was full.
+    """
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """
+        Renders the message and the traceback now, while the arguments are still current, and leaves the rest of
+        the formatting to the listener. The record can then be pickled, so it can be sent to another process. This
+        is the logger's only handler, so the record is changed in place instead of copied.
+        """
+        record.message = record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def build_file_handler(path: str, max_bytes: int, backup_count: int, when: Optional[str] = None) -> logging.Handler:
+    """
+    Creates the handler writing the log file, rotated by size, or by time when `when` is given.
+
+    :param path: The log file.
+    :param max_bytes: Size after which the file is rotated; 0 disables size rotation.
+    :param backup_count: Rotated files kept.
+    :param when: Time rotation interval as understood by TimedRotatingFileHandler, e.g. 'midnight' or 'H'.
+    :return: The file handler.
+    """
+    if when:
+        return TimedRotatingFileHandler(path, when=when, backupCount=backup_count, encoding='utf-8', delay=True)
+    return RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8', delay=True)
+
+
+def _replace_handlers(handler: logging.Handler):
+    """
+    Makes handler the only handler of the logger.
+
+    :param handler: The new handler.
+    :return: None
+    """
+    for old in list(logger.handlers):
+        logger.removeHandler(old)
+        old.close()
+    logger.addHandler(handler)
+
+
+def configure_logging(path: str = 'app.log', level: str = 'INFO', json_format: bool = False,
+                      max_bytes: int = 10 * 1024 * 1024, backup_count: int = 5, when: Optional[str] = None,
+                      queue_size: int = 10000, debug_sample_rate: float = 1.0):
+    """
+    Replaces the synchronous file handler by a queue handler and starts the background thread writing the file.
+    Call stop_logging() before exiting so the queued records are written.
+
+    :param path: The log file.
+    :param level: Minimum level logged.
+    :param json_format: Write JSON lines with the structured fields instead of text lines.
+    :param max_bytes: Size after which the file is rotated.
+    :param backup_count: Rotated files kept.
+    :param when: Rotate by time instead of size, e.g. 'midnight'.
+    :param queue_size: Records allowed to wait for the writer; further records are dropped and counted.
+    :param debug_sample_rate: Fraction of the DEBUG records kept.
+    :return: None
+    """
+    global _queue_handler, _file_handler
+    stop_logging()
+    _file_handler = file_handler = build_file_handler(path, max_bytes, backup_count, when)
+    file_handler.setFormatter(JsonFormatter() if json_format else formatter)
+    log_queue = queue.Queue(maxsize=queue_size)
+    _queue_handler = NonBlockingQueueHandler(log_queue)
+    _queue_handler.addFilter(DebugSampler(debug_sample_rate))
+    logger.setLevel(level.upper())
+    _replace_handlers(_queue_handler)
+    listener = QueueListener(log_queue, file_handler)
+    listener.start()
+    _listeners.append(listener)
+
+
+def listen(log_queue) -> QueueListener:
+    """
+    Starts a thread writing the records worker processes put in log_queue (see forward_logs()) to this process's
+    log file. The workers already filtered and sampled them. It is stopped by stop_logging().
+
+    :param log_queue: A multiprocessing queue shared with the workers.
+    :return: The running listener.
+    """
+    listener = QueueListener(log_queue, _file_handler)
+    listener.start()
+    _listeners.append(listener)
+    return listener
+
+
+def forward_logs(log_queue, level: str = 'INFO', debug_sample_rate: float = 1.0):
+    """
+    Sends the records of a worker process to the process that listens on log_queue instead of writing them here,
+    so a single process writes and rotates the log file.
+
+    :param log_queue: A multiprocessing queue shared with the listening process.
+    :param level: Minimum level logged.
+    :param debug_sample_rate: Fraction of the DEBUG records kept.
+    :return: None
+    """
+    global _queue_handler
+    _queue_handler = NonBlockingQueueHandler(log_queue)
+    _queue_handler.addFilter(DebugSampler(debug_sample_rate))
+    logger.setLevel(level.upper())
+    _replace_handlers(_queue_handler)
+
+
+def logging_stats() -> dict:
+    """
+    Returns the number of records dropped by the pipeline.
+
+    :return: A dictionary with the records dropped because the queue was full and the DEBUG records sampled out.
+    """
+    if _queue_handler is None:
+        return {"dropped": 0, "sampled_out": 0}
+    return {"dropped": _queue_handler.dropped,
+            "sampled_out": sum(f.dropped for f in _queue_handler.filters if isinstance(f, DebugSampler))}
+
+
+def stop_logging():
+    """
+    Writes the queued records and stops the background threads. Later records are written synchronously again.
+
+    :return: None
+    """
+    global _queue_handler, _file_handler
+    if not _listeners:
+        return
+    while _listeners:
+        _listeners.pop().stop()  # writes every record still queued
+    _file_handler.close()
+    _file_handler = logging.FileHandler(_file_handler.baseFilename, delay=True)
+    _file_handler.setFormatter(formatter)
+    _replace_handlers(_file_handler)
+    _queue_handler = None
@@ -1,21 +1,368 @@
-from config import AppSettings
-# from database.common.models import History
+import functools
+import signal
+import sys
+
+import metrics  # imported first: the startup phases are measured from its import
+from config import AppSettings, load_settings
+from database.common.models import History
+from database.connection import configure_database
+from database.core import db, init_database
 # from database.core import db_manage
-from log_config import logger
+from database.utils.manage import ManageInterface
+from database.utils.retention import HistoryRetention
+from database.utils.writer import BatchWriter
+from log_config import configure_logging, forward_logs, logger, logging_stats, stop_logging
+from rate_limit import RateLimiter
 from tg_API.core import Bot
+from tg_API.supervisor import Supervisor, WorkerChannel
+from tg_API.utils.history_cache import HistoryRing
+from tg_API.utils.poster_cache import PosterCache
+from tg_API.utils.state_storage import SqliteStateStorage
 from site_API.core import SiteApi
+from site_API.utils.catalog import CatalogSiteApi
+from site_API.utils.cache import ResponseCache, SqliteCacheTier
+from site_API.utils.prefetch import Prefetcher
+from site_API.utils.transport import HttpTransport
 
 
-def main():
-    app = AppSettings()
-    site = SiteApi(app.site_api.get_secret_value(), app.host_api)
-    bot = Bot(app.bot_token.get_secret_value(), site)
+def setup_database(app: AppSettings):
+    """
+    Applies the configured SQLite PRAGMA profile to the database and brings its schema up to date.
+
+    :param app: The application settings.
+    :return: None
+    """
+    configure_database(app.sqlite_profile, max_connections=app.sqlite_max_connections,
+                       journal_mode=app.sqlite_journal_mode, synchronous=app.sqlite_synchronous,
+                       cache_size=app.sqlite_cache_size, mmap_size=app.sqlite_mmap_size,
+                       busy_timeout=app.sqlite_busy_timeout, temp_store=app.sqlite_temp_store)
+    init_database()
+
+
+def build_limiters(app: AppSettings, share: int = 1):
+    """
+    Creates the rate limiters of the calls to Telegram and to the site API.
+
+    :param app: The application settings.
+    :param share: Number of processes the configured global rates are divided among.
+    :return: A tuple (Telegram limiter, site API limiter).
+    """
+    telegram = RateLimiter(app.telegram_rate / share, app.telegram_burst / share,
+                           key_rate=app.telegram_chat_rate, key_burst=app.telegram_chat_burst,
+                           reserved=app.telegram_reserved / share, name='Telegram')
+    site = RateLimiter(app.site_rate / share, app.site_burst / share, reserved=app.site_reserved / share,
+                       name='Site API')
+    return telegram, site
+
+
+def build_site(app: AppSettings, cache: ResponseCache, limiter: RateLimiter) -> SiteApi:
+    """
+    Creates the synchronous site API with its pooled transport, backed by the title catalog if enabled.
+
+    :param app: The application settings.
+    :param cache: The shared response cache.
+    :param limiter: The site API rate limiter.
+    :return: The site API instance.
+    """
+    transport = HttpTransport(pool_size=app.http_pool_size,
+                              connect_timeout=app.http_connect_timeout,
+                              read_timeout=app.http_read_timeout,
+                              retries=app.http_retries,
+                              backoff=app.http_backoff)
+    if app.catalog_enabled:
+        return CatalogSiteApi(app.site_api.get_secret_value(), app.host_api, transport, cache,
+                              max_age=app.catalog_max_age, limiter=limiter)
+    return SiteApi(app.site_api.get_secret_value(), app.host_api, transport, cache, limiter)
+
+
+def start_prefetcher(app: AppSettings, site: SiteApi):
+    """
+    Starts the background prefetcher if it is enabled.
+
+    :param app: The application settings.
+    :param site: The synchronous site API whose cache is kept warm.
+    :return: The running Prefetcher, or None.
+    """
+    if not app.prefetch_enabled:
+        return None
+    prefetcher = Prefetcher(site, lambda: Bot.popular_queries(app.prefetch_custom),
+                            budget_per_minute=app.prefetch_budget,
+                            interval=app.prefetch_interval,
+                            margin=app.prefetch_margin)
+    prefetcher.start()
+    return prefetcher
+
+
+def start_history_retention(app: AppSettings):
+    """
+    Starts the background job deleting old history records if it is enabled.
+
+    :param app: The application settings.
+    :return: The running HistoryRetention, or None.
+    """
+    if not app.history_retention_enabled:
+        return None
+    retention = HistoryRetention(max_age_days=app.history_retention_days, keep_per_user=app.history_keep_per_user,
+                                 interval=app.history_retention_interval)
+    retention.start()
+    return retention
+
+
+def build_history_ring(app: AppSettings) -> HistoryRing:
+    """
+    Creates the in-memory cache of the users' latest history entries.
+
+    :param app: The application settings.
+    :return: The history ring.
+    """
+    return HistoryRing(Bot.load_history_entries, max_users=app.history_cache_users)
+
+
+def build_poster_cache(app: AppSettings):
+    """
+    Creates the cache of the file_ids of the posters already uploaded to Telegram, if it is enabled.
+
+    :param app: The application settings.
+    :return: The poster cache, or None.
+    """
+    if not app.poster_cache_enabled:
+        return None
+    return PosterCache(max_entries=app.poster_cache_size, max_rows=app.poster_cache_rows)
+
+
+def start_metrics(app: AppSettings, offset: int = 0):
+    """
+    Starts the Prometheus text endpoint if it is enabled.
+
+    :param app: The application settings.
+    :param offset: Added to the configured port, so every worker process gets its own endpoint.
+    :return: The running MetricsServer, or None.
+    """
+    if not app.metrics_enabled:
+        return None
+    try:
+        server = metrics.MetricsServer(app.metrics_listen, app.metrics_port + offset)
+    except OSError as e:
+        logger.error("Metrics endpoint could not be started: %s", e)
+        return None
+    server.start()
+    return server
+
+
+def build_state_storage(app: AppSettings, shared: bool = True):
+    """
+    Creates and starts the persistent conversation state storage if it is enabled.
+
+    :param app: The application settings.
+    :param shared: Whether other bot processes may handle the same conversations (see SqliteStateStorage).
+    :return: The running SqliteStateStorage, or None to keep states in memory only.
+    """
+    if app.state_storage != 'sqlite':
+        return None
+    storage = SqliteStateStorage(ttl=app.state_ttl, flush_interval=app.state_flush_interval, shared=shared)
+    storage.start()
+    return storage
+
+
+def run_sync(app: AppSettings, site: SiteApi, history_writer: BatchWriter, state_storage: SqliteStateStorage,
+             limiter: RateLimiter, posters: PosterCache):
+    """
+    Runs the threaded bot with blocking long polling.
+
+    :param app: The application settings.
+    :param site: The synchronous site API.
+    :param history_writer: The write-behind history sink.
+    :param state_storage: The persistent conversation state storage, or None.
+    :param limiter: The Telegram rate limiter.
+    :param posters: The poster file_id cache, or None.
+    :return: None
+    """
+    bot = Bot(app.bot_token.get_secret_value(), site, num_threads=app.bot_workers, history_writer=history_writer,
+              history_ring=build_history_ring(app), state_storage=state_storage, limiter=limiter,
+              admin_ids=app.admin_ids, posters=posters, history_keep=app.history_keep_per_user)
     bot.setup_handlers()
-    # db_manage.clear_all(History)
     bot.run()
 
 
-if __name__ == '__main__':
+def run_webhook(app: AppSettings, site: SiteApi, history_writer: BatchWriter, state_storage: SqliteStateStorage,
+                limiter: RateLimiter, posters: PosterCache):
+    """
+    Runs the bot behind a webhook served by a local HTTP server.
+
+    :param app: The application settings.
+    :param site: The synchronous site API.
+    :param history_writer: The write-behind history sink.
+    :param state_storage: The persistent conversation state storage, or None.
+    :param limiter: The Telegram rate limiter.
+    :param posters: The poster file_id cache, or None.
+    :return: None
+    """
+    if not app.webhook_url:
+        exit("WEBHOOK_URL must be set to run the bot in webhook mode")
+    bot = Bot(app.bot_token.get_secret_value(), site, threaded=False, history_writer=history_writer,
+              history_ring=build_history_ring(app), state_storage=state_storage, limiter=limiter,
+              admin_ids=app.admin_ids, posters=posters, history_keep=app.history_keep_per_user)
+    bot.setup_handlers()
+    bot.run_webhook(app.webhook_url, listen=app.webhook_listen, port=app.webhook_port,
+                    secret_token=app.webhook_secret.get_secret_value() if app.webhook_secret else None,
+                    workers=app.webhook_workers, queue_size=app.webhook_queue)
+
+
+def run_worker(app: AppSettings, channel: WorkerChannel):
+    """
+    Entry point of a worker process in multiprocess mode: builds a non-threaded bot with its own site API, caches and
+    writers, and handles the updates routed to it by the supervisor.
+
+    :param app: The application settings.
+    :param channel: The worker's link to the supervisor.
+    :return: None
+    """
+    forward_logs(channel.logs, app.log_level, app.log_debug_sample_rate)
+    setup_database(app)
+    telegram_limiter, site_limiter = build_limiters(app, share=app.bot_processes + 1)  # the supervisor prefetches
+    cache = ResponseCache(max_entries=app.cache_size, ttl=app.cache_ttl,
+                          disk=SqliteCacheTier() if app.cache_disk else None)
+    site = build_site(app, cache, site_limiter)
+    history_writer = BatchWriter(db, History, batch_size=app.history_batch_size,
+                                 flush_interval=app.history_flush_interval, max_queue=app.history_queue_size,
+                                 store=functools.partial(ManageInterface.store_history,
+                                                         keep=app.history_keep_per_user))
+    history_writer.start()
+    state_storage = build_state_storage(app, shared=False)  # the supervisor routes every user to one worker
+    metrics_server = start_metrics(app, offset=channel.index + 1)
+    posters = build_poster_cache(app)  # the table is shared, the memory tier is per worker
+    bot = Bot(app.bot_token.get_secret_value(), site, threaded=False, history_writer=history_writer,
+              history_ring=build_history_ring(app), state_storage=state_storage, limiter=telegram_limiter,
+              admin_ids=app.admin_ids, posters=posters, history_keep=app.history_keep_per_user)
+    bot.setup_handlers()
+    bot.add_filters()
+    try:
+        channel.serve(bot.bot)
+    finally:
+        if state_storage is not None:
+            state_storage.close()
+        history_writer.close()
+        logger.info('Worker %s Telegram rate limiter stats: %s', channel.index, telegram_limiter.stats())
+        if posters is not None:
+            logger.info('Worker %s poster cache stats: %s', channel.index, posters.stats())
+        if metrics_server is not None:
+            metrics_server.stop()
+        site.transport.close()
+
+
+def run_multiprocess(app: AppSettings):
+    """
+    Polls Telegram in this process and shards the updates by user over worker processes.
+
+    :param app: The application settings.
+    :return: None
+    """
+    supervisor = Supervisor(app.bot_token.get_secret_value(), run_worker, args=(app,), processes=app.bot_processes,
+                            queue_size=app.bot_process_queue, heartbeat_timeout=app.bot_heartbeat_timeout,
+                            log_queue_size=app.log_queue_size)
+    supervisor.start()
+    try:
+        supervisor.serve_forever()
+    finally:
+        supervisor.stop()
+
+
+def run_async(app: AppSettings, cache: ResponseCache, history_writer: BatchWriter, state_storage: SqliteStateStorage,
+              limiter: RateLimiter, site_limiter: RateLimiter, posters: PosterCache):
+    """
+    Runs the asyncio bot on an async Telegram client and an async site API sharing the response cache, backed by
+    the title catalog if enabled.
+
+    :param app: The application settings.
+    :param cache: The shared response cache.
+    :param history_writer: The write-behind history sink.
+    :param state_storage: The persistent conversation state storage, or None.
+    :param limiter: The Telegram rate limiter.
+    :param site_limiter: The site API rate limiter, shared with the prefetcher.
+    :param posters: The poster file_id cache, or None.
+    :return: None
+    """
+    import asyncio
+    from site_API.async_core import AsyncSiteApi
+    from site_API.utils.async_catalog import AsyncCatalogSiteApi
+    from site_API.utils.async_transport import AsyncHttpTransport
+    from tg_API.async_core import AsyncBot
+    from tg_API.utils.async_state_storage import AsyncSqliteStateStorage
+
+    transport = AsyncHttpTransport(pool_size=app.http_pool_size,
+                                   connect_timeout=app.http_connect_timeout,
+                                   read_timeout=app.http_read_timeout,
+                                   retries=app.http_retries,
+                                   backoff=app.http_backoff)
+    if app.catalog_enabled:
+        site = AsyncCatalogSiteApi(app.site_api.get_secret_value(), app.host_api, transport, cache,
+                                   max_age=app.catalog_max_age, limiter=site_limiter)
+    else:
+        site = AsyncSiteApi(app.site_api.get_secret_value(), app.host_api, transport, cache, site_limiter)
+    bot = AsyncBot(app.bot_token.get_secret_value(), site, history_writer, build_history_ring(app), limiter,
+                   admin_ids=app.admin_ids, posters=posters, history_keep=app.history_keep_per_user,
+                   state_storage=AsyncSqliteStateStorage(state_storage) if state_storage is not None else None)
+    bot.setup_handlers()
+    asyncio.run(bot.run())
+
+
+def main():
+    metrics.startup_phase('imports')
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))  # run the cleanup below on a normal stop too
+    app = load_settings()
+    configure_logging(app.log_file, app.log_level, json_format=app.log_json, max_bytes=app.log_max_bytes,
+                      backup_count=app.log_backup_count, when=app.log_rotate_when, queue_size=app.log_queue_size,
+                      debug_sample_rate=app.log_debug_sample_rate)
     logger.info('Application started.')
+    setup_database(app)
+    telegram_limiter, site_limiter = build_limiters(
+        app, share=app.bot_processes + 1 if app.bot_mode == 'multiprocess' else 1)
+    cache = ResponseCache(max_entries=app.cache_size, ttl=app.cache_ttl,
+                          disk=SqliteCacheTier() if app.cache_disk else None)
+    site = build_site(app, cache, site_limiter)
+    # db_manage.clear_all(History)
+    history_writer = BatchWriter(db, History, batch_size=app.history_batch_size,
+                                 flush_interval=app.history_flush_interval, max_queue=app.history_queue_size,
+                                 store=functools.partial(ManageInterface.store_history,
+                                                         keep=app.history_keep_per_user))
+    history_writer.start()
+    prefetcher = start_prefetcher(app, site)
+    retention = start_history_retention(app)  # worker processes share this database, so it only runs here
+    metrics_server = start_metrics(app)
+    posters = build_poster_cache(app)
+    state_storage = build_state_storage(app) if app.bot_mode != 'multiprocess' else None  # workers open their own
+    try:
+        if app.bot_mode == 'multiprocess':
+            run_multiprocess(app)
+        elif app.bot_mode == 'async':
+            run_async(app, cache, history_writer, state_storage, telegram_limiter, site_limiter, posters)
+        elif app.bot_mode == 'webhook':
+            run_webhook(app, site, history_writer, state_storage, telegram_limiter, posters)
+        else:
+            run_sync(app, site, history_writer, state_storage, telegram_limiter, posters)
+    finally:
+        if prefetcher is not None:
+            prefetcher.stop()
+        if retention is not None:
+            retention.stop()
+        if state_storage is not None:
+            state_storage.close()  # persists every pending conversation change
+        history_writer.close()  # stores every pending history record before exiting
+        logger.info('Site API transport stats: %s', site.transport.stats())
+        logger.info('Site API cache stats: %s', cache.stats())
+        logger.info('Site API request coalescing stats: %s', site.flight.stats())
+        logger.info('Site API pages prefetched: %s', site.prefetched)
+        logger.info('Site API rate limiter stats: %s', site_limiter.stats())
+        logger.info('Telegram rate limiter stats: %s', telegram_limiter.stats())
+        if posters is not None:
+            logger.info('Poster cache stats: %s', posters.stats())
+        site.transport.close()
+        if metrics_server is not None:
+            metrics_server.stop()
+        logger.info('Logging stats: %s', logging_stats())
+        logger.info('Application finished.')
+        stop_logging()  # writes the queued records
+
+
+if __name__ == '__main__':
     main()
-    logger.info('Application finished.')
@@ -0,0 +1,476 @@
+# metrics.py
+
+import bisect
+import functools
+import inspect
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from log_config import logger
+
+# Upper bounds in seconds, from a cache hit to a slow site API request with retries
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple, extra: str = '') -> str:
+    """
+    Formats a label set in the Prometheus text format.
+
+    :param names: The label names.
+    :param values: The label values, in the same order.
+    :param extra: An additional, already formatted label (e.g. le="0.5").
+    :return: The label block, or an empty string if there are no labels.
+    """
+    pairs = ['%s="%s"' % (name, str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n'))
+             for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{%s}' % ','.join(pairs) if pairs else ''
+
+
+class _Family:
+    """
+    A named metric with a fixed set of label names; each combination of label values has its own child.
+    """
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple, object] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        """
+        Returns the child of a label value combination, creating it on first use.
+
+        :param values: The label values, in the order of the label names.
+        :return: The child metric.
+        """
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def collect(self) -> List[str]:
+        """
+        Renders the family in the Prometheus text format.
+
+        :return: The lines of the family, header included.
+        """
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in sorted(self._children.items()):
+            lines.extend(child.render(self.name, self.labelnames, values))
+        return lines
+
+
+class _CounterChild:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def render(self, name, labelnames, values):
+        return [f"{name}{_format_labels(labelnames, values)} {self.value}"]
+
+
+class Counter(_Family):
+    """
+    Monotonically increasing count, e.g. of errors.
+    """
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+
+class _GaugeChild(_CounterChild):
+    def dec(self, amount: float = 1.0):
+        with self._lock:
+            self.value -= amount
+
+
+class Gauge(_Family):
+    """
+    Value that goes up and down, e.g. the number of operations in flight.
+    """
+    kind = 'gauge'
+
+    def _new_child(self):
+        return _GaugeChild()
+
+
+class _HistogramChild:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last slot counts observations above every bound
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        Estimates a quantile by linear interpolation inside the bucket that contains it.
+
+        :param q: The quantile, between 0 and 1.
+        :return: The estimated value, or None if nothing was observed.
+        """
+        with self._lock:
+            counts, total = list(self.counts), self.count
+        if not total:
+            return None
+        rank, seen, lower = q * total, 0, 0.0
+        for bound, count in zip(self.buckets, counts):
+            if count and seen + count >= rank:
+                return lower + (bound - lower) * (rank - seen) / count
+            seen += count
+            lower = bound
+        return lower  # above the largest bound: report the bound
+
+    def render(self, name, labelnames, values):
+        with self._lock:
+            counts, total, observed = list(self.counts), self.count, self.sum
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets + ('+Inf',), counts):
+            cumulative += count
+            lines.append("%s_bucket%s %s" % (name, _format_labels(labelnames, values, 'le="%s"' % bound), cumulative))
+        lines.append(f"{name}_sum{_format_labels(labelnames, values)} {observed}")
+        lines.append(f"{name}_count{_format_labels(labelnames, values)} {total}")
+        return lines
+
+
+class Histogram(_Family):
+    """
+    Distribution of observed values over fixed buckets, e.g. latencies.
+    """
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+
+class Registry:
+    """
+    Collection of metric families rendered together by the endpoint.
+    """
+    def __init__(self):
+        self._families: List[_Family] = []
+
+    def register(self, family: _Family) -> _Family:
+        """
+        Adds a family to the registry.
+
+        :param family: The metric family.
+        :return: The same family, for assignment.
+        """
+        self._families.append(family)
+        return family
+
+    def render(self) -> str:
+        """
+        Renders every family in the Prometheus text exposition format.
+
+        :return: The exposition text.
+        """
+        lines = []
+        for family in self._families:
+            lines.extend(family.collect())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+OPERATION_SECONDS = REGISTRY.register(Histogram(
+    'bot_operation_duration_seconds', 'Duration of bot handlers, site API, Telegram and database operations.',
+    ('component', 'operation')))
+OPERATION_ERRORS = REGISTRY.register(Counter(
+    'bot_operation_errors_total', 'Operations that raised or reported an error.', ('component', 'operation')))
+OPERATIONS_IN_FLIGHT = REGISTRY.register(Gauge(
+    'bot_operations_in_flight', 'Operations currently running.', ('component', 'operation')))
+STARTUP_SECONDS = REGISTRY.register(Gauge(
+    'bot_startup_seconds', 'Seconds from the import of the metrics module to each startup phase.', ('phase',)))
+
+# Reference of the startup phases; main imports this module before anything else
+STARTED = time.perf_counter()
+_phases: Dict[str, float] = {}
+
+
+class _Operation:
+    """
+    The histogram, error counter and in-flight gauge children of one operation, looked up once.
+    """
+    __slots__ = ('seconds', 'errors', 'in_flight')
+
+    def __init__(self, component: str, operation: str):
+        self.seconds = OPERATION_SECONDS.labels(component, operation)
+        self.errors = OPERATION_ERRORS.labels(component, operation)
+        self.in_flight = OPERATIONS_IN_FLIGHT.labels(component, operation)
+
+
+_operations: Dict[Tuple[str, str], _Operation] = {}
+
+
+def _operation(component: str, operation: str) -> _Operation:
+    key = (component, operation)
+    op = _operations.get(key)
+    if op is None:
+        op = _operations.setdefault(key, _Operation(component, operation))
+    return op
+
+
+class track:
+    """
+    Context manager timing the block, counting it as in flight while it runs and counting an error if it raises.
+    """
+    __slots__ = ('op', 'start')
+
+    def __init__(self, component: str, operation: str):
+        """
+        :param component: The part of the bot: 'handler', 'site_api', 'telegram' or 'database'.
+        :param operation: The handler, method or query name.
+        """
+        self.op = _operation(component, operation)
+
+    def __enter__(self):
+        self.op.in_flight.inc()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.op.seconds.observe(time.perf_counter() - self.start)
+        self.op.in_flight.dec()
+        if exc_type is not None:
+            self.op.errors.inc()
+        return False
+
+
+def record_error(component: str, operation: str):
+    """
+    Counts an error that was handled without raising (e.g. logged and swallowed).
+
+    :param component: The part of the bot.
+    :param operation: The operation name.
+    :return: None
+    """
+    _operation(component, operation).errors.inc()
+
+
+def _log_call(name: str, elapsed: float, args: tuple):
+    """
+    Logs one call as a structured DEBUG event with the user, handler and latency fields.
+
+    :param name: The component and operation, e.g. 'handler.send_welcome'.
+    :param elapsed: Duration of the call in seconds.
+    :param args: Arguments of the call; a Telegram message or callback query as first one gives the user.
+    :return: None
+    """
+    user = getattr(args[0], 'from_user', None) if args else None
+    logger.debug("%s took %.1f ms", name, elapsed * 1000,
+                 extra={"handler": name, "latency_ms": round(elapsed * 1000, 3),
+                        "user_id": getattr(user, 'id', None)})
+
+
+def instrument(function, component: str, operation: Optional[str] = None):
+    """
+    Wraps a function or coroutine function so every call is tracked, and logged as a DEBUG event when DEBUG is on.
+
+    :param function: The function to wrap.
+    :param component: The part of the bot.
+    :param operation: The operation name; defaults to the function's name.
+    :return: The wrapped function.
+    """
+    name = f"{component}.{operation or function.__name__}"
+    op = _operation(component, operation or function.__name__)
+    seconds, errors, in_flight, clock = op.seconds, op.errors, op.in_flight, time.perf_counter
+    debug = logger.isEnabledFor  # cached by logging, so the check is cheap while DEBUG is off
+
+    if inspect.iscoroutinefunction(function):
+        @functools.wraps(function)
+        async def tracked_async(*args, **kwargs):
+            in_flight.inc()
+            start = clock()
+            try:
+                return await function(*args, **kwargs)
+            except BaseException:
+                errors.inc()
+                raise
+            finally:
+                elapsed = clock() - start
+                seconds.observe(elapsed)
+                in_flight.dec()
+                if debug(logging.DEBUG):
+                    _log_call(name, elapsed, args)
+        return tracked_async
+
+    @functools.wraps(function)
+    def tracked(*args, **kwargs):
+        in_flight.inc()
+        start = clock()
+        try:
+            return function(*args, **kwargs)
+        except BaseException:
+            errors.inc()
+            raise
+        finally:
+            elapsed = clock() - start
+            seconds.observe(elapsed)
+            in_flight.dec()
+            if debug(logging.DEBUG):
+                _log_call(name, elapsed, args)
+    return tracked
+
+
+def timed(component: str, operation: Optional[str] = None):
+    """
+    Decorator form of instrument().
+
+    :param component: The part of the bot.
+    :param operation: The operation name; defaults to the function's name.
+    """
+    return lambda function: instrument(function, component, operation)
+
+
+def startup_phase(phase: str) -> float:
+    """
+    Records how long the process took to reach a startup phase: 'imports' when main() starts, 'ready' when the
+    handlers are registered and 'first_update' when the first update was handled. Only the first call per phase
+    counts.
+
+    :param phase: The phase name.
+    :return: Seconds since the module was imported.
+    """
+    seconds = _phases.get(phase)
+    if seconds is None:
+        seconds = _phases.setdefault(phase, time.perf_counter() - STARTED)
+        STARTUP_SECONDS.labels(phase).inc(seconds)
+        logger.info("Startup phase %r reached after %.3f s", phase, seconds)
+    return seconds
+
+
+def first_call(function, phase: str):
+    """
+    Wraps a function or coroutine function so the end of its first call records a startup phase.
+
+    :param function: The function to wrap.
+    :param phase: The phase recorded.
+    :return: The wrapped function.
+    """
+    if inspect.iscoroutinefunction(function):
+        @functools.wraps(function)
+        async def wrapper_async(*args, **kwargs):
+            try:
+                return await function(*args, **kwargs)
+            finally:
+                if phase not in _phases:
+                    startup_phase(phase)
+        return wrapper_async
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        try:
+            return function(*args, **kwargs)
+        finally:
+            if phase not in _phases:
+                startup_phase(phase)
+    return wrapper
+
+
+def summary() -> str:
+    """
+    Renders a short human readable report of the operations: calls, errors, in flight and latency quantiles.
+
+    :return: One line per operation, slowest p95 first.
+    """
+    rows = []
+    for (component, operation), child in list(OPERATION_SECONDS._children.items()):
+        if not child.count:
+            continue
+        errors = OPERATION_ERRORS.labels(component, operation).value
+        in_flight = OPERATIONS_IN_FLIGHT.labels(component, operation).value
+        p50, p95 = child.quantile(0.5), child.quantile(0.95)
+        rows.append((p95, f"{component}.{operation}: {child.count} calls, {errors:.0f} errors, {in_flight:.0f} running, "
+                          f"p50 {p50 * 1000:.0f} ms, p95 {p95 * 1000:.0f} ms"))
+    rows.sort(key=lambda row: row[0], reverse=True)
+    return '\n'.join(line for _, line in rows) or 'No operations recorded yet.'
+
+
+class MetricsServer:
+    """
+    Local HTTP endpoint serving the registry in the Prometheus text format on /metrics, from a daemon thread.
+    """
+    def __init__(self, listen: str = '127.0.0.1', port: int = 9108, registry: Registry = REGISTRY):
+        """
+        Binds the server without serving yet.
+
+        :param listen: Address to listen on; keep it local unless a firewall protects the port.
+        :param port: Port to listen on; 0 picks a free port.
+        :param registry: The registry to expose.
+        """
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((listen, port), Handler)
+        self.httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='metrics-server', daemon=True)
+
+    @property
+    def address(self):
+        """
+        The address the server is bound to.
+
+        :return: A tuple (host, port).
+        """
+        return self.httpd.server_address
+
+    def start(self):
+        """
+        Starts serving in the background.
+
+        :return: None
+        """
+        self._thread.start()
+        logger.info("Metrics endpoint listening on http://%s:%s/metrics", *self.address)
+
+    def stop(self):
+        """
+        Stops serving and closes the socket.
+
+        :return: None
+        """
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,357 @@
+# rate_limit.py
+
+import contextlib
+import functools
+import inspect
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, Hashable, Optional
+
+import metrics
+from log_config import logger
+
+INTERACTIVE = 'interactive'
+BACKGROUND = 'background'
+
+_priority: ContextVar[str] = ContextVar('rate_limit_priority', default=INTERACTIVE)
+
+
+@contextlib.contextmanager
+def background():
+    """
+    Marks the outbound calls made inside the block (in this thread or task) as background work, which only uses the
+    capacity not reserved for interactive replies.
+    """
+    token = _priority.set(BACKGROUND)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at a fixed rate. Not thread-safe; the owning RateLimiter holds the lock.
+
+    Attributes:
+        rate (float): Tokens added per second.
+        capacity (float): Maximum number of tokens, i.e. the largest burst.
+        tokens (float): Tokens currently available.
+        blocked_until (float): Monotonic time before which no token is handed out (after a retry-after answer).
+    """
+    def __init__(self, rate: float, capacity: float):
+        """
+        Initializes a full bucket.
+
+        :param rate: Tokens added per second.
+        :param capacity: Maximum number of tokens.
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.blocked_until = 0.0
+        self._updated = time.monotonic()
+
+    def refill(self, now: float):
+        """
+        Adds the tokens accumulated since the last refill.
+
+        :param now: The current monotonic time; a time before the last refill (a bucket created after it was read)
+                    adds nothing.
+        :return: None
+        """
+        if now > self._updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+    def wait_time(self, now: float, keep: float = 0.0) -> float:
+        """
+        Returns how long to wait until a token can be taken while leaving `keep` tokens in the bucket.
+
+        :param now: The current monotonic time, the bucket must be refilled up to it.
+        :param keep: Tokens that must remain available after taking one.
+        :return: Seconds to wait, 0 if a token can be taken now.
+        """
+        if self.blocked_until > now:
+            return self.blocked_until - now
+        missing = keep + 1 - self.tokens
+        return missing / self.rate if missing > 0 else 0.0
+
+    def idle(self, now: float) -> bool:
+        """
+        Tells whether the bucket is full and unblocked, i.e. indistinguishable from a new one.
+
+        :param now: The current monotonic time, the bucket must be refilled up to it.
+        :return: True if the bucket can be dropped.
+        """
+        return self.tokens >= self.capacity and self.blocked_until <= now
+
+
+class RateLimiter:
+    """
+    Token bucket scheduler for outbound calls: every call takes one token from a global bucket and, when a key (a
+    chat ID) is given, one from that key's bucket. Callers wait just as long as needed for both, so a burst is spread
+    at the allowed rate instead of being answered with 429 errors.
+
+    Interactive calls may use the whole global bucket; background calls wait while fewer than `reserved` tokens are
+    left, so a background burst never delays the reply to a user. A retry-after answer blocks the affected bucket
+    for the time the server asked.
+
+    Attributes:
+        MAX_KEYS (int): Number of per-key buckets above which idle ones are dropped.
+    """
+    MAX_KEYS = 10000
+
+    def __init__(self, rate: float, burst: Optional[float] = None, key_rate: Optional[float] = None,
+                 key_burst: Optional[float] = None, reserved: float = 0.0, name: str = 'rate limiter'):
+        """
+        Initializes the limiter with full buckets.
+
+        :param rate: Calls per second allowed in total.
+        :param burst: Calls allowed at once in total; defaults to one second worth of calls.
+        :param key_rate: Calls per second allowed per key; None disables per-key buckets.
+        :param key_burst: Calls allowed at once per key; defaults to one second worth of calls, at least 1.
+        :param reserved: Global tokens background calls must leave for interactive ones.
+        :param name: Name used in log messages.
+        """
+        self.global_bucket = TokenBucket(rate, burst or max(rate, 1.0))
+        self.key_rate = key_rate
+        self.key_burst = key_burst or max(key_rate or 0.0, 1.0)
+        self.reserved = min(reserved, self.global_bucket.capacity - 1)
+        self.name = name
+        self._buckets: Dict[Hashable, TokenBucket] = {}
+        self._lock = threading.Lock()
+        self._stats = {priority: {"calls": 0, "waited": 0, "wait_total": 0.0, "wait_max": 0.0}
+                       for priority in (INTERACTIVE, BACKGROUND)}
+        self.throttled = 0
+
+    def _bucket(self, key: Hashable) -> Optional[TokenBucket]:
+        """
+        Returns the bucket of a key, creating it if needed. Must be called with the lock held.
+
+        :param key: The key, None for calls limited by the global bucket only.
+        :return: The key's bucket, or None.
+        """
+        if key is None or self.key_rate is None:
+            return None
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.MAX_KEYS:
+                now = time.monotonic()
+                for stale, old in list(self._buckets.items()):
+                    old.refill(now)
+                    if old.idle(now):
+                        del self._buckets[stale]
+            bucket = self._buckets[key] = TokenBucket(self.key_rate, self.key_burst)
+        return bucket
+
+    def _try_acquire(self, key: Hashable, priority: str) -> float:
+        """
+        Takes a token from every bucket the call is limited by, if all of them have one.
+
+        :param key: The key of the call, or None.
+        :param priority: INTERACTIVE or BACKGROUND.
+        :return: 0 if the tokens were taken, else the seconds to wait before trying again.
+        """
+        now = time.monotonic()
+        with self._lock:
+            buckets = [(self.global_bucket, self.reserved if priority == BACKGROUND else 0.0)]
+            bucket = self._bucket(key)
+            if bucket is not None:
+                buckets.append((bucket, 0.0))
+            wait = 0.0
+            for bucket, keep in buckets:
+                bucket.refill(now)
+                wait = max(wait, bucket.wait_time(now, keep))
+            if wait == 0.0:
+                for bucket, _ in buckets:
+                    bucket.tokens -= 1
+            return wait
+
+    def _record(self, priority: str, waited: float):
+        """
+        Updates the wait time statistics.
+
+        :param priority: INTERACTIVE or BACKGROUND.
+        :param waited: Seconds the call waited for its tokens.
+        :return: None
+        """
+        with self._lock:
+            stats = self._stats[priority]
+            stats["calls"] += 1
+            if waited > 0:
+                stats["waited"] += 1
+                stats["wait_total"] += waited
+                stats["wait_max"] = max(stats["wait_max"], waited)
+
+    def acquire(self, key: Hashable = None, priority: Optional[str] = None) -> float:
+        """
+        Blocks until the call may be sent.
+
+        :param key: The key of the call (chat ID), or None for the global bucket only.
+        :param priority: INTERACTIVE or BACKGROUND; defaults to the priority of the current context.
+        :return: Seconds waited.
+        """
+        priority = priority or _priority.get()
+        start, waited = time.monotonic(), 0.0
+        wait = self._try_acquire(key, priority)
+        while wait > 0.0:
+            time.sleep(wait)
+            wait = self._try_acquire(key, priority)
+            waited = time.monotonic() - start
+        self._record(priority, waited)
+        return waited
+
+    async def acquire_async(self, key: Hashable = None, priority: Optional[str] = None) -> float:
+        """
+        Waits, without blocking the event loop, until the call may be sent.
+
+        :param key: The key of the call (chat ID), or None for the global bucket only.
+        :param priority: INTERACTIVE or BACKGROUND; defaults to the priority of the current context.
+        :return: Seconds waited.
+        """
+        import asyncio  # only the asyncio bot needs it; importing it costs the other modes ~20 ms at startup
+
+        priority = priority or _priority.get()
+        start, waited = time.monotonic(), 0.0
+        wait = self._try_acquire(key, priority)
+        while wait > 0.0:
+            await asyncio.sleep(wait)
+            wait = self._try_acquire(key, priority)
+            waited = time.monotonic() - start
+        self._record(priority, waited)
+        return waited
+
+    def retry_after(self, seconds: float, key: Hashable = None):
+        """
+        Blocks a bucket after the server answered 429 with a retry-after delay.
+
+        :param seconds: The delay requested by the server.
+        :param key: The key the limit was hit for, or None to block every call.
+        :return: None
+        """
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._bucket(key) or self.global_bucket
+            bucket.blocked_until = max(bucket.blocked_until, now + seconds)
+            bucket.tokens = 0.0
+            self.throttled += 1
+        logger.warning("%s: retry after %s s (key %s)", self.name, seconds, key)
+
+    def stats(self) -> Dict:
+        """
+        Returns the wait time statistics.
+
+        :return: A dictionary with, per priority, the number of calls, how many had to wait, the mean and maximum
+                 wait in milliseconds; plus the number of retry-after answers and of per-key buckets.
+        """
+        with self._lock:
+            result = {priority: {"calls": stats["calls"],
+                                 "waited": stats["waited"],
+                                 "wait_mean_ms": round(stats["wait_total"] / stats["calls"] * 1000, 2)
+                                 if stats["calls"] else 0.0,
+                                 "wait_max_ms": round(stats["wait_max"] * 1000, 2)}
+                      for priority, stats in self._stats.items()}
+            result["throttled"] = self.throttled
+            result["keys"] = len(self._buckets)
+            return result
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """
+    Extracts the retry-after delay from a Telegram "Too Many Requests" error.
+
+    :param error: The exception raised by a Telegram API call.
+    :return: The delay in seconds, or None if the error is not a flood limit.
+    """
+    if getattr(error, 'error_code', None) != 429:
+        return None
+    parameters = (getattr(error, 'result_json', None) or {}).get('parameters') or {}
+    return float(parameters.get('retry_after', 1))
+
+
+class RateLimitedBot:
+    """
+    Proxy of a TeleBot or AsyncTeleBot whose outbound methods go through a RateLimiter. Calls addressed to a chat
+    are limited per chat as well; a 429 answer blocks the chat (or every call) for the retry-after delay and the call
+    is retried. Every call is timed in the metrics. Every other attribute is the bot's own.
+
+    Attributes:
+        OUTBOUND_PREFIXES (tuple): Prefixes of the bot methods that send a request to Telegram on behalf of a chat.
+        GLOBAL_ONLY_PREFIXES (tuple): Outbound methods charged to the global bucket only: deleting the previous menu
+                                      sends nothing to the user, so it does not use up the chat's message budget.
+    """
+    OUTBOUND_PREFIXES = ('send_', 'edit_message_', 'delete_message', 'forward_', 'copy_', 'answer_', 'reply_to',
+                         'pin_', 'unpin_')
+    GLOBAL_ONLY_PREFIXES = ('delete_message',)
+
+    def __init__(self, bot, limiter: RateLimiter, retries: int = 3):
+        """
+        Wraps a bot.
+
+        :param bot: The TeleBot or AsyncTeleBot instance.
+        :param limiter: The limiter every outbound call goes through.
+        :param retries: How many times a call answered with 429 is retried.
+        """
+        self._bot = bot
+        self._limiter = limiter
+        self._retries = retries
+
+    @staticmethod
+    def _chat_key(args, kwargs) -> Hashable:
+        """
+        Returns the chat a call is addressed to: its chat_id argument, or the chat of the message it replies to.
+
+        :param args: Positional arguments of the call.
+        :param kwargs: Keyword arguments of the call.
+        :return: The chat ID, or None.
+        """
+        if 'chat_id' in kwargs:
+            return kwargs['chat_id']
+        if args:
+            first = args[0]
+            chat = getattr(first, 'chat', None)  # reply_to(message, ...)
+            if chat is not None:
+                return chat.id
+            if isinstance(first, int):  # chat_id; answer_* methods take query IDs (str) and only use the global bucket
+                return first
+        return None
+
+    def __getattr__(self, name):
+        attribute = getattr(self._bot, name)
+        if not callable(attribute) or not name.startswith(self.OUTBOUND_PREFIXES):
+            return attribute
+        limiter, retries = self._limiter, self._retries
+        per_chat = not name.startswith(self.GLOBAL_ONLY_PREFIXES)
+
+        if inspect.iscoroutinefunction(attribute):
+            @functools.wraps(attribute)
+            async def limited_async(*args, **kwargs):
+                key = self._chat_key(args, kwargs) if per_chat else None
+                for attempt in range(retries + 1):
+                    await limiter.acquire_async(key)
+                    try:
+                        with metrics.track('telegram', name):
+                            return await attribute(*args, **kwargs)
+                    except Exception as e:
+                        delay = _retry_after(e)
+                        if delay is None or attempt == retries:
+                            raise
+                        limiter.retry_after(delay, key)
+            return limited_async
+
+        @functools.wraps(attribute)
+        def limited(*args, **kwargs):
+            key = self._chat_key(args, kwargs) if per_chat else None
+            for attempt in range(retries + 1):
+                limiter.acquire(key)
+                try:
+                    with metrics.track('telegram', name):
+                        return attribute(*args, **kwargs)
+                except Exception as e:
+                    delay = _retry_after(e)
+                    if delay is None or attempt == retries:
+                        raise
+                    limiter.retry_after(delay, key)
+        return limited
@@ -0,0 +1,155 @@
+# site_API\async_core.py
+import asyncio
+from typing import Dict, Optional, Set
+
+import metrics
+from log_config import logger
+from rate_limit import RateLimiter, background
+from site_API.common.models import SearchQuery, parse_response
+from site_API.utils.async_transport import AsyncHttpTransport
+from site_API.utils.cache import ResponseCache
+
+
+class AsyncSiteApi:
+    """
+    Asynchronous interface to the UNOGs (Unofficial Netflix Online Global Search) API, used by the asyncio bot mode.
+    Like SiteApi it is stateless, shares the response cache and coalesces identical in-flight requests.
+
+    Attributes:
+        MAX_PREFETCH (int): Background page fetches allowed to be pending at once; further ones are skipped.
+    """
+    MAX_PREFETCH = 16
+
+    def __init__(self, SITE_API: str, HOST_API: str, transport: Optional[AsyncHttpTransport] = None,
+                 cache: Optional[ResponseCache] = None, limiter: Optional[RateLimiter] = None):
+        """
+        Initializes the AsyncSiteApi object with necessary API credentials.
+
+        :param SITE_API: API key for accessing the UNOGs API.
+        :param HOST_API: Host name for the UNOGs API.
+        :param transport: Shared pooled async HTTP transport; a default one is created when omitted.
+        :param cache: Optional response cache consulted before every request.
+        :param limiter: Optional rate limiter every upstream request waits for, to stay within the plan's limit.
+        """
+        self.url = "https://unogsng.p.rapidapi.com/search"
+
+        self.headers = {"X-RapidAPI-Key": SITE_API, "X-RapidAPI-Host": HOST_API}
+        self.transport = transport or AsyncHttpTransport()
+        self.cache = cache
+        self.limiter = limiter
+        self._in_flight: Dict[tuple, asyncio.Future] = {}
+        self._prefetching: Set[asyncio.Task] = set()  # strong references, tasks are otherwise only weakly held
+        self.coalesced = 0
+        self.prefetched = 0
+
+    async def _cache_get(self, query: SearchQuery):
+        """
+        Looks the query up in the cache. The on-disk tier is read in an executor so the event loop is not blocked.
+
+        :param query: The search query.
+        :return: The cached response or None.
+        """
+        if self.cache.disk is None:
+            return self.cache.get(query)
+        return await asyncio.get_running_loop().run_in_executor(None, self.cache.get, query)
+
+    async def _cache_put(self, query: SearchQuery, response_json):
+        """
+        Stores a response in the cache, writing the on-disk tier in an executor.
+
+        :param query: The query the response answers.
+        :param response_json: The API response.
+        :return: None
+        """
+        if self.cache.disk is None:
+            self.cache.put(query, response_json)
+        else:
+            await asyncio.get_running_loop().run_in_executor(None, self.cache.put, query, response_json)
+
+    async def search(self, query: SearchQuery):
+        """
+        Retrieves the items described by the query, from the cache when possible. Concurrent misses for the same
+        query share a single upstream request.
+
+        :param query: The search to perform.
+        :return: JSON response containing the matching movies or series.
+        """
+        with metrics.track('site_api', 'search'):
+            if self.cache is not None:
+                cached = await self._cache_get(query)
+                if cached is not None:
+                    return cached
+
+            key = query.key()
+            task = self._in_flight.get(key)
+            if task is not None:
+                self.coalesced += 1
+            else:
+                task = self._in_flight[key] = asyncio.ensure_future(self._fetch_and_cache(query))
+                task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+            return await asyncio.shield(task)
+
+    def prefetch(self, query: SearchQuery) -> Optional[asyncio.Task]:
+        """
+        Fetches a query into the cache in a background task (e.g. the next page while the user reads the current
+        one), at background priority. Nothing is done when the cache already holds it or too many are pending.
+
+        :param query: The search to warm.
+        :return: The background task, or None if it was not needed or skipped.
+        """
+        if self.cache is None or self.cache.expires_in(query) is not None or query.key() in self._in_flight:
+            return None
+        if len(self._prefetching) >= self.MAX_PREFETCH:
+            return None
+        task = asyncio.ensure_future(self._prefetch(query))
+        self._prefetching.add(task)
+        task.add_done_callback(self._prefetching.discard)
+        return task
+
+    async def _prefetch(self, query: SearchQuery):
+        """
+        Body of a background fetch started by prefetch().
+
+        :param query: The search to warm.
+        :return: None
+        """
+        try:
+            with background():
+                await self.search(query)
+            self.prefetched += 1
+        except Exception as e:
+            logger.error("Prefetch of page %s failed: %s", query, e)
+
+    async def _fetch_and_cache(self, query: SearchQuery):
+        """
+        Fetches the query and stores the response in the cache.
+
+        :param query: The search to perform.
+        :return: JSON response containing the matching movies or series.
+        """
+        response_json = await self.fetch(query)
+        if self.cache is not None:
+            await self._cache_put(query, response_json)
+        return response_json
+
+    async def fetch(self, query: SearchQuery):
+        """
+        Requests the items described by the query from the API, bypassing the cache. The body is parsed straight
+        into title records (see parse_response).
+
+        :param query: The search to perform.
+        :return: JSON response containing the matching movies or series.
+        """
+        if self.limiter is not None:
+            await self.limiter.acquire_async()
+        with metrics.track('site_api', 'fetch'):
+            return await self.transport.get_json(self.url, headers=self.headers, params=query.to_params(),
+                                                 loads=parse_response)
+
+    async def close(self):
+        """
+        Closes the underlying HTTP transport.
+
+        :return: None
+        """
+        await self.transport.close()
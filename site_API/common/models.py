@@ -0,0 +1,301 @@
+# site_API-common-models.py
+
+import html
+import json
+from dataclasses import dataclass, replace
+from typing import ClassVar, Dict, List, Optional, Tuple, Union
+
+try:  # in requirements.txt, several times faster than the json module on API responses; json is the fallback
+    import orjson
+except ImportError:
+    orjson = None
+
+
+@dataclass(frozen=True)
+class SearchQuery:
+    """
+    Immutable description of a single search against the UNOGs API. A new query is built for every user request,
+    so concurrent handlers never share mutable search parameters.
+
+    Attributes:
+        type (str): The type of content to search for ('movie' or 'series').
+        limit (int): The maximum number of results to retrieve.
+        start_rating (int or None): The lowest rating to include in search results.
+        end_rating (int or None): The highest rating to include in search results.
+        offset (int): Position of the first result to retrieve.
+        ORDER_BY (str): Sort order requested from the API.
+        AUDIO (str): Audio language requested from the API.
+        CALLBACK_PREFIX (str): Prefix of the callback data of the "next page" button.
+        MAX_LIMIT (int): Largest page size accepted from callback data.
+    """
+    type: str = "movie"
+    limit: int = 5
+    start_rating: Optional[int] = None
+    end_rating: Optional[int] = None
+    offset: int = 1
+
+    ORDER_BY: ClassVar[str] = "rating"
+    AUDIO: ClassVar[str] = "english"
+    CALLBACK_PREFIX: ClassVar[str] = "cb_next"
+    MAX_LIMIT: ClassVar[int] = 10
+
+    @classmethod
+    def high(cls, choice: str, limit: int) -> "SearchQuery":
+        """
+        Builds a query without any rating boundary filters.
+
+        :param choice: The type of content ('movie' or 'series').
+        :param limit: The maximum number of results to retrieve.
+        :return: The query for high-rated movies or series.
+        """
+        return cls(type=choice, limit=int(limit))
+
+    @classmethod
+    def low(cls, choice: str, limit: int) -> "SearchQuery":
+        """
+        Builds a query for items rated from 0 to 4.
+
+        :param choice: The type of content ('movie' or 'series').
+        :param limit: The maximum number of results to retrieve.
+        :return: The query for low-rated movies or series.
+        """
+        return cls(type=choice, limit=int(limit), start_rating=0, end_rating=4)
+
+    @classmethod
+    def custom(cls, choice: str, limit: int, low: int, high: int) -> "SearchQuery":
+        """
+        Builds a query for items within a custom rating range set by the user.
+
+        :param choice: The type of content ('movie' or 'series').
+        :param limit: The maximum number of results to retrieve.
+        :param low: The lowest rating to include in the search.
+        :param high: The highest rating to include in the search.
+        :return: The query for movies or series within the specified rating range.
+        """
+        return cls(type=choice, limit=int(limit), start_rating=int(low), end_rating=int(high))
+
+    @property
+    def label(self) -> str:
+        """
+        Upper-case name of the content type, as shown to the user.
+
+        :return: 'MOVIES' or 'SERIES'.
+        """
+        return 'MOVIES' if self.type == 'movie' else 'SERIES'
+
+    def next_page(self) -> "SearchQuery":
+        """
+        Builds the query of the page following this one.
+
+        :return: The same search, starting after the last result of this page.
+        """
+        return replace(self, offset=self.offset + self.limit)
+
+    def to_callback(self) -> str:
+        """
+        Encodes the query as callback data (Telegram allows 64 bytes), so a button can carry it without any state
+        kept on the server.
+
+        :return: The callback data, e.g. 'cb_next:movie:5:0:4:6'.
+        """
+        ratings = ['' if rating is None else str(rating) for rating in (self.start_rating, self.end_rating)]
+        return ':'.join([self.CALLBACK_PREFIX, self.type, str(self.limit), *ratings, str(self.offset)])
+
+    @classmethod
+    def from_callback(cls, data: str) -> Optional["SearchQuery"]:
+        """
+        Decodes callback data built by to_callback().
+
+        :param data: The callback data.
+        :return: The query, or None if the data is not a valid query.
+        """
+        parts = data.split(':')
+        if len(parts) != 6 or parts[0] != cls.CALLBACK_PREFIX or parts[1] not in ('movie', 'series'):
+            return None
+        try:
+            limit, offset = int(parts[2]), int(parts[5])
+            start_rating, end_rating = (int(part) if part else None for part in parts[3:5])
+        except ValueError:
+            return None
+        if not 1 <= limit <= cls.MAX_LIMIT or offset < 1:
+            return None
+        return cls(type=parts[1], limit=limit, start_rating=start_rating, end_rating=end_rating, offset=offset)
+
+    def key(self) -> Tuple:
+        """
+        Normalized, hashable identity of the query.
+
+        :return: A tuple with every field that affects the API response.
+        """
+        return self.type, self.limit, self.start_rating, self.end_rating, self.offset
+
+    def to_params(self) -> Dict[str, str]:
+        """
+        Converts the query into the query string parameters expected by the API.
+
+        :return: A dictionary of request parameters.
+        """
+        params = {"orderby": self.ORDER_BY,
+                  "limit": str(self.limit),
+                  "audio": self.AUDIO,
+                  "offset": str(self.offset),
+                  "type": self.type}
+        if self.start_rating is not None:
+            params["start_rating"] = str(self.start_rating)
+        if self.end_rating is not None:
+            params["end_rating"] = str(self.end_rating)
+        return params
+
+
+_COMMON_ENTITIES = (('&#39;', "'"), ('&quot;', '"'), ('&lt;', '<'), ('&gt;', '>'))
+
+
+def unescape(text: str) -> str:
+    """
+    Same result as html.unescape(), with a fast path for the few entities the API actually returns: they are
+    replaced with str.replace(), and html.unescape() only runs when other entities are left.
+
+    :param text: The text to unescape.
+    :return: The unescaped text.
+    """
+    if '&' not in text:
+        return text
+    fast = text
+    for entity, char in _COMMON_ENTITIES:
+        if entity in fast:
+            fast = fast.replace(entity, char)
+    if fast.count('&') == fast.count('&amp;'):  # '&amp;' goes last, so '&amp;lt;' becomes '&lt;' as it should
+        return fast.replace('&amp;', '&')
+    return html.unescape(text)
+
+
+def _number(value, convert):
+    """
+    Converts a numeric field of an API result, tolerating values such as '' or 'N/A': a bad field is dropped rather
+    than failing the whole response.
+
+    :param value: The raw value.
+    :param convert: int or float.
+    :return: The converted value, or None if it is missing or not a number.
+    """
+    try:
+        return convert(value) if value not in (None, '') else None
+    except (TypeError, ValueError):
+        return None
+
+
+class TitleRecord:
+    """
+    Compact record of a single search result, holding only the fields the bot uses. The API returns about fifteen
+    fields per title; records are what the response cache, the catalog and the delivery code keep instead of the
+    decoded dictionaries. The title and synopsis are HTML-unescaped once, when the response is parsed.
+
+    Attributes:
+        nfid (int or None): Netflix ID of the title.
+        title (str): Name of the title, unescaped.
+        synopsis (str): Short description of the title, unescaped.
+        imdbrating (float or None): IMDb rating of the title, if known.
+        img (str): URL of the poster image.
+    """
+    __slots__ = ('nfid', 'title', 'synopsis', 'imdbrating', 'img')
+
+    def __init__(self, nfid: Optional[int], title: str, synopsis: str, imdbrating: Optional[float], img: str):
+        self.nfid = nfid
+        self.title = title
+        self.synopsis = synopsis
+        self.imdbrating = imdbrating
+        self.img = img
+
+    @classmethod
+    def from_api(cls, item: Dict) -> "TitleRecord":
+        """
+        Builds a record from a result of the API, unescaping its texts.
+
+        :param item: A single entry of the 'results' list of an API response.
+        :return: The record.
+        """
+        return cls(_number(item.get("nfid"), int),
+                   unescape(item.get("title") or ''),
+                   unescape(item.get("synopsis") or ''),
+                   _number(item.get("imdbrating"), float),
+                   item.get("img") or '')
+
+    @classmethod
+    def from_dict(cls, item: Dict) -> "TitleRecord":
+        """
+        Builds a record from the output of to_dict(); the texts are already unescaped.
+
+        :param item: The dictionary.
+        :return: The record.
+        """
+        return cls(item["nfid"], item["title"], item["synopsis"], item["imdbrating"], item["img"])
+
+    def to_dict(self) -> Dict:
+        """
+        Converts the record into a dictionary that can be serialized as JSON.
+
+        :return: A dictionary with every field of the record.
+        """
+        return {"nfid": self.nfid, "title": self.title, "synopsis": self.synopsis, "imdbrating": self.imdbrating,
+                "img": self.img}
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, TitleRecord) and all(
+            getattr(self, field) == getattr(other, field) for field in self.__slots__)
+
+    def __repr__(self) -> str:
+        return f"TitleRecord(nfid={self.nfid!r}, title={self.title!r}, imdbrating={self.imdbrating!r})"
+
+
+def loads(data: Union[bytes, str]):
+    """
+    Decodes JSON with orjson when it is installed, else with the json module.
+
+    :param data: The JSON document.
+    :return: The decoded value.
+    """
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+def dumps(value) -> str:
+    """
+    Encodes a value as JSON with orjson when it is installed, else with the json module.
+
+    :param value: The value.
+    :return: The JSON document.
+    """
+    return orjson.dumps(value).decode() if orjson is not None else json.dumps(value)
+
+
+def parse_response(data: Union[bytes, str, Dict]) -> Dict:
+    """
+    Decodes a search response of the API and replaces its results with TitleRecord objects, dropping every other
+    field. Responses without results (errors, quota messages) are returned as decoded.
+
+    :param data: The response body, or the already decoded response.
+    :return: {"results": [TitleRecord, ...]}, or the decoded response when it has no results.
+    """
+    payload = loads(data) if isinstance(data, (bytes, str)) else data
+    if not isinstance(payload, dict) or not isinstance(payload.get("results"), list):
+        return payload
+    return {"results": [TitleRecord.from_api(item) for item in payload["results"]]}
+
+
+def dump_results(results: List[TitleRecord]) -> str:
+    """
+    Serializes records as JSON, e.g. for the on-disk response cache.
+
+    :param results: The records.
+    :return: The JSON document.
+    """
+    return dumps([record.to_dict() for record in results])
+
+
+def load_results(data: Union[bytes, str]) -> List[TitleRecord]:
+    """
+    Restores records serialized by dump_results().
+
+    :param data: The JSON document.
+    :return: The records.
+    """
+    return [TitleRecord.from_dict(item) for item in loads(data)]
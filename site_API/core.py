@@ -1,99 +1,167 @@
 # site_API\core.py
-import requests
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+
+import metrics
+from log_config import logger
+from rate_limit import RateLimiter, background
+from site_API.common.models import SearchQuery, parse_response
+from site_API.utils.cache import ResponseCache
+from site_API.utils.singleflight import SingleFlight
+from site_API.utils.transport import HttpTransport
 
 
 class SiteApi:
     """
     Provides an interface to interact with the UNOGs (Unofficial Netflix Online Global Search) API to retrieve movie
     and series data based on various search criteria.
+
+    The API object is stateless: every call receives its own SearchQuery, so one instance can safely be shared by
+    all of the bot's worker threads.
+
+    Attributes:
+        MAX_PREFETCH (int): Background page fetches allowed to be pending at once; further ones are skipped.
     """
-    def __init__(self, SITE_API: str, HOST_API: str):
+    MAX_PREFETCH = 16
+
+    def __init__(self, SITE_API: str, HOST_API: str, transport: Optional[HttpTransport] = None,
+                 cache: Optional[ResponseCache] = None, limiter: Optional[RateLimiter] = None):
         """
-        Initializes the SiteApi object with necessary API credentials and default search parameters.
+        Initializes the SiteApi object with necessary API credentials.
 
         :param SITE_API: API key for accessing the UNOGs API.
         :param HOST_API: Host name for the UNOGs API.
+        :param transport: Shared pooled HTTP transport; a default one is created when omitted.
+        :param cache: Optional response cache consulted before every request.
+        :param limiter: Optional rate limiter every upstream request waits for, to stay within the plan's limit.
         """
         self.url = "https://unogsng.p.rapidapi.com/search"
 
-        self.params = {"orderby": "rating",
-                       "limit": "5",
-                       "audio": "english",
-                       "offset": "1",
-                       "type": "movie"}
-
         self.headers = {"X-RapidAPI-Key": SITE_API, "X-RapidAPI-Host": HOST_API}
+        self.transport = transport or HttpTransport()
+        self.cache = cache
+        self.limiter = limiter
+        self.flight = SingleFlight()
+        self._prefetch_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='page-prefetch')
+        self._prefetching = set()  # keys of the queries being fetched in the background
+        self._prefetch_lock = threading.Lock()
+        self.prefetched = 0
 
-    def set_choice(self, choice: str):
+    def search(self, query: SearchQuery):
         """
-        Sets the type of content to search for in the API (either 'movie' or 'series').
+        Retrieves the items described by the query, from the cache when possible. Concurrent misses for the same
+        query share a single upstream request.
 
-        :param choice: The type of content ('movie' or 'series').
+        :param query: The search to perform.
+        :return: JSON response containing the matching movies or series.
         """
-        self.params["type"] = choice
+        with metrics.track('site_api', 'search'):
+            if self.cache is not None:
+                cached = self.cache.get(query)
+                if cached is not None:
+                    return cached
 
-    def set_lim(self, lim: str):
+            return self.flight.do(query.key(), lambda: self._fetch_and_cache(query))
+
+    def prefetch(self, query: SearchQuery) -> Optional[Future]:
         """
-        Sets the limit of results to return from the API.
+        Fetches a query into the cache in the background (e.g. the next page while the user reads the current
+        one), at background priority. Nothing is done when the cache already holds it or it is already pending.
 
-        :param lim: The maximum number of results to retrieve.
+        :param query: The search to warm.
+        :return: The future of the background fetch, or None if it was not needed or skipped.
         """
-        self.params["limit"] = lim
+        if self.cache is None or self.cache.expires_in(query) is not None:
+            return None
+        key = query.key()
+        with self._prefetch_lock:
+            if key in self._prefetching or len(self._prefetching) >= self.MAX_PREFETCH:
+                return None
+            self._prefetching.add(key)
+        return self._prefetch_pool.submit(self._prefetch, query)
 
-    def set_low(self, low: str):
+    def _prefetch(self, query: SearchQuery):
         """
-        Sets the lower boundary for the movie/series ratings.
+        Body of a background fetch started by prefetch().
 
-        :param low: The lowest rating to include in search results.
+        :param query: The search to warm.
+        :return: None
         """
-        self.params["start_rating"] = low
+        try:
+            with background():
+                self.search(query)
+            self.prefetched += 1
+        except Exception as e:
+            logger.error("Prefetch of page %s failed: %s", query, e)
+        finally:
+            with self._prefetch_lock:
+                self._prefetching.discard(query.key())
 
-    def _set_high(self, high: str):
+    def refresh(self, query: SearchQuery):
         """
-        Sets the upper boundary for the movie/series ratings.
+        Fetches the query again and replaces its cached response, even if the cached one is still valid.
 
-        :param high: The highest rating to include in search results.
+        :param query: The search to refresh.
+        :return: JSON response containing the matching movies or series.
         """
-        self.params["end_rating"] = high
+        return self.flight.do(query.key(), lambda: self._fetch_and_cache(query))
 
-    def get_high(self):
+    def _fetch_and_cache(self, query: SearchQuery):
         """
-        Retrieves items without any specific rating boundary filters. Resets any previously set rating filters.
+        Fetches the query and stores the response in the cache.
 
-        :return: JSON response containing high-rated movies or series.
+        :param query: The search to perform.
+        :return: JSON response containing the matching movies or series.
         """
-        if "end_rating" in self.params:
-            self.params.pop("end_rating")
-        if "start_rating" in self.params:
-            self.params.pop("start_rating")
+        response_json = self.fetch(query)
+        if self.cache is not None:
+            self.cache.put(query, response_json)
+        return response_json
 
-        response = requests.get(self.url, headers=self.headers, params=self.params)
+    def fetch(self, query: SearchQuery):
+        """
+        Requests the items described by the query from the API, bypassing the cache. The body is parsed straight
+        into title records (see parse_response).
+
+        :param query: The search to perform.
+        :return: JSON response containing the matching movies or series.
+        """
+        if self.limiter is not None:
+            self.limiter.acquire()
+        with metrics.track('site_api', 'fetch'):
+            response = self.transport.get(self.url, headers=self.headers, params=query.to_params())
 
-        return response.json()
+        return parse_response(response.content)
 
-    def get_low(self):
+    def get_high(self, choice: str, limit: int):
         """
-        Retrieves items rated from 0 to 4. Uses predefined methods to set the rating boundaries.
+        Retrieves items without any specific rating boundary filters.
 
-        :return: JSON response containing low-rated movies or series.
+        :param choice: The type of content ('movie' or 'series').
+        :param limit: The maximum number of results to retrieve.
+        :return: JSON response containing high-rated movies or series.
         """
-        self.set_low("0")
-        self._set_high("4")
+        return self.search(SearchQuery.high(choice, limit))
 
-        response = requests.get(self.url, headers=self.headers, params=self.params)
+    def get_low(self, choice: str, limit: int):
+        """
+        Retrieves items rated from 0 to 4.
 
-        return response.json()
+        :param choice: The type of content ('movie' or 'series').
+        :param limit: The maximum number of results to retrieve.
+        :return: JSON response containing low-rated movies or series.
+        """
+        return self.search(SearchQuery.low(choice, limit))
 
-    def get_custom(self, high: str):
+    def get_custom(self, choice: str, limit: int, low: int, high: int):
         """
-        Retrieves items up to a custom highest rating set by the user.
+        Retrieves items within a custom rating range set by the user.
 
+        :param choice: The type of content ('movie' or 'series').
+        :param limit: The maximum number of results to retrieve.
+        :param low: The lowest rating to include in the search.
         :param high: The highest rating to include in the search.
-        :return: JSON response containing movies or series up to the specified rating.
+        :return: JSON response containing movies or series within the specified rating range.
         """
-        self._set_high(high)
-
-        response = requests.get(self.url, headers=self.headers, params=self.params)
-
-        return response.json()
-    
\ No newline at end of file
+        return self.search(SearchQuery.custom(choice, limit, low, high))
@@ -0,0 +1,57 @@
+# site_API\utils\async_catalog.py
+
+import asyncio
+from typing import Dict, Optional
+
+from rate_limit import RateLimiter
+from site_API.async_core import AsyncSiteApi
+from site_API.common.models import SearchQuery
+from site_API.utils.async_transport import AsyncHttpTransport
+from site_API.utils.cache import ResponseCache
+from site_API.utils.catalog import TitleCatalog
+
+
+class AsyncCatalogSiteApi(AsyncSiteApi):
+    """
+    Asynchronous site API backed by the local title catalog, the asyncio counterpart of CatalogSiteApi. The catalog
+    queries are blocking database calls and run in the default executor.
+    """
+    def __init__(self, SITE_API: str, HOST_API: str, transport: Optional[AsyncHttpTransport] = None,
+                 cache: Optional[ResponseCache] = None, max_age: float = 86400.0,
+                 limiter: Optional[RateLimiter] = None):
+        """
+        Initializes the catalog backed API.
+
+        :param SITE_API: API key for accessing the UNOGs API.
+        :param HOST_API: Host name for the UNOGs API.
+        :param transport: Shared pooled async HTTP transport; a default one is created when omitted.
+        :param cache: Optional response cache consulted before the catalog.
+        :param max_age: Seconds after which catalog data is refreshed from the API.
+        :param limiter: Optional rate limiter every upstream request waits for.
+        """
+        super().__init__(SITE_API, HOST_API, transport, cache, limiter)
+        self.catalog = TitleCatalog(max_age)
+
+    async def fetch(self, query: SearchQuery):
+        """
+        Answers the query from the catalog, or from the API when the catalog misses or cannot be read.
+
+        :param query: The search to perform.
+        :return: JSON response containing the matching movies or series.
+        """
+        loop = asyncio.get_running_loop()
+        response_json, sync = await loop.run_in_executor(None, self.catalog.local, query)
+        if response_json is not None:
+            return response_json
+        response_json = await super().fetch(query)
+        if isinstance(response_json, dict) and "results" in response_json:
+            await loop.run_in_executor(None, self.catalog.store, query, response_json["results"], sync)
+        return response_json
+
+    def stats(self) -> Dict:
+        """
+        Returns how many searches were answered locally and how many went to the API.
+
+        :return: A dictionary with the catalog counters.
+        """
+        return self.catalog.stats()
@@ -0,0 +1,116 @@
+# site_API\utils\async_transport.py
+
+import asyncio
+import json
+import time
+from typing import Callable, Dict, Optional
+
+import aiohttp
+
+from log_config import logger
+
+
+class AsyncHttpTransport:
+    """
+    Asynchronous counterpart of HttpTransport built on a pooled aiohttp session. Requests share keep-alive
+    connections, respect connect/read timeouts and are retried a bounded number of times with backoff.
+
+    Attributes:
+        RETRY_STATUSES (tuple of int): HTTP statuses that are retried before giving up.
+    """
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(self, pool_size: int = 100, connect_timeout: float = 3.05, read_timeout: float = 15.0,
+                 retries: int = 2, backoff: float = 0.5):
+        """
+        Initializes the transport. The session is created lazily inside the running event loop.
+
+        :param pool_size: Maximum number of simultaneous connections.
+        :param connect_timeout: Seconds to wait for the TCP/TLS connection to be established.
+        :param read_timeout: Seconds to wait for the server to send a response.
+        :param retries: How many times a failed request is retried.
+        :param backoff: Backoff factor between retries (0.5 -> 0.5s, 1s, 2s, ...).
+        """
+        self.pool_size = pool_size
+        self.timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._requests = 0
+        self._errors = 0
+        self._in_flight = 0
+        self._peak_in_flight = 0
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """
+        Returns the pooled session, creating it on first use.
+
+        :return: The aiohttp session.
+        """
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        return self._session
+
+    async def get_json(self, url: str, headers: Optional[Dict] = None, params: Optional[Dict] = None,
+                       loads: Callable = json.loads):
+        """
+        Sends a GET request and decodes the JSON body.
+
+        :param url: The URL to request.
+        :param headers: Optional request headers.
+        :param params: Optional query string parameters.
+        :param loads: Function decoding the body text, e.g. a faster parser or one building records.
+        :return: The decoded JSON response.
+        """
+        self._in_flight += 1
+        self._peak_in_flight = max(self._peak_in_flight, self._in_flight)
+        start = time.perf_counter()
+        try:
+            for attempt in range(self.retries + 1):
+                last = attempt == self.retries
+                try:
+                    async with self._get_session().get(url, headers=headers, params=params) as response:
+                        if response.status in self.RETRY_STATUSES and not last:
+                            retry_after = response.headers.get("Retry-After")
+                            delay = float(retry_after) if retry_after and retry_after.isdigit() else None
+                        else:
+                            return await response.json(content_type=None, loads=loads)
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    if last:
+                        self._errors += 1
+                        logger.error("HTTP request to %s failed: %s", url, e)
+                        raise
+                    delay = None
+                await asyncio.sleep(delay if delay is not None else self.backoff * (2 ** attempt))
+        finally:
+            elapsed = time.perf_counter() - start
+            self._in_flight -= 1
+            self._requests += 1
+            self._latency_total += elapsed
+            self._latency_max = max(self._latency_max, elapsed)
+
+    def stats(self) -> Dict:
+        """
+        Returns pool and latency statistics, useful to size the pool.
+
+        :return: A dictionary with request counters and latency figures.
+        """
+        return {"pool_size": self.pool_size,
+                "requests": self._requests,
+                "errors": self._errors,
+                "in_flight": self._in_flight,
+                "peak_in_flight": self._peak_in_flight,
+                "latency_avg": self._latency_total / self._requests if self._requests else 0.0,
+                "latency_max": self._latency_max}
+
+    async def close(self):
+        """
+        Closes the session and every pooled connection.
+
+        :return: None
+        """
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
@@ -0,0 +1,237 @@
+# site_API\utils\cache.py
+
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from log_config import logger
+from site_API.common.models import SearchQuery, dump_results, load_results
+
+
+def _cache_key(query: SearchQuery) -> Tuple:
+    """
+    Normalized cache key of a query. The limit is left out, so a smaller limit can be served from a larger result.
+
+    :param query: The search query.
+    :return: A hashable tuple identifying the query.
+    """
+    return query.type, query.start_rating, query.end_rating, query.offset
+
+
+def _covers(limit: int, payload: Dict, query: SearchQuery) -> bool:
+    """
+    Checks whether a response fetched with the given limit can answer the query.
+
+    :param limit: The limit the response was fetched with.
+    :param payload: The cached API response.
+    :param query: The query to answer.
+    :return: True if the cached response contains every result the query asks for.
+    """
+    return limit >= query.limit or len(payload["results"]) < limit  # a short page means there is nothing more
+
+
+def _trim(payload: Dict, query: SearchQuery) -> Dict:
+    """
+    Cuts a cached response down to the limit of the query.
+
+    :param payload: The cached API response.
+    :param query: The query to answer.
+    :return: A response with at most query.limit results.
+    """
+    if len(payload["results"]) <= query.limit:
+        return payload
+    return dict(payload, results=payload["results"][:query.limit])
+
+
+class SqliteCacheTier:
+    """
+    Optional on-disk tier of the response cache stored in the application database. Entries survive restarts and are
+    consulted when the in-memory tier misses.
+
+    Attributes:
+        PURGE_EVERY (int): Number of writes between two deletions of expired rows.
+    """
+    PURGE_EVERY = 100
+
+    def __init__(self):
+        """
+        Initializes the tier. The model is imported here so the in-memory cache has no database dependency.
+        """
+        from database.common.models import CachedResponse
+        self.model = CachedResponse
+        self._writes = 0
+
+    def get(self, key: Tuple) -> Optional[Tuple[float, int, Dict]]:
+        """
+        Reads a non-expired entry.
+
+        :param key: The normalized cache key.
+        :return: A tuple (expires_at timestamp, limit, payload) or None.
+        """
+        try:
+            row = (self.model.select()
+                   .where((self.model.key == json.dumps(key)) & (self.model.expires_at > datetime.now()))
+                   .first())
+        except Exception as e:
+            logger.error("Failed to read cached response: %s", e)
+            return None
+        if row is None:
+            return None
+        try:
+            results = load_results(row.payload)
+        except (ValueError, TypeError, KeyError):  # written by a version that stored whole responses
+            return None
+        return row.expires_at.timestamp(), row.limit, {"results": results}
+
+    def put(self, key: Tuple, expires_at: float, limit: int, payload: Dict):
+        """
+        Writes or replaces an entry.
+
+        :param key: The normalized cache key.
+        :param expires_at: Expiry time as a UNIX timestamp.
+        :param limit: The limit the response was fetched with.
+        :param payload: The parsed API response; only its title records are stored.
+        :return: None
+        """
+        try:
+            (self.model
+             .insert(key=json.dumps(key), limit=limit, payload=dump_results(payload["results"]),
+                     expires_at=datetime.fromtimestamp(expires_at))
+             .on_conflict_replace()
+             .execute())
+            self._writes += 1
+            if self._writes % self.PURGE_EVERY == 0:
+                self.model.delete().where(self.model.expires_at <= datetime.now()).execute()
+        except Exception as e:
+            logger.error("Failed to store cached response: %s", e)
+
+
+class ResponseCache:
+    """
+    Bounded in-memory cache of site API responses with a per-entry TTL and LRU eviction. Responses are keyed by the
+    normalized query parameters, and a response fetched with a larger limit also answers smaller limits.
+
+    Attributes:
+        max_entries (int): Maximum number of responses kept in memory.
+        ttl (float): Seconds a response stays valid.
+        disk (SqliteCacheTier or None): Optional on-disk tier.
+    """
+    def __init__(self, max_entries: int = 256, ttl: float = 3600.0, disk: Optional[SqliteCacheTier] = None):
+        """
+        Initializes an empty cache.
+
+        :param max_entries: Maximum number of responses kept in memory.
+        :param ttl: Seconds a response stays valid.
+        :param disk: Optional on-disk tier consulted on in-memory misses.
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk = disk
+        self._entries = OrderedDict()  # key -> (expires_at, limit, payload), least recently used first
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, query: SearchQuery) -> Optional[Dict]:
+        """
+        Looks up a fresh response that answers the query.
+
+        :param query: The search query.
+        :return: The cached response trimmed to the query limit, or None on a miss.
+        """
+        key = _cache_key(query)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= now:
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is not None and _covers(entry[1], entry[2], query):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return _trim(entry[2], query)
+
+        if self.disk is not None:
+            entry = self.disk.get(key)
+            if entry is not None and _covers(entry[1], entry[2], query):
+                with self._lock:
+                    self._insert(key, entry)
+                    self.hits += 1
+                    self.disk_hits += 1
+                return _trim(entry[2], query)
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def expires_in(self, query: SearchQuery) -> Optional[float]:
+        """
+        Tells how long the in-memory entry answering the query stays valid. Does not count as a lookup.
+
+        :param query: The search query.
+        :return: Seconds until expiry, or None if no entry answers the query.
+        """
+        with self._lock:
+            entry = self._entries.get(_cache_key(query))
+        if entry is None or not _covers(entry[1], entry[2], query):
+            return None
+        return max(entry[0] - time.time(), 0.0)
+
+    def put(self, query: SearchQuery, payload: Dict):
+        """
+        Stores a response. Responses without results (errors, quota messages) are not cached, and a fresh entry
+        fetched with a larger limit is not replaced by a smaller one.
+
+        :param query: The query the response answers.
+        :param payload: The API response.
+        :return: None
+        """
+        if not isinstance(payload, dict) or "results" not in payload:
+            return
+        key = _cache_key(query)
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            current = self._entries.get(key)
+            if current is not None and current[0] > time.time() and current[1] > query.limit:
+                return
+            self._insert(key, (expires_at, query.limit, payload))
+        if self.disk is not None:
+            self.disk.put(key, expires_at, query.limit, payload)
+
+    def _insert(self, key: Tuple, entry: Tuple[float, int, Dict]):
+        """
+        Inserts an entry and evicts the least recently used ones above the size bound. Caller holds the lock.
+
+        :param key: The normalized cache key.
+        :param entry: A tuple (expires_at, limit, payload).
+        :return: None
+        """
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> Dict:
+        """
+        Returns the cache counters.
+
+        :return: A dictionary with hit, miss and eviction counters and the current size.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"size": len(self._entries),
+                    "max_entries": self.max_entries,
+                    "hits": self.hits,
+                    "disk_hits": self.disk_hits,
+                    "misses": self.misses,
+                    "evictions": self.evictions,
+                    "expirations": self.expirations,
+                    "hit_ratio": self.hits / lookups if lookups else 0.0}
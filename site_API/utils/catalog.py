@@ -0,0 +1,198 @@
+# site_API\utils\catalog.py
+
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from peewee import OperationalError
+
+from database.common.models import Title, CatalogSync
+from database.connection import db
+from log_config import logger
+from rate_limit import RateLimiter
+from site_API.utils.cache import ResponseCache
+from site_API.common.models import SearchQuery, TitleRecord
+from site_API.core import SiteApi
+from site_API.utils.transport import HttpTransport
+
+
+def _sync_key(query: SearchQuery) -> str:
+    """
+    Key of the synchronization record of a query: the content type and rating range, without limit and offset.
+
+    :param query: The search query.
+    :return: The record key.
+    """
+    return f"{query.type}:{query.start_rating}:{query.end_rating}"
+
+
+def _to_result(title: Title) -> TitleRecord:
+    """
+    Converts a stored title into the record returned by the site API.
+
+    :param title: The stored title.
+    :return: The title record.
+    """
+    return TitleRecord(title.nfid, title.title, title.synopsis, title.imdbrating, title.img)
+
+
+class TitleCatalog:
+    """
+    Local title catalog: searches are answered with indexed range queries on the title table when the catalog
+    covers the requested results and they are fresh. API results are copied into it. The site API classes of both
+    bot modes consult it before the remote API (CatalogSiteApi, async_catalog.AsyncCatalogSiteApi).
+    """
+    def __init__(self, max_age: float = 86400.0):
+        """
+        Initializes the catalog.
+
+        :param max_age: Seconds after which catalog data is refreshed from the API.
+        """
+        self.max_age = timedelta(seconds=max_age)
+        self.local_hits = 0
+        self.remote_calls = 0
+
+    def local(self, query: SearchQuery) -> Tuple[Optional[Dict], Optional[CatalogSync]]:
+        """
+        Answers the query from the catalog if it covers it. A catalog that cannot be read is treated as a miss.
+
+        :param query: The search to perform.
+        :return: The response, or None if the API must be called; and the synchronization record of the search, to
+                 pass to store() with the API results.
+        """
+        try:
+            sync = CatalogSync.get_or_none(CatalogSync.key == _sync_key(query))
+        except OperationalError as e:  # e.g. a locked database or a missing table
+            logger.error("Catalog synchronization lookup failed: %s", e)
+            sync = None
+        covered = sync is not None and (sync.complete or sync.depth >= query.offset - 1 + query.limit)
+        if covered and datetime.now() - sync.fetched_at < self.max_age:
+            results = self.lookup(query)
+            if results is not None:
+                self.local_hits += 1
+                return {"results": results}, sync
+        self.remote_calls += 1
+        return None, sync
+
+    @staticmethod
+    def lookup(query: SearchQuery) -> Optional[List[TitleRecord]]:
+        """
+        Runs the indexed range query for a search on the title table.
+
+        :param query: The search to perform.
+        :return: The matching title records, or None if the query fails.
+        """
+        conditions = [Title.type == query.type]
+        if query.start_rating is not None:
+            conditions.append(Title.imdbrating >= query.start_rating)
+        if query.end_rating is not None:
+            conditions.append(Title.imdbrating <= query.end_rating)
+        rows = (Title.select()
+                .where(*conditions)
+                .order_by(Title.imdbrating.desc(nulls='LAST'), Title.nfid)
+                .offset(query.offset - 1)
+                .limit(query.limit))
+        try:
+            return [_to_result(row) for row in rows]
+        except Exception as e:
+            logger.error("Catalog lookup failed: %s", e)
+            return None
+
+    def store(self, query: SearchQuery, results: List[TitleRecord], sync: Optional[CatalogSync] = None):
+        """
+        Copies API results into the catalog and extends the synchronization record of the search. Texts are stored
+        unescaped, as parsed.
+
+        :param query: The search the results answer.
+        :param results: The title records returned by the API.
+        :param sync: The current synchronization record of the search, if any.
+        :return: None
+        """
+        now = datetime.now()
+        rows = []
+        for record in results:
+            if record.nfid is None:
+                continue
+            rows.append({"nfid": record.nfid,
+                         "type": query.type,
+                         "title": record.title,
+                         "synopsis": record.synopsis,
+                         "imdbrating": record.imdbrating,
+                         "img": record.img,
+                         "updated_at": now})
+
+        depth = query.offset - 1 + len(rows)
+        complete = len(results) < query.limit
+        if sync is not None and now - sync.fetched_at < self.max_age:
+            if query.offset - 1 > sync.depth:  # a gap: only the leading results are covered
+                depth, complete = sync.depth, sync.complete
+            else:
+                depth = max(depth, sync.depth)
+        elif query.offset > 1:  # nothing fresh before this page
+            depth, complete = 0, False
+        try:
+            with db.atomic():
+                if rows:
+                    (Title.insert_many(rows)
+                     .on_conflict(conflict_target=[Title.nfid],
+                                  preserve=[Title.type, Title.title, Title.synopsis, Title.imdbrating, Title.img,
+                                            Title.updated_at])
+                     .execute())
+                (CatalogSync
+                 .insert(key=_sync_key(query), depth=depth, complete=complete, fetched_at=now)
+                 .on_conflict_replace()
+                 .execute())
+        except Exception as e:
+            logger.error("Failed to store titles in the catalog: %s", e)
+
+    def stats(self) -> Dict:
+        """
+        Returns how many searches were answered locally and how many went to the API.
+
+        :return: A dictionary with the catalog counters.
+        """
+        return {"local_hits": self.local_hits, "remote_calls": self.remote_calls}
+
+
+class CatalogSiteApi(SiteApi):
+    """
+    Site API backed by the local title catalog: the remote API is only called when the catalog does not cover the
+    requested results or they are stale. Every API response is copied into the catalog.
+    """
+    def __init__(self, SITE_API: str, HOST_API: str, transport: Optional[HttpTransport] = None,
+                 cache: Optional[ResponseCache] = None, max_age: float = 86400.0,
+                 limiter: Optional[RateLimiter] = None):
+        """
+        Initializes the catalog backed API.
+
+        :param SITE_API: API key for accessing the UNOGs API.
+        :param HOST_API: Host name for the UNOGs API.
+        :param transport: Shared pooled HTTP transport; a default one is created when omitted.
+        :param cache: Optional response cache consulted before the catalog.
+        :param max_age: Seconds after which catalog data is refreshed from the API.
+        :param limiter: Optional rate limiter every upstream request waits for.
+        """
+        super().__init__(SITE_API, HOST_API, transport, cache, limiter)
+        self.catalog = TitleCatalog(max_age)
+
+    def fetch(self, query: SearchQuery):
+        """
+        Answers the query from the catalog, or from the API when the catalog misses or cannot be read.
+
+        :param query: The search to perform.
+        :return: JSON response containing the matching movies or series.
+        """
+        response_json, sync = self.catalog.local(query)
+        if response_json is not None:
+            return response_json
+        response_json = super().fetch(query)
+        if isinstance(response_json, dict) and "results" in response_json:
+            self.catalog.store(query, response_json["results"], sync)
+        return response_json
+
+    def stats(self) -> Dict:
+        """
+        Returns how many searches were answered locally and how many went to the API.
+
+        :return: A dictionary with the catalog counters.
+        """
+        return self.catalog.stats()
@@ -0,0 +1,124 @@
+# site_API\utils\prefetch.py
+
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List
+
+from log_config import logger
+from rate_limit import background
+from site_API.common.models import SearchQuery
+
+
+class Prefetcher:
+    """
+    Background scheduler that keeps the most popular searches warm in the response cache. Queries whose cached
+    response is missing or about to expire are refreshed ahead of time, within a budget of upstream requests per
+    minute so the API quota cannot be exhausted.
+    """
+    def __init__(self, site, queries_source: Callable[[], List[SearchQuery]], budget_per_minute: int = 30,
+                 interval: float = 60.0, margin: float = 300.0):
+        """
+        Initializes the prefetcher.
+
+        :param site: The SiteApi instance whose cache is kept warm.
+        :param queries_source: Callable returning the hot queries, most important first.
+        :param budget_per_minute: Maximum number of refresh requests sent upstream per minute.
+        :param interval: Seconds between two scheduling rounds.
+        :param margin: Queries expiring within this many seconds are refreshed.
+        """
+        self.site = site
+        self.queries_source = queries_source
+        self.budget_per_minute = budget_per_minute
+        self.interval = interval
+        self.margin = margin
+        self.refreshed = 0
+        self.failed = 0
+        self.skipped = 0  # refreshes postponed because the budget was spent
+        self._sent = deque()  # timestamps of refreshes in the last minute
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="prefetcher", daemon=True)
+
+    def start(self):
+        """
+        Starts the scheduler thread.
+
+        :return: None
+        """
+        self._thread.start()
+        logger.info("Prefetcher started with a budget of %s requests per minute", self.budget_per_minute)
+
+    def stop(self):
+        """
+        Stops the scheduler thread and waits for the current round to finish.
+
+        :return: None
+        """
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        logger.info("Prefetcher stopped: %s", self.stats())
+
+    def _take_budget(self) -> bool:
+        """
+        Spends one request from the per-minute budget.
+
+        :return: True if a request may be sent now.
+        """
+        now = time.monotonic()
+        while self._sent and now - self._sent[0] >= 60:
+            self._sent.popleft()
+        if len(self._sent) >= self.budget_per_minute:
+            return False
+        self._sent.append(now)
+        return True
+
+    def run_once(self):
+        """
+        Runs a single scheduling round: refreshes every hot query that is missing or about to expire.
+
+        :return: None
+        """
+        try:
+            queries = self.queries_source()
+        except Exception as e:
+            logger.error("Prefetcher could not load hot queries: %s", e)
+            return
+        for query in queries:
+            if self._stop.is_set():
+                return
+            remaining = self.site.cache.expires_in(query)
+            if remaining is not None and remaining > self.margin:
+                continue
+            if not self._take_budget():
+                self.skipped += 1
+                continue
+            try:
+                with background():  # leaves the reserved request rate to users' searches
+                    self.site.refresh(query)
+                self.refreshed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error("Prefetch of %s failed: %s", query, e)
+
+    def _run(self):
+        """
+        Scheduler loop executed by the background thread.
+
+        :return: None
+        """
+        while not self._stop.is_set():
+            self.run_once()
+            logger.info("Prefetcher round finished: %s", self.stats())
+            self._stop.wait(self.interval)
+
+    def stats(self) -> Dict:
+        """
+        Returns the prefetch counters together with the hit ratio achieved by the response cache.
+
+        :return: A dictionary with refresh counters and the cache hit ratio.
+        """
+        return {"refreshed": self.refreshed,
+                "failed": self.failed,
+                "skipped": self.skipped,
+                "hit_ratio": self.site.cache.stats()["hit_ratio"]}
@@ -0,0 +1,86 @@
+# site_API\utils\singleflight.py
+
+import threading
+from typing import Any, Callable, Dict, Hashable
+
+
+class _Call:
+    """
+    A single in-flight call that any number of callers can wait on.
+
+    Attributes:
+        done (Event): Set once the call has finished.
+        result (Any): The value returned by the call.
+        error (Exception or None): The exception raised by the call, if any.
+        waiters (int): Number of callers that joined the call after it started.
+    """
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Deduplicates concurrent calls with the same key: the first caller runs the function, and callers arriving while it
+    is still running wait for it and share its result (or its exception).
+    """
+    def __init__(self):
+        """
+        Initializes an empty registry of in-flight calls.
+        """
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self.calls = 0
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """
+        Runs fn once for all concurrent callers using the same key.
+
+        :param key: Normalized identity of the call.
+        :param fn: The function to run.
+        :return: The value returned by fn.
+        """
+        with self._lock:
+            self.calls += 1
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.coalesced += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self.executed += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def stats(self) -> Dict:
+        """
+        Returns how many calls were made, executed and coalesced.
+
+        :return: A dictionary with the counters and the number of calls currently in flight.
+        """
+        with self._lock:
+            return {"calls": self.calls,
+                    "executed": self.executed,
+                    "coalesced": self.coalesced,
+                    "in_flight": len(self._calls)}
@@ -0,0 +1,116 @@
+# site_API\utils\transport.py
+
+import threading
+import time
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from log_config import logger
+
+
+class HttpTransport:
+    """
+    Shared keep-alive HTTP transport for the site API. It keeps a pool of TLS connections open between requests,
+    applies connect/read timeouts to every call and retries failed requests a bounded number of times with backoff.
+
+    Attributes:
+        RETRY_STATUSES (tuple of int): HTTP statuses that are retried before giving up.
+    """
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(self, pool_size: int = 10, connect_timeout: float = 3.05, read_timeout: float = 15.0,
+                 retries: int = 2, backoff: float = 0.5):
+        """
+        Initializes the session and mounts a pooled adapter with the retry policy.
+
+        :param pool_size: Maximum number of connections kept open per host.
+        :param connect_timeout: Seconds to wait for the TCP/TLS connection to be established.
+        :param read_timeout: Seconds to wait for the server to send a response.
+        :param retries: How many times a failed request is retried.
+        :param backoff: Backoff factor between retries (0.5 -> 0.5s, 1s, 2s, ...).
+        """
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+
+        retry = Retry(total=retries, connect=retries, read=retries, status=retries, backoff_factor=backoff,
+                      status_forcelist=self.RETRY_STATUSES, allowed_methods=frozenset(["GET"]),
+                      raise_on_status=False)
+        self._adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry, pool_block=True)
+        self.session = requests.Session()
+        self.session.mount("https://", self._adapter)
+        self.session.mount("http://", self._adapter)
+
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._errors = 0
+        self._in_flight = 0
+        self._peak_in_flight = 0
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+
+    def get(self, url: str, headers: Optional[Dict] = None, params: Optional[Dict] = None) -> requests.Response:
+        """
+        Sends a GET request through the pooled session.
+
+        :param url: The URL to request.
+        :param headers: Optional request headers.
+        :param params: Optional query string parameters.
+        :return: The response object.
+        """
+        with self._lock:
+            self._in_flight += 1
+            self._peak_in_flight = max(self._peak_in_flight, self._in_flight)
+        start = time.perf_counter()
+        try:
+            response = self.session.get(url, headers=headers, params=params, timeout=self.timeout)
+        except requests.RequestException as e:
+            with self._lock:
+                self._errors += 1
+            logger.error("HTTP request to %s failed: %s", url, e)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._in_flight -= 1
+                self._requests += 1
+                self._latency_total += elapsed
+                self._latency_max = max(self._latency_max, elapsed)
+        return response
+
+    def stats(self) -> Dict:
+        """
+        Returns pool and latency statistics, useful to size the pool.
+
+        :return: A dictionary with request counters, latency figures and per-host pool usage.
+        """
+        with self._lock:
+            stats = {"pool_size": self.pool_size,
+                     "requests": self._requests,
+                     "errors": self._errors,
+                     "in_flight": self._in_flight,
+                     "peak_in_flight": self._peak_in_flight,
+                     "latency_avg": self._latency_total / self._requests if self._requests else 0.0,
+                     "latency_max": self._latency_max}
+
+        pools = {}
+        poolmanager = self._adapter.poolmanager
+        for key in list(poolmanager.pools.keys()):
+            pool = poolmanager.pools.get(key)
+            if pool is None:
+                continue
+            pools[f"{pool.scheme}://{pool.host}:{pool.port}"] = {"connections_opened": pool.num_connections,
+                                                                 "requests": pool.num_requests,
+                                                                 "idle": pool.pool.qsize() if pool.pool else 0}
+        stats["pools"] = pools
+        return stats
+
+    def close(self):
+        """
+        Closes every pooled connection.
+
+        :return: None
+        """
+        self.session.close()
@@ -0,0 +1,38 @@
+# tests\conftest.py
+
+import pytest
+
+from database.connection import configure_database, db
+
+
+@pytest.fixture
+def database(tmp_path):
+    """
+    Points the application database at a throwaway file with an up-to-date schema.
+    """
+    from database.core import init_database
+    configure_database(path=str(tmp_path / 'test.db'))
+    init_database()
+    yield db
+    if not db.is_closed():
+        db.close()
+    db.close_all()
+
+
+@pytest.fixture
+def legacy_database(tmp_path):
+    """
+    A database file whose history table has the schema used before history was normalized (action and response
+    text only, no index), not yet configured; configure it and call init_database() to migrate it.
+    """
+    import sqlite3
+    path = tmp_path / 'legacy.db'
+    connection = sqlite3.connect(path)
+    connection.execute('CREATE TABLE history (id INTEGER NOT NULL PRIMARY KEY, created_at DATETIME NOT NULL, '
+                       'user_id INTEGER NOT NULL, action TEXT NOT NULL, response TEXT NOT NULL)')
+    connection.commit()
+    connection.close()
+    yield str(path)
+    if not db.is_closed():
+        db.close()
+    db.close_all()
@@ -0,0 +1,95 @@
+# tests\test_analytics.py
+
+import io
+import json
+from datetime import datetime, timedelta
+
+from database.common.models import History, Title
+from database.connection import configure_database, db
+from database.utils import analytics
+
+
+def add(user_id, kind, low=None, high=None, limit=5, title_ids='', created_at=None):
+    History.insert(user_id=user_id, kind=kind, type='movie', limit=limit, start_rating=low, end_rating=high,
+                   title_ids=title_ids, created_at=created_at or datetime.now()).execute()
+
+
+def test_top_queries_groups_searches_across_limits(database):
+    for user_id in (1, 2, 3):
+        add(user_id, 'CUSTOM', 3, 7, limit=user_id)
+    add(1, 'MID', 0, 4)
+
+    rows = list(analytics.top_queries(limit=10))
+
+    assert [row[:4] + row[5:8] for row in rows] == [('CUSTOM', 'movie', 3, 7, 3, 3, 3),
+                                                    ('MID', 'movie', 0, 4, 1, 1, 5)]
+
+
+def test_user_activity_and_hourly_load(database):
+    start = datetime(2024, 1, 1, 13)
+    add(1, 'CUSTOM', 3, 7, created_at=start)
+    add(1, 'TOP', created_at=start + timedelta(days=1))
+    add(2, 'TOP', created_at=start + timedelta(hours=1))
+
+    users = list(analytics.user_activity())
+    hours = list(analytics.hourly_load())
+
+    assert [row[:4] for row in users] == [(1, 2, 1, 2), (2, 1, 0, 1)]
+    assert hours == [('13', 2, 1), ('14', 1, 1)]
+
+
+def test_iter_history_reads_every_record_in_chunks(database):
+    for n in range(7):
+        add(n, 'TOP')
+
+    chunks = list(analytics.iter_history(chunk=3))
+
+    assert [len(chunk) for chunk in chunks] == [3, 3, 1]
+    assert [row[0] for chunk in chunks for row in chunk] == list(range(1, 8))
+
+
+def test_iter_history_honours_the_period(database):
+    now = datetime.now()
+    add(1, 'TOP', created_at=now - timedelta(days=2))
+    add(2, 'TOP', created_at=now)
+
+    rows = [row for chunk in analytics.iter_history(since=now - timedelta(days=1)) for row in chunk]
+
+    assert [row[1] for row in rows] == [2]
+
+
+def test_export_with_titles(database):
+    Title.insert_many([{"nfid": 10, "type": "movie", "title": "Ten"},
+                       {"nfid": 20, "type": "movie", "title": "Twenty"}]).execute()
+    add(1, 'TOP', title_ids='20,10,30')
+
+    output = io.StringIO()
+    chunks = map(analytics.with_titles, analytics.iter_history())
+    written = analytics.write_rows(analytics.EXPORT_COLUMNS + ('titles',), chunks, output, 'jsonl')
+
+    record = json.loads(output.getvalue())
+    assert written == 1
+    assert record["title_ids"] == '20,10,30'
+    assert record["titles"] == ['Twenty', 'Ten', '']
+
+
+def test_write_rows_csv_has_a_header_and_joins_lists():
+    output = io.StringIO()
+
+    written = analytics.write_rows(('a', 'b'), [[(1, ['x', 'y'])], [(2, [])]], output, 'csv')
+
+    assert written == 2
+    assert output.getvalue().splitlines() == ['a,b', '1,x | y', '2,']
+
+
+def test_check_schema_accepts_a_current_database(database):
+    assert analytics.check_schema(database) == []
+
+
+def test_check_schema_reports_a_database_to_migrate(legacy_database):
+    configure_database(path=legacy_database)
+
+    problems = analytics.check_schema(db)
+
+    assert problems[0].startswith("table history lacks the columns kind, type, limit")
+    assert problems[1] == "table title is missing"
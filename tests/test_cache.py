@@ -0,0 +1,38 @@
+# tests\test_cache.py
+
+import pytest
+
+from site_API.common.models import SearchQuery, TitleRecord
+from site_API.utils.cache import _covers, _trim
+
+
+def payload(count):
+    return {"results": [TitleRecord(n, f"title {n}", "", 7.0, "") for n in range(count)]}
+
+
+@pytest.mark.parametrize("cached_limit, results, limit, covered", [
+    (10, 10, 5, True),   # a larger page answers a smaller one
+    (5, 5, 5, True),
+    (5, 5, 10, False),   # a full smaller page may be missing results
+    (10, 3, 5, True),    # a short page means the search has no more results
+    (10, 3, 10, True),
+    (5, 4, 10, True),
+])
+def test_covers(cached_limit, results, limit, covered):
+    assert _covers(cached_limit, payload(results), SearchQuery(limit=limit)) is covered
+
+
+def test_trim_cuts_results_to_the_query_limit():
+    cached = dict(payload(10), total=10)
+
+    trimmed = _trim(cached, SearchQuery(limit=3))
+
+    assert [title.nfid for title in trimmed["results"]] == [0, 1, 2]
+    assert trimmed["total"] == 10
+    assert len(cached["results"]) == 10  # the cached response is not modified
+
+
+def test_trim_returns_short_responses_unchanged():
+    cached = payload(2)
+
+    assert _trim(cached, SearchQuery(limit=5)) is cached
@@ -0,0 +1,64 @@
+# tests\test_catalog.py
+
+import asyncio
+import json
+from types import SimpleNamespace
+
+from database.common.models import CatalogSync
+from site_API.common.models import SearchQuery
+from site_API.utils.async_catalog import AsyncCatalogSiteApi
+from site_API.utils.catalog import CatalogSiteApi
+
+
+class FakeTransport:
+    """
+    Answers every search with the same titles, counting the requests.
+    """
+    def __init__(self, count=3):
+        self.requests = 0
+        self.body = json.dumps({"results": [{"nfid": n, "title": f"title {n}", "synopsis": "", "imdbrating": 9 - n,
+                                             "img": f"https://img/{n}.jpg"} for n in range(count)]})
+
+    def get(self, url, headers=None, params=None):
+        self.requests += 1
+        return SimpleNamespace(content=self.body)
+
+    async def get_json(self, url, headers=None, params=None, loads=json.loads):
+        return loads(self.get(url).content)
+
+
+def titles(response):
+    return [title.nfid for title in response["results"]]
+
+
+def test_searches_covered_by_the_catalog_are_answered_locally(database):
+    transport = FakeTransport()
+    site = CatalogSiteApi('key', 'host', transport)
+
+    assert titles(site.fetch(SearchQuery.high('movie', 5))) == [0, 1, 2]
+    assert titles(site.fetch(SearchQuery.high('movie', 2))) == [0, 1]
+
+    assert transport.requests == 1
+    assert site.stats() == {"local_hits": 1, "remote_calls": 1}
+
+
+def test_unreadable_catalog_falls_back_to_the_api(database):
+    transport = FakeTransport()
+    site = CatalogSiteApi('key', 'host', transport)
+    database.drop_tables([CatalogSync])
+
+    assert titles(site.fetch(SearchQuery.high('movie', 5))) == [0, 1, 2]
+
+    assert transport.requests == 1
+
+
+def test_async_api_shares_the_catalog(database):
+    transport = FakeTransport()
+    CatalogSiteApi('key', 'host', FakeTransport(count=4)).fetch(SearchQuery.high('movie', 5))
+    site = AsyncCatalogSiteApi('key', 'host', transport)
+
+    assert titles(asyncio.run(site.fetch(SearchQuery.high('movie', 3)))) == [0, 1, 2]
+    assert titles(asyncio.run(site.fetch(SearchQuery.low('movie', 3)))) == [0, 1, 2]
+
+    assert transport.requests == 1
+    assert site.stats() == {"local_hits": 1, "remote_calls": 1}
@@ -0,0 +1,95 @@
+# tests\test_delivery.py
+
+from types import SimpleNamespace
+
+import pytest
+
+from site_API.common.models import TitleRecord
+from tg_API.utils.delivery import delivery_steps, send_results
+from tg_API.utils.poster_cache import PosterCache
+
+
+class Rejected(Exception):
+    error_code = 400
+
+
+class FakeBot:
+    """
+    Records the calls of send_results and answers them like Telegram, with a file_id per uploaded poster.
+    """
+    def __init__(self, reject=()):
+        self.calls = []
+        self.reject = set(reject)
+
+    def _photo(self, media):
+        if media in self.reject:
+            raise Rejected(media)
+        sizes = [SimpleNamespace(file_id=f'small-{media}'), SimpleNamespace(file_id=f'id-{media}')]
+        return SimpleNamespace(photo=sizes)
+
+    def send_photo(self, chat_id, photo, caption):
+        self.calls.append(('photo', photo))
+        return self._photo(photo)
+
+    def send_media_group(self, chat_id, group):
+        self.calls.append(('group', [item.media for item in group]))
+        return [self._photo(item.media) for item in group]
+
+    def send_message(self, chat_id, text, reply_markup=None):
+        self.calls.append(('message', text))
+
+
+def response(count):
+    return {"results": [TitleRecord(n, f"title {n}", "", 7.0, f"https://img/{n}.jpg") for n in range(count)]}
+
+
+@pytest.mark.parametrize("count, sends", [
+    (1, ['photo']),                     # a media group needs at least two items
+    (4, ['group']),
+    (12, ['group', 'group']),           # at most ten items per group
+])
+def test_results_are_sent_with_the_poster_cache_on(database, count, sends):
+    bot, posters = FakeBot(), PosterCache()
+
+    assert send_results(bot, 1, "TOP", response(count), "menu", posters=posters) == count
+
+    assert [call[0] for call in bot.calls] == sends + ['message']
+    assert posters.stats()["stored"] == count
+    assert posters.resolve_many([f"https://img/{count - 1}.jpg"]) == [f"id-https://img/{count - 1}.jpg"]
+
+
+def test_single_result_steps_hand_a_list_to_the_poster_cache():
+    steps = delivery_steps(1, "TOP", response(1), "menu", posters=object())
+    assert next(steps)[1] == 'resolve_many'
+    assert steps.send(["https://img/0.jpg"])[1] == 'send_photo'
+
+    target, method, args, _ = steps.send('sent')
+
+    assert (target, method, args) == ('posters', 'remember', (["https://img/0.jpg"], ['sent']))
+
+
+def test_rejected_file_ids_are_forgotten_and_sent_by_url(database):
+    posters = PosterCache()
+    posters.remember(["https://img/0.jpg"], [FakeBot()._photo("stale")])
+    bot = FakeBot(reject={"id-stale"})
+
+    send_results(bot, 1, "TOP", response(1), "menu", posters=posters)
+
+    assert bot.calls == [('photo', 'id-stale'), ('photo', 'https://img/0.jpg'), ('message', 'menu')]
+    assert posters.stats()["rejected"] == 1
+    assert posters.resolve_many(["https://img/0.jpg"]) == ["id-https://img/0.jpg"]
+
+
+def test_other_errors_are_raised():
+    bot = FakeBot(reject={"https://img/0.jpg"})
+
+    with pytest.raises(Rejected):
+        send_results(bot, 1, "TOP", response(2), "menu")
+
+
+def test_no_results_attach_the_menu_to_the_answer():
+    bot = FakeBot()
+
+    assert send_results(bot, 1, "TOP", {"results": []}, "menu", reply_markup="keyboard") == 0
+
+    assert bot.calls == [('message', "TOP\nno results\n\nmenu")]
@@ -0,0 +1,76 @@
+# tests\test_migrations.py
+
+import sqlite3
+
+from database.connection import configure_database, db
+from database.core import init_database
+from database.utils.migrations import apply_migrations
+
+LEGACY_ROWS = [
+    ('2024-01-01 10:00:00', 1, 'TOP 5 MOVIES', 'A\nB\n'),
+    ('2024-01-01 10:01:00', 1, 'MID 3 SERIES', 'C\n'),
+    ('2024-01-01 10:02:00', 2, 'CUSTOM [3-7] 5 SERIES', 'D\n'),
+    ('2024-01-01 10:03:00', 2, 'None 2 MOVIES', 'E\n'),
+    ('2024-01-01 10:04:00', 3, 'something else', 'F\n'),
+]
+
+
+def fill(path):
+    connection = sqlite3.connect(path)
+    connection.executemany('INSERT INTO history (created_at, user_id, action, response) VALUES (?, ?, ?, ?)',
+                           LEGACY_ROWS)
+    connection.commit()
+    connection.close()
+
+
+def migrated_rows():
+    cursor = db.execute_sql('SELECT kind, type, "limit", start_rating, end_rating, title_ids, action, response '
+                            'FROM history ORDER BY id')
+    return cursor.fetchall()
+
+
+def test_legacy_history_is_normalized(legacy_database):
+    fill(legacy_database)
+    configure_database(path=legacy_database)
+    init_database()
+
+    rows = migrated_rows()
+    assert [row[:5] for row in rows] == [
+        ('TOP', 'movie', 5, None, None),
+        ('MID', 'series', 3, 0, 4),
+        ('CUSTOM', 'series', 5, 3, 7),
+        (None, 'movie', 2, None, None),
+        (None, None, None, None, None),
+    ]
+    # converted rows drop their action text but keep the response, which cannot be mapped back to title ids
+    assert [row[6] for row in rows] == [None, None, None, None, 'something else']
+    assert [row[7] for row in rows] == [row[3] for row in LEGACY_ROWS]
+    assert all(row[5] == '' for row in rows)
+
+
+def test_migration_adds_indexes_and_allows_new_records(legacy_database):
+    configure_database(path=legacy_database)
+    init_database()
+
+    names = {index.name for index in db.get_indexes('history')}
+    assert {'history_user_id_created_at', 'history_kind_type_start_rating_end_rating'} <= names
+    from database.common.models import History
+    History.insert(user_id=1, kind='TOP', type='movie', limit=5, title_ids='1,2').execute()  # action is nullable
+    assert History.select().count() == 1
+
+
+def test_migrations_are_idempotent(legacy_database):
+    fill(legacy_database)
+    configure_database(path=legacy_database)
+    init_database()
+    before = migrated_rows()
+
+    apply_migrations(db)
+
+    assert migrated_rows() == before
+
+
+def test_new_database_needs_no_migration(database):
+    columns = {column.name for column in database.get_columns('history')}
+    assert {'kind', 'type', 'limit', 'start_rating', 'end_rating', 'title_ids'} <= columns
+    apply_migrations(database)
@@ -0,0 +1,128 @@
+# tests\test_rate_limit.py
+
+import asyncio
+
+import pytest
+
+from rate_limit import BACKGROUND, INTERACTIVE, RateLimitedBot, RateLimiter, TokenBucket, background
+
+
+def test_bucket_refills_at_its_rate_up_to_capacity():
+    bucket = TokenBucket(rate=10, capacity=2)
+    bucket.tokens, start = 0.0, bucket._updated
+
+    bucket.refill(start + 0.05)
+    assert bucket.tokens == pytest.approx(0.5)
+    assert bucket.wait_time(start + 0.05) == pytest.approx(0.05)
+
+    bucket.refill(start + 10)
+    assert bucket.tokens == 2
+    assert bucket.wait_time(start + 10) == 0.0
+    assert bucket.wait_time(start + 10, keep=1.5) == pytest.approx(0.05)
+
+
+def test_burst_is_spread_at_the_rate():
+    limiter = RateLimiter(rate=50, burst=2)
+
+    waits = [limiter.acquire() for _ in range(4)]
+
+    assert waits[:2] == [0.0, 0.0]
+    assert 0.01 <= waits[2] < 0.1
+    assert limiter.stats()[INTERACTIVE]["waited"] == 2
+
+
+def test_chats_are_limited_separately():
+    limiter = RateLimiter(rate=1000, key_rate=20, key_burst=1)
+
+    assert limiter.acquire(1) == 0.0
+    assert limiter.acquire(2) == 0.0
+    assert limiter.acquire(1) >= 0.03
+    assert limiter.stats()["keys"] == 2
+
+
+def test_background_calls_leave_the_reserve_to_interactive_ones():
+    limiter = RateLimiter(rate=20, burst=2, reserved=1)
+
+    assert limiter.acquire(priority=BACKGROUND) == 0.0
+    assert limiter.acquire(priority=INTERACTIVE) == 0.0
+    with background():
+        assert limiter.acquire() >= 0.03
+    assert limiter.stats()[BACKGROUND]["calls"] == 2
+
+
+def test_retry_after_blocks_the_bucket():
+    limiter = RateLimiter(rate=1000, key_rate=1000)
+
+    limiter.retry_after(0.05, key=1)
+
+    assert limiter.acquire(2) == 0.0
+    assert limiter.acquire(1) >= 0.04
+    assert limiter.stats()["throttled"] == 1
+
+
+class FloodError(Exception):
+    error_code = 429
+    result_json = {"parameters": {"retry_after": 0.01}}
+
+
+class FakeBot:
+    token = '123:abc'
+
+    def __init__(self, floods=0):
+        self.floods = floods
+        self.calls = []
+
+    def send_message(self, chat_id, text):
+        self.calls.append(('send_message', chat_id))
+        if self.floods:
+            self.floods -= 1
+            raise FloodError()
+        return text
+
+    def delete_message(self, chat_id, message_id):
+        self.calls.append(('delete_message', chat_id))
+
+    async def send_photo(self, chat_id, photo):
+        self.calls.append(('send_photo', chat_id))
+        return photo
+
+
+def test_outbound_calls_are_limited_per_chat():
+    limiter = RateLimiter(rate=1000, key_rate=1000)
+    bot = RateLimitedBot(FakeBot(), limiter)
+
+    assert bot.send_message(7, 'hi') == 'hi'
+    bot.delete_message(7, 1)
+
+    assert bot.token == '123:abc'
+    assert limiter.stats()["keys"] == 1  # delete_message only uses the global bucket
+    assert limiter.stats()[INTERACTIVE]["calls"] == 2
+
+
+def test_flood_answers_are_retried_after_the_delay():
+    limiter = RateLimiter(rate=1000, key_rate=1000)
+    fake = FakeBot(floods=2)
+
+    assert RateLimitedBot(fake, limiter).send_message(7, 'hi') == 'hi'
+
+    assert len(fake.calls) == 3
+    assert limiter.stats()["throttled"] == 2
+
+
+def test_flood_answers_are_raised_after_the_retries():
+    fake = FakeBot(floods=5)
+
+    with pytest.raises(FloodError):
+        RateLimitedBot(fake, RateLimiter(rate=1000), retries=1).send_message(7, 'hi')
+
+    assert len(fake.calls) == 2
+
+
+def test_coroutine_methods_are_limited_too():
+    limiter = RateLimiter(rate=1000, key_rate=1000)
+    bot = RateLimitedBot(FakeBot(), limiter)
+
+    assert asyncio.run(bot.send_photo(7, 'poster')) == 'poster'
+
+    assert limiter.stats()[INTERACTIVE]["calls"] == 1
+    assert limiter.stats()["keys"] == 1
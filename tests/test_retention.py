@@ -0,0 +1,84 @@
+# tests\test_retention.py
+
+from datetime import datetime, timedelta
+
+from peewee import fn
+
+from database.common.models import History
+from database.utils.retention import HistoryRetention, delete_history_before, trim_history
+from site_API.common.models import SearchQuery
+from tg_API.core import Bot
+
+
+def add(user_id, created_at, count=1):
+    History.insert_many([{"user_id": user_id, "kind": "TOP", "type": "movie", "limit": 5, "created_at": created_at}
+                         for _ in range(count)]).execute()
+
+
+def counts():
+    return dict(History.select(History.user_id, fn.COUNT(History.id)).group_by(History.user_id).tuples())
+
+
+def test_trim_keeps_latest_records_of_every_user(database):
+    start = datetime(2024, 1, 1)
+    for minute in range(8):
+        add(1, start + timedelta(minutes=minute))
+    for minute in range(3):
+        add(2, start + timedelta(minutes=minute))
+
+    assert trim_history(keep=5) == 3
+
+    assert counts() == {1: 5, 2: 3}
+    oldest = History.select().where(History.user_id == 1).order_by(History.created_at).first()
+    assert oldest.created_at == start + timedelta(minutes=3)
+
+
+def test_trim_can_be_limited_to_some_users(database):
+    now = datetime.now()
+    add(1, now, count=4)
+    add(2, now, count=4)
+
+    assert trim_history(keep=2, user_ids={1}) == 2
+
+    assert counts() == {1: 2, 2: 4}
+
+
+def test_delete_before_removes_old_records_in_chunks(database):
+    now = datetime.now()
+    add(1, now - timedelta(days=40), count=7)
+    add(1, now, count=2)
+
+    assert delete_history_before(now - timedelta(days=30), chunk=3) == 7
+
+    assert History.select().count() == 2
+
+
+def test_retention_run_applies_age_then_per_user_limit(database):
+    now = datetime.now()
+    add(1, now - timedelta(days=10), count=3)
+    add(1, now - timedelta(minutes=1), count=4)
+    add(2, now, count=2)
+    retention = HistoryRetention(max_age_days=5, keep_per_user=3)
+
+    retention.run_once()
+
+    assert counts() == {1: 3, 2: 2}
+    stats = retention.stats()
+    assert (stats["expired"], stats["trimmed"], stats["runs"]) == (3, 1, 1)
+
+
+def test_retention_with_limits_disabled_keeps_everything(database):
+    add(1, datetime.now() - timedelta(days=400), count=30)
+
+    HistoryRetention(max_age_days=0, keep_per_user=0).run_once()
+
+    assert History.select().count() == 30
+
+
+def test_bot_without_writer_trims_on_write(database):
+    bot = Bot('123:abc', site=None, history_keep=2)
+
+    for _ in range(4):
+        bot.log_user_action(1, 'TOP', SearchQuery.high('movie', 5))
+
+    assert counts() == {1: 2}
@@ -0,0 +1,38 @@
+# tests\test_search_query.py
+
+import pytest
+
+from site_API.common.models import SearchQuery
+
+
+@pytest.mark.parametrize("query", [
+    SearchQuery.high('movie', 5),
+    SearchQuery.low('series', 10),
+    SearchQuery.custom('movie', 1, 3, 7).next_page(),
+])
+def test_callback_round_trip(query):
+    assert SearchQuery.from_callback(query.to_callback()) == query
+
+
+@pytest.mark.parametrize("data", [
+    'cb_high',                          # another button
+    'cb_next:movie:5:0:4',              # too few parts
+    'cb_next:movie:5:0:4:6:7',          # too many parts
+    'cb_prev:movie:5:0:4:6',            # wrong prefix
+    'cb_next:music:5:0:4:6',            # unknown content type
+    'cb_next:movie:five:0:4:6',         # limit is not a number
+    'cb_next:movie:5:low:4:6',          # rating is not a number
+    'cb_next:movie:5:0:4:x',            # offset is not a number
+    'cb_next:movie:0:0:4:6',            # limit below 1
+    'cb_next:movie:11:0:4:6',           # limit above MAX_LIMIT
+    'cb_next:movie:5:0:4:0',            # offset below 1
+    '',
+])
+def test_from_callback_rejects_invalid_data(data):
+    assert SearchQuery.from_callback(data) is None
+
+
+def test_from_callback_accepts_missing_ratings():
+    query = SearchQuery.from_callback('cb_next:series:10:::11')
+
+    assert query == SearchQuery(type='series', limit=10, offset=11)
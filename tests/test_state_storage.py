@@ -0,0 +1,101 @@
+# tests\test_state_storage.py
+
+import asyncio
+import time
+
+from database.common.models import ConversationState
+from tg_API.utils.async_state_storage import AsyncSqliteStateStorage
+from tg_API.utils.state_storage import SqliteStateStorage
+
+
+def test_changes_are_persisted_by_flush(database):
+    storage = SqliteStateStorage()
+    storage.set_state(1, 2, 'MyStates:custom_low_set')
+    storage.set_data(1, 2, 'limit', 5)
+    assert ConversationState.select().count() == 0
+
+    storage.flush()
+
+    restarted = SqliteStateStorage()
+    assert restarted.get_state(1, 2) == 'MyStates:custom_low_set'
+    assert restarted.get_data(1, 2) == {'limit': 5}
+
+
+def test_deletion_is_persisted(database):
+    storage = SqliteStateStorage()
+    storage.set_state(1, 2, 'a')
+    storage.flush()
+
+    assert storage.delete_state(1, 2)
+    storage.flush()
+
+    assert ConversationState.select().count() == 0
+    assert not storage.delete_state(1, 2)
+
+
+def test_abandoned_conversations_read_as_empty_and_are_purged(database):
+    storage = SqliteStateStorage(ttl=60)
+    storage.set_state(1, 2, 'a')
+    storage.flush()
+    ConversationState.update(updated_at=time.time() - 120).execute()
+
+    assert SqliteStateStorage(ttl=60).get_state(1, 2) is None
+    assert storage.purge() == 1
+
+
+def test_shared_storages_see_each_others_changes(database):
+    first, second = SqliteStateStorage(), SqliteStateStorage()
+    first.set_state(1, 2, 'a')
+    first.flush()
+    assert second.get_state(1, 2) == 'a'
+
+    first.set_data(1, 2, 'limit', 5)
+    first.flush()
+    assert second.get_data(1, 2) == {'limit': 5}
+
+    first.delete_state(1, 2)
+    first.flush()
+    assert second.get_state(1, 2) is None
+    assert second.stats()["reloads"] == 2
+
+
+def test_pending_change_is_kept_unless_another_process_made_a_newer_one(database):
+    first, second = SqliteStateStorage(), SqliteStateStorage()
+    first.set_state(1, 2, 'a')
+    first.flush()
+    assert second.get_state(1, 2) == 'a'
+
+    second.set_state(1, 2, 'b')  # not flushed yet
+    assert second.get_state(1, 2) == 'b'
+
+    first.set_state(1, 2, 'c')
+    first.flush()
+    assert second.get_state(1, 2) == 'c'
+    second.flush()
+    assert SqliteStateStorage().get_state(1, 2) == 'c'
+
+
+def test_unshared_storage_trusts_its_cache(database):
+    first, second = SqliteStateStorage(), SqliteStateStorage(shared=False)
+    first.set_state(1, 2, 'a')
+    first.flush()
+    assert second.get_state(1, 2) == 'a'
+
+    first.set_state(1, 2, 'b')
+    first.flush()
+
+    assert second.get_state(1, 2) == 'a'
+
+
+def test_async_adapter_uses_the_wrapped_storage(database):
+    storage = SqliteStateStorage()
+    adapter = AsyncSqliteStateStorage(storage)
+
+    async def converse():
+        await adapter.set_state(1, 2, 'a')
+        async with adapter.get_interactive_data(1, 2) as data:
+            data['limit'] = 5
+        return await adapter.get_state(1, 2), await adapter.get_data(1, 2)
+
+    assert asyncio.run(converse()) == ('a', {'limit': 5})
+    assert storage.get_data(1, 2) == {'limit': 5}
@@ -0,0 +1,83 @@
+# tests\test_writer.py
+
+import threading
+
+from database.common.models import History
+from database.utils.writer import BatchWriter
+
+
+def record(user_id=1):
+    return {"user_id": user_id, "kind": "TOP", "type": "movie", "limit": 5}
+
+
+def test_records_are_stored_in_batches(database):
+    writer = BatchWriter(database, History, batch_size=3, flush_interval=5)
+    writer.start()
+    for _ in range(7):
+        writer.write(record())
+
+    assert writer.flush(timeout=5)
+
+    assert History.select().count() == 7
+    writer.close()
+    stats = writer.stats()
+    assert (stats["written"], stats["failed"], stats["batches"]) == (7, 0, 3)
+
+
+def test_close_stores_pending_records_without_a_thread(database):
+    writer = BatchWriter(database, History)
+    writer.write(record())
+    writer.write(record())
+
+    writer.close()
+
+    assert History.select().count() == 2
+
+
+def test_failed_stores_are_counted_apart(database):
+    calls = []
+
+    def store(db, batch):
+        calls.append(len(batch))
+        if len(calls) == 1:
+            return False
+        raise RuntimeError("database is locked")
+
+    writer = BatchWriter(database, History, store=store)
+    writer.write(record())
+    writer.close()
+    writer.write(record())
+    writer.close()
+
+    stats = writer.stats()
+    assert (stats["written"], stats["failed"], stats["batches"]) == (0, 2, 0)
+
+
+def test_full_queue_is_stored_synchronously(database):
+    writer = BatchWriter(database, History, max_queue=1, put_timeout=0)
+    writer.write(record())
+    writer.write(record())
+
+    assert writer.stats()["overflow"] == 1
+    assert History.select().count() == 1
+    writer.close()
+    assert History.select().count() == 2
+
+
+def test_flush_gives_up_when_the_writer_is_stalled(database):
+    stalled = threading.Event()
+
+    def store(db, batch):
+        stalled.wait()
+        return True
+
+    writer = BatchWriter(database, History, max_queue=1, flush_interval=0, store=store)
+    writer.start()
+    writer.write(record())  # taken by the writer thread, which then blocks
+    writer.write(record())  # fills the queue
+
+    assert writer.flush(timeout=0.2) is False
+
+    stalled.set()
+    writer.close()
+    assert writer.stats()["written"] == 2
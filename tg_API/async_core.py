@@ -0,0 +1,322 @@
+# tg_API\async_core.py
+
+import asyncio
+import functools
+from typing import Iterable, Optional
+
+from telebot.async_telebot import AsyncTeleBot
+from telebot import asyncio_filters
+from telebot.asyncio_storage import StateMemoryStorage, StateStorageBase
+from telebot.asyncio_handler_backends import State, StatesGroup
+
+from database.utils.writer import BatchWriter
+import metrics
+from log_config import logger
+from rate_limit import RateLimiter, RateLimitedBot
+from site_API.async_core import AsyncSiteApi
+from site_API.common.models import SearchQuery
+from tg_API.core import Bot
+from tg_API.utils.delivery import delivery_steps
+from tg_API.utils.history_cache import HistoryRing
+from tg_API.utils.poster_cache import PosterCache
+
+
+class MyStates(StatesGroup):
+    """
+    Conversation states of the asyncio bot. The asyncio filters only recognise states from telebot's asyncio
+    backend, so the groups of tg_API.core are mirrored here under the same names.
+    """
+    high_selected = State()
+    low_selected = State()
+    custom_selected = State()
+    custom_low_set = State()
+    custom_high_set = State()
+
+
+class AsyncBot(Bot):
+    """
+    Asyncio version of the bot. Every conversation is a coroutine: Telegram and site API calls are awaited on pooled
+    async clients, and the blocking database calls are offloaded to an executor. Texts, keyboards and database
+    helpers are shared with Bot.
+    """
+    def __init__(self, token: str, site: AsyncSiteApi, history_writer: Optional[BatchWriter] = None,
+                 history_ring: Optional[HistoryRing] = None, limiter: Optional[RateLimiter] = None,
+                 admin_ids: Iterable[int] = (), posters: Optional[PosterCache] = None,
+                 state_storage: Optional[StateStorageBase] = None, history_keep: int = 0):
+        """
+        Initialize the bot with necessary configurations.
+
+        :param token: Telegram API token provided by BotFather.
+        :param site: Instance of AsyncSiteApi to interact with movie data.
+        :param history_writer: Optional write-behind sink for history records.
+        :param history_ring: Optional in-memory cache of rendered history entries.
+        :param limiter: Optional rate limiter every call to Telegram waits for, to stay within the flood limits.
+        :param admin_ids: Telegram user IDs allowed to use the /metrics command.
+        :param posters: Optional cache of the file_ids of the posters already uploaded to Telegram.
+        :param state_storage: Optional asyncio storage of the conversation states (AsyncSqliteStateStorage); states
+                              are kept in memory only when omitted.
+        :param history_keep: Latest history records kept per user when a record is stored without the writer.
+        """
+        self.bot = AsyncTeleBot(token, state_storage=state_storage or StateMemoryStorage())
+        if limiter is not None:
+            self.bot = RateLimitedBot(self.bot, limiter)
+        self.site = site
+        self.history_writer = history_writer
+        self.history_ring = history_ring or HistoryRing(self.load_history_entries)
+        self.admin_ids = frozenset(admin_ids)
+        self.posters = posters
+        self.history_keep = history_keep
+
+    @staticmethod
+    async def run_in_executor(func, *args, **kwargs):
+        """
+        Runs a blocking call (database access) in the default executor.
+
+        :param func: The blocking function.
+        :param args: Positional arguments for the function.
+        :param kwargs: Keyword arguments for the function.
+        :return: The value returned by the function.
+        """
+        return await asyncio.get_running_loop().run_in_executor(None, functools.partial(func, *args, **kwargs))
+
+    async def get_user_data(self, call) -> dict:
+        """
+        Returns a copy of the data collected so far in the user's conversation (content type, limit, rating range).
+
+        :param call: The callback query from Telegram.
+        :return: A dictionary with the user's search choices.
+        """
+        return dict(await self.bot.current_states.get_data(call.message.chat.id, call.from_user.id) or {})
+
+    async def send_results(self, chat_id, header: str, response_json, reply_markup=None) -> int:
+        """
+        Sends the titles of an API response followed by the main menu, awaiting the calls of delivery_steps.
+        The poster cache is accessed in the executor.
+
+        :param chat_id: The chat to send the titles to.
+        :param header: The line describing the request.
+        :param response_json: The API response.
+        :param reply_markup: The menu keyboard; the main menu when omitted.
+        :return: The number of titles sent.
+        """
+        steps = delivery_steps(chat_id, header, response_json, self.INFO_TEXT, reply_markup or self.gen_inline_menu(),
+                               self.posters)
+        result, error = None, None
+        while True:
+            try:
+                target, method, args, kwargs = steps.throw(error) if error is not None else steps.send(result)
+            except StopIteration as done:
+                return done.value
+            result, error = None, None
+            try:
+                if target == 'posters':
+                    result = await self.run_in_executor(getattr(self.posters, method), *args, **kwargs)
+                else:
+                    result = await getattr(self.bot, method)(*args, **kwargs)
+            except Exception as e:
+                error = e
+
+    def setup_handlers(self):
+        """
+        Configures and registers the message and callback query handlers, mirroring Bot.setup_handlers.
+
+        (call this method in main before you call the run() method)
+
+        :return: None
+        """
+
+        @self.bot.message_handler(commands=['metrics'], func=lambda message: message.from_user.id in self.admin_ids)
+        async def send_metrics(message):
+            """
+            Sends the operation latency report to an administrator.
+
+            :param message: The message object containing user and chat details.
+            :return: None
+            """
+            await self.bot.send_message(message.chat.id, metrics.summary()[:4096])
+
+        @self.bot.message_handler(commands=['start', 'help', 'hello-world'])
+        @self.bot.message_handler(regexp=r'привет|hello')
+        async def send_welcome(message):
+            """
+            Sends a welcome message along with the main command menu.
+
+            :param message: The message object containing user and chat details.
+            :return: None
+            """
+            await self.bot.delete_message(message.chat.id, message.message_id)
+            await self.bot.send_message(message.chat.id, self.GREETING_TEXT)
+            await self.bot.send_message(message.chat.id, text=self.INFO_TEXT, reply_markup=self.gen_inline_menu())
+
+        @self.bot.callback_query_handler(func=lambda call: call.data in ["cb_high", "cb_low", "cb_custom"])
+        async def cb_search_handler(call):
+            """
+            Handles the selection of the 'high', 'low' or 'custom' option by setting the matching state and
+            prompting the user to choose between movies or series.
+
+            :param call: The callback query from Telegram.
+            """
+            states = {"cb_high": MyStates.high_selected,
+                      "cb_low": MyStates.low_selected,
+                      "cb_custom": MyStates.custom_selected}
+            await self.bot.delete_message(call.message.chat.id, call.message.message_id)
+            await self.bot.set_state(call.from_user.id, states[call.data], call.message.chat.id)
+            await self.bot.send_message(call.message.chat.id, "Movies/series?", reply_markup=self.gen_type_choice())
+
+        @self.bot.callback_query_handler(func=lambda call: call.data in ["cb_history"])
+        async def cb_history_handler(call):
+            """
+            Displays the user's history upon selection of the 'history' option from the menu.
+
+            :param call: The callback query from Telegram.
+            """
+            await self.bot.delete_message(call.message.chat.id, call.message.message_id)
+            history_text = await self.run_in_executor(self.format_history_for_display, call.from_user.id)
+            await self.bot.send_message(call.message.chat.id, 'HISTORY')
+            await self.bot.send_message(call.message.chat.id, history_text)
+            await self.bot.send_message(call.message.chat.id, text=self.INFO_TEXT, reply_markup=self.gen_inline_menu())
+
+        @self.bot.callback_query_handler(func=lambda call: call.data in ["cb_menu"])
+        async def cb_menu_handler(call):
+            """
+            Clears any current state and shows the main command menu again.
+
+            :param call: The callback query from Telegram.
+            """
+            await self.bot.delete_message(call.message.chat.id, call.message.message_id)
+            await self.bot.delete_state(call.from_user.id, call.message.chat.id)
+            await self.bot.send_message(call.message.chat.id, text=self.INFO_TEXT, reply_markup=self.gen_inline_menu())
+
+        @self.bot.callback_query_handler(func=lambda call: call.data in ["cb_movies", "cb_series"])
+        async def cb_choice_handler(call):
+            """
+            Stores the user's choice between 'Movies' and 'Series' and prompts for the number of titles.
+
+            :param call: The callback query from Telegram, containing the user's choice.
+            """
+            await self.bot.delete_message(call.message.chat.id, call.message.message_id)
+            if await self.bot.get_state(call.from_user.id, call.message.chat.id) is None:
+                await self.bot.send_message(call.message.chat.id, text=self.INFO_TEXT,
+                                            reply_markup=self.gen_inline_menu())
+                return
+            choice, name = ("movie", "movies") if call.data == "cb_movies" else ("series", "series")
+            await self.bot.add_data(call.from_user.id, call.message.chat.id, type=choice)
+            text = "How many {} would you like to find?\n(you may have to wait up to 20 seconds)"
+            await self.bot.send_message(call.message.chat.id, text=text.format(name),
+                                        reply_markup=self.gen_limit_choice())
+
+        @self.bot.callback_query_handler(state=[MyStates.high_selected, MyStates.low_selected],
+                                         func=lambda call: call.data in self.oneFive)
+        async def cb_limit_handler_send_high_low(call):
+            """
+            Fetches high or low rated titles depending on the state, sends them, logs the interaction and returns
+            the user to the main menu.
+
+            :param call: The callback query from Telegram, containing the number of titles.
+            """
+            data = await self.get_user_data(call)
+            state = str(await self.bot.get_state(call.from_user.id, call.message.chat.id))
+            if state == str(MyStates.low_selected):
+                query = SearchQuery.low(data.get("type", "movie"), call.data)
+                req = 'MID'
+            else:
+                query = SearchQuery.high(data.get("type", "movie"), call.data)
+                req = 'TOP'
+            response_json = await self.site.search(query)
+            self.prefetch_next_page(query, response_json)
+            await self.bot.delete_message(call.message.chat.id, call.message.message_id)
+            await self.bot.delete_state(call.from_user.id, call.message.chat.id)
+            await self.send_results(call.message.chat.id, self.action_text(req, query), response_json,
+                                    self.gen_results_menu(query, response_json))
+            await self.run_in_executor(self.log_user_action, call.from_user.id, req, query,
+                                       self.get_results(response_json))
+
+        @self.bot.callback_query_handler(state=MyStates.custom_selected,
+                                         func=lambda call: call.data in self.oneFive)
+        async def cb_limit_handler_set_custom_low(call):
+            """
+            Stores the number of titles for a custom search and prompts for the low boundary.
+
+            :param call: The callback query from Telegram, containing the number of titles.
+            """
+            await self.bot.add_data(call.from_user.id, call.message.chat.id, limit=call.data)
+            await self.bot.delete_message(call.message.chat.id, call.message.message_id)
+            await self.bot.set_state(call.from_user.id, MyStates.custom_low_set, call.message.chat.id)
+            await self.bot.send_message(call.message.chat.id, "Set low:", reply_markup=self.gen_rating_choice())
+
+        @self.bot.callback_query_handler(state=MyStates.custom_low_set,
+                                         func=lambda call: call.data in self.oneTen)
+        async def cb_rating_handler_set_custom_high(call):
+            """
+            Stores the low boundary of a custom search and prompts for the high boundary.
+
+            :param call: The callback query from Telegram, containing the low boundary.
+            """
+            await self.bot.add_data(call.from_user.id, call.message.chat.id, low=call.data)
+            await self.bot.delete_message(call.message.chat.id, call.message.message_id)
+            await self.bot.set_state(call.from_user.id, MyStates.custom_high_set, call.message.chat.id)
+            await self.bot.send_message(call.message.chat.id, "Set high: (you may have to wait up to 20 seconds)",
+                                        reply_markup=self.gen_rating_choice())
+
+        @self.bot.callback_query_handler(state=MyStates.custom_high_set,
+                                         func=lambda call: call.data in self.oneTen)
+        async def cb_rating_handler_send_custom(call):
+            """
+            Completes the custom rating search, sends the results and presents the main menu again.
+
+            :param call: The callback query from Telegram, containing the high boundary.
+            """
+            data = await self.get_user_data(call)
+            query = SearchQuery.custom(data.get("type", "movie"), data.get("limit", 5), data.get("low", 0), call.data)
+            response_json = await self.site.search(query)
+            self.prefetch_next_page(query, response_json)
+
+            await self.bot.delete_message(call.message.chat.id, call.message.message_id)
+            await self.bot.delete_state(call.from_user.id, call.message.chat.id)
+            await self.send_results(call.message.chat.id, self.action_text('CUSTOM', query), response_json,
+                                    self.gen_results_menu(query, response_json))
+            await self.run_in_executor(self.log_user_action, call.from_user.id, 'CUSTOM', query,
+                                       self.get_results(response_json))
+
+        @self.bot.callback_query_handler(func=lambda call: call.data.startswith(SearchQuery.CALLBACK_PREFIX))
+        async def cb_next_handler(call):
+            """
+            Sends the next page of a search, usually prefetched, and prefetches the following one.
+
+            :param call: The callback query from Telegram, whose data encodes the query of the page.
+            """
+            query = SearchQuery.from_callback(call.data)
+            await self.bot.delete_message(call.message.chat.id, call.message.message_id)
+            if query is None:
+                await self.bot.send_message(call.message.chat.id, text=self.INFO_TEXT,
+                                            reply_markup=self.gen_inline_menu())
+                return
+            response_json = await self.site.search(query)
+            self.prefetch_next_page(query, response_json)
+            await self.send_results(call.message.chat.id, self.page_header(query), response_json,
+                                    self.gen_results_menu(query, response_json))
+
+        @self.bot.message_handler(func=lambda message: True)
+        async def handle_default(message):
+            """
+            Default handler for any messages not captured by other handlers. Deletes the user's message.
+
+            :param message: The message object from the user.
+            :return: None
+            """
+            await self.bot.delete_message(message.chat.id, message.message_id)
+
+        self.instrument_handlers()
+
+    async def run(self):
+        """
+        Polls Telegram for updates until stopped, then closes the Telegram and site API sessions.
+        """
+        self.bot.add_custom_filter(asyncio_filters.StateFilter(self.bot))
+        self.bot.add_custom_filter(asyncio_filters.IsDigitFilter())
+        try:
+            await self.bot.infinity_polling(skip_pending=True)
+        finally:
+            await self.bot.close_session()
+            await self.site.close()
+            logger.info('Async site API transport stats: %s', self.site.transport.stats())
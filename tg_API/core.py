@@ -3,14 +3,27 @@
 from telebot import TeleBot
 from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
 
+import metrics
 from log_config import logger
+from rate_limit import RateLimiter, RateLimitedBot
 from site_API.core import SiteApi
+from site_API.common.models import SearchQuery
 from telebot import custom_filters
 from telebot.handler_backends import State, StatesGroup
-from telebot.storage import StateMemoryStorage
-from database.common.models import History
+from telebot.storage import StateMemoryStorage, StateStorageBase
+from database.common.models import History, Title
 from database.core import db_manage, db
+from database.utils.retention import trim_history
+from database.utils.writer import BatchWriter
+from tg_API.utils.history_cache import HistoryEntry, HistoryRing
+from tg_API.utils.poster_cache import PosterCache
+from tg_API.utils.delivery import send_results
+from tg_API.webhook import WebhookServer
 import html
+from datetime import datetime
+from typing import Iterable, Optional
+from urllib.parse import urlparse
+from peewee import fn
 
 
 class MyStates(StatesGroup):
@@ -45,74 +58,179 @@ class Bot:
     oneFive = ["1", "2", "3", "4", "5"]
     oneTen = ["1", "2", "3", "4", "5", "6", "7", "8", "9", "10"]
 
-    def __init__(self, token: str, site: SiteApi):
+    def __init__(self, token: str, site: SiteApi, num_threads: int = 2, threaded: bool = True,
+                 history_writer: Optional[BatchWriter] = None, history_ring: Optional[HistoryRing] = None,
+                 state_storage: Optional[StateStorageBase] = None, limiter: Optional[RateLimiter] = None,
+                 admin_ids: Iterable[int] = (), posters: Optional[PosterCache] = None, history_keep: int = 0):
         """
         Initialize the bot with necessary configurations.
 
         :param token: Telegram API token provided by BotFather.
         :param site: Instance of SiteApi to interact with movie data.
+        :param num_threads: Number of worker threads handling updates in parallel.
+        :param threaded: Whether TeleBot dispatches handlers to its own worker threads. Disable it when the caller
+                         already runs process_new_updates in a worker pool (webhook mode).
+        :param history_writer: Optional write-behind sink for history records; records are stored synchronously
+                               when omitted.
+        :param history_ring: Optional in-memory cache of rendered history entries; a default one is created when
+                             omitted.
+        :param state_storage: Optional storage of the conversation states; states are kept in memory only when
+                              omitted.
+        :param limiter: Optional rate limiter every call to Telegram waits for, to stay within the flood limits.
+        :param admin_ids: Telegram user IDs allowed to use the /metrics command.
+        :param posters: Optional cache of the file_ids of the posters already uploaded to Telegram; posters are
+                        always sent by URL when omitted.
+        :param history_keep: Latest history records kept per user when a record is stored without the writer (the
+                             writer's store function trims its batches); 0 keeps them all.
         """
-        state_storage = StateMemoryStorage()
-        self.bot = TeleBot(token, state_storage=state_storage)
+        state_storage = state_storage or StateMemoryStorage()
+        self.bot = TeleBot(token, state_storage=state_storage, num_threads=num_threads, threaded=threaded)
+        if limiter is not None:
+            self.bot = RateLimitedBot(self.bot, limiter)
         self.site = site
+        self.history_writer = history_writer
+        self.history_ring = history_ring or HistoryRing(self.load_history_entries)
+        self.admin_ids = frozenset(admin_ids)
+        self.posters = posters
+        self.history_keep = history_keep
 
-    @staticmethod
-    def trim_user_history():
+    def get_user_data(self, call) -> dict:
         """
-        Trims the user history in the database to maintain only the latest 5 entries per user.
-        :return:
+        Returns a copy of the data collected so far in the user's conversation (content type, limit, rating range).
+        Read from the storage directly: retrieve_data() would save the data back when its context exits.
+
+        :param call: The callback query from Telegram.
+        :return: A dictionary with the user's search choices.
         """
+        return dict(self.bot.current_states.get_data(call.message.chat.id, call.from_user.id) or {})
 
-        # Query to find all user_ids in the history
-        user_ids = History.select(History.user_id).distinct()
+    @staticmethod
+    def trim_user_history(keep: int = 5):
+        """
+        Trims the user history in the database to maintain only the latest entries per user (see
+        retention.trim_history).
 
-        # Loop through each user and trim their history
-        for user_id in user_ids:
-            # Find the IDs of the latest 10 records for the user
-            latest_ids = (History.select(History.id)
-                          .where(History.user_id == user_id.user_id)
-                          .order_by(History.created_at.desc())
-                          .limit(5))
+        :param keep: Number of latest records kept for every user.
+        :return: The number of deleted records.
+        """
+        return trim_history(keep)
 
-            # Delete all records for this user that are not in the latest 10
-            (History
-             .delete()
-             .where((History.user_id == user_id.user_id) & (History.id.not_in(latest_ids)))
-             .execute())
+    @classmethod
+    def popular_queries(cls, custom_limit: int = 10):
+        """
+        Returns the searches worth keeping warm: every fixed menu path (high/low for movies and series) and the
+        custom rating ranges users request most often. Queries use the largest limit, which also serves smaller ones.
+
+        :param custom_limit: How many custom rating ranges to include.
+        :return: A list of SearchQuery objects, most important first.
+        """
+        limit = int(cls.oneFive[-1])
+        queries = [SearchQuery.high(choice, limit) for choice in ("movie", "series")]
+        queries += [SearchQuery.low(choice, limit) for choice in ("movie", "series")]
+
+        # searches differ by limit, so counts are summed per rating range and content type
+        hits = fn.COUNT(History.id)
+        rows = (History.select(History.type, History.start_rating, History.end_rating)
+                .where(History.kind == 'CUSTOM')
+                .group_by(History.type, History.start_rating, History.end_rating)
+                .order_by(hits.desc())
+                .limit(custom_limit))
+        queries += [SearchQuery.custom(row.type, limit, row.start_rating, row.end_rating) for row in rows]
+        return queries
 
     @staticmethod
-    def log_user_action(user_id, action, response=None):
+    def action_text(kind, query: SearchQuery) -> str:
+        """
+        Describes a search, as shown above its results and in the history.
+
+        :param kind: The kind of search ('TOP', 'MID' or 'CUSTOM').
+        :param query: The search.
+        :return: The description, e.g. "TOP 5 MOVIES" or "CUSTOM [3-7] 5 SERIES".
         """
-        Logs user actions and their responses to the database.
+        if kind == 'CUSTOM':
+            return f"CUSTOM [{query.start_rating}-{query.end_rating}] {query.limit} {query.label}"
+        return f"{kind} {query.limit} {query.label}"
+
+    def log_user_action(self, user_id, kind, query: SearchQuery, results=None):
+        """
+        Logs a search to the database, through the write-behind sink if there is one. The record holds the search
+        and the ids of the titles sent; the titles themselves are added to the title table if they are missing.
+        A title without an nfid cannot be referenced and only appears in the in-memory history.
 
         :param user_id: The user ID from Telegram.
-        :param action: The action performed by the user.
-        :param response: The response from the bot to the action, optional.
+        :param kind: The kind of search ('TOP', 'MID' or 'CUSTOM').
+        :param query: The search.
+        :param results: The title records sent to the user, optional.
         """
-        db_manage.store(db, History, [{"user_id": user_id, "action": action, "response": response}])
+        results = results or []
+        record = {"user_id": user_id, "kind": kind, "type": query.type, "limit": query.limit,
+                  "start_rating": query.start_rating, "end_rating": query.end_rating,
+                  "title_ids": ",".join(str(title.nfid) for title in results if title.nfid is not None),
+                  "created_at": datetime.now(), "titles": results}
+        self.history_ring.push(user_id, HistoryEntry(self.action_text(kind, query),
+                                                     tuple(title.title for title in results)))
+        if self.history_writer is not None:
+            self.history_writer.write(record)
+        else:
+            db_manage.store_history(db, [record], keep=self.history_keep)
 
     @staticmethod
     def get_user_history(user_id):
         """
-        Retrieves formatted user history for display.
+        Retrieves the user's latest history records.
 
         :param user_id: The user ID from Telegram.
-        :return: Formatted history string for display.
+        :return: The records, newest first.
         """
         return db_manage.retrieve(History, History.user_id == user_id, order_by=[History.created_at.desc()], limit=5)
 
+    @staticmethod
+    def render_history_entry(entry: HistoryEntry) -> str:
+        """
+        Renders a history entry for display, without its position number.
+
+        :param entry: The entry.
+        :return: The rendered entry.
+        """
+        return f"{entry.action}\n" + "".join(f"{title}\n" for title in entry.titles)
+
+    @classmethod
+    def load_history_entries(cls, user_id):
+        """
+        Loads the user's latest history records from the database, with the names of the titles they reference.
+        Records stored before history was normalized keep their text.
+
+        :param user_id: The user ID from Telegram.
+        :return: A list of entries, newest first.
+        """
+        records = cls.get_user_history(user_id) or []
+        ids = {int(nfid) for record in records for nfid in record.title_ids.split(',') if nfid}
+        names = dict(Title.select(Title.nfid, Title.title).where(Title.nfid.in_(list(ids))).tuples()) if ids else {}
+        entries = []
+        for record in records:
+            if record.type is None:  # an action that could not be converted
+                action = record.action or ''
+            else:
+                action = cls.action_text(record.kind, SearchQuery(type=record.type, limit=record.limit,
+                                                                  start_rating=record.start_rating,
+                                                                  end_rating=record.end_rating))
+            if record.response is not None:
+                titles = tuple(html.unescape(record.response).splitlines())
+            else:
+                titles = tuple(names[int(nfid)] for nfid in record.title_ids.split(',') if nfid and int(nfid) in names)
+            entries.append(HistoryEntry(action, titles))
+        return entries
+
     def format_history_for_display(self, user_id):
         """
-        Formats the user's action history for display.
+        Formats the user's action history for display. Entries come from the in-memory history ring, so only the
+        first request of a user who is not in memory queries the database.
 
         :param user_id: The user ID from Telegram.
         :return: A string that represents the formatted user history.
         """
-        history_records = self.get_user_history(user_id)
-        history_list = []
-        for index, record in enumerate(history_records, start=1):
-            entry = f"{index}. {record.action}\n{html.unescape(record.response)}"
-            history_list.append(entry)
+        history_list = [f"{index}. {self.render_history_entry(entry)}"
+                        for index, entry in enumerate(self.history_ring.get(user_id), start=1)]
         return "\n".join(history_list) if history_list else "No history available."
 
     @classmethod
@@ -183,6 +301,70 @@ class Bot:
                    InlineKeyboardButton("history", callback_data="cb_history"))
         return markup
 
+    @staticmethod
+    def get_results(response_json) -> list:
+        """
+        Returns the title records of a site API response.
+
+        :param response_json: The site API response.
+        :return: The records; an empty list for an error response.
+        """
+        return (response_json.get("results") if isinstance(response_json, dict) else None) or []
+
+    @classmethod
+    def has_next_page(cls, query: SearchQuery, response_json) -> bool:
+        """
+        Tells whether a search may have more results after this page: a short page is the last one.
+
+        :param query: The search that was performed.
+        :param response_json: The site API response.
+        :return: True if the next page is worth offering.
+        """
+        results = cls.get_results(response_json)
+        return bool(results) and len(results) >= query.limit
+
+    @classmethod
+    def gen_results_menu(cls, query: SearchQuery, response_json):
+        """
+        Generates the main menu shown under search results, with a 'next' button when there may be more results.
+        The button carries the next page's query, so paging needs no conversation state.
+
+        :param query: The search whose page was sent.
+        :param response_json: The site API response.
+        :return: InlineKeyboardMarkup object for the main command menu, plus the 'next' button.
+        """
+        markup = cls.gen_inline_menu()
+        if cls.has_next_page(query, response_json):
+            markup.add(InlineKeyboardButton("next ▶", callback_data=query.next_page().to_callback()))
+        return markup
+
+    @staticmethod
+    def page_header(query: SearchQuery) -> str:
+        """
+        Builds the line describing a page of results, e.g. "TOP 5 MOVIES (6-10)".
+
+        :param query: The search of the page.
+        :return: The header.
+        """
+        if query.start_rating is None:
+            req = 'TOP'
+        elif (query.start_rating, query.end_rating) == (0, 4):
+            req = 'MID'
+        else:
+            req = f"CUSTOM [{query.start_rating}-{query.end_rating}]"
+        return f"{req} {query.limit} {query.label} ({query.offset}-{query.offset + query.limit - 1})"
+
+    def prefetch_next_page(self, query: SearchQuery, response_json):
+        """
+        Starts fetching the page after this one into the response cache, so a tap on 'next' is answered at once.
+
+        :param query: The search whose page is being sent.
+        :param response_json: The site API response.
+        :return: None
+        """
+        if self.has_next_page(query, response_json):
+            self.site.prefetch(query.next_page())
+
     @classmethod
     def gen_numeric_choice(cls, start, end, callback_prefix):
         """
@@ -209,6 +391,16 @@ class Bot:
         :return: None
         """
 
+        @self.bot.message_handler(commands=['metrics'], func=lambda message: message.from_user.id in self.admin_ids)
+        def send_metrics(message):
+            """
+            Sends the operation latency report to an administrator. Other users fall through to the default handler.
+
+            :param message: The message object containing user and chat details.
+            :return: None
+            """
+            self.bot.send_message(message.chat.id, metrics.summary()[:4096])
+
         @self.bot.message_handler(commands=['start', 'help', 'hello-world'])
         def send_welcome(message):
             """
@@ -300,20 +492,23 @@ class Bot:
         def cb_choice_handler(call):
             """
             Responds to the user's selection of either 'Movies' or 'Series' from the type choice menu.
-            This method updates the user's choice in the site API, deletes the previous message,
+            This method stores the user's choice in their conversation data, deletes the previous message,
             and prompts the user to specify the number of titles they want to find, providing an
             appropriate inline keyboard for selection.
 
             :param call: The callback query from Telegram, containing the user's choice.
             """
             self.bot.delete_message(call.message.chat.id, call.message.message_id)
+            if self.bot.get_state(call.from_user.id, call.message.chat.id) is None:
+                self.bot.send_message(call.message.chat.id, text=self.INFO_TEXT, reply_markup=self.gen_inline_menu())
+                return
             text = "How many {} would you like to find?\n(you may have to wait up to 20 seconds)"
             if call.data == "cb_movies":
-                self.site.set_choice("movie")
+                self.bot.add_data(call.from_user.id, call.message.chat.id, type="movie")
                 self.bot.send_message(call.message.chat.id, text=text.format("movies"),
                                       reply_markup=self.gen_limit_choice())
             elif call.data == "cb_series":
-                self.site.set_choice("series")
+                self.bot.add_data(call.from_user.id, call.message.chat.id, type="series")
                 self.bot.send_message(call.message.chat.id, text=text.format("series"),
                                       reply_markup=self.gen_limit_choice())
 
@@ -323,43 +518,31 @@ class Bot:
             """
             Handles user responses after selecting the type of content (movies or series) and the number of titles they want to fetch.
             This method determines if the user's query should fetch high or low rated titles based on the previously set state.
-            It retrieves the requested titles from the API, sends them to the user, and logs the interaction. After sending the data,
-            it cleans up by deleting the previous messages and states and then returns the user to the main menu.
+            It retrieves the requested titles from the API, sends them to the user as one media group, and logs the interaction.
+            It cleans up by deleting the previous message and state and returns the user to the main menu.
 
             :param call: The callback query from Telegram, containing the user's numeric choice which specifies the number of titles.
             """
-            self.site.set_lim(call.data)
-            choice = 'MOVIES' if self.site.params["type"] == 'movie' else 'SERIES'
+            data = self.get_user_data(call)
             state = str(self.bot.get_state(call.from_user.id, call.message.chat.id))
             req = None
 
-            if state == str(MyStates.high_selected):
-                response_json = self.site.get_high()
-                req = 'TOP'
-            elif state == str(MyStates.low_selected):
-                response_json = self.site.get_low()
+            if state == str(MyStates.low_selected):
+                query = SearchQuery.low(data.get("type", "movie"), call.data)
                 req = 'MID'
             else:
-                logger.exception('request without state')
-                response_json = self.site.get_high()
+                if state == str(MyStates.high_selected):
+                    req = 'TOP'
+                else:
+                    logger.exception('request without state')
+                query = SearchQuery.high(data.get("type", "movie"), call.data)
+            response_json = self.site.search(query)
+            self.prefetch_next_page(query, response_json)
             self.bot.delete_message(call.message.chat.id, call.message.message_id)
-            self.bot.send_message(call.message.chat.id, "{} {} {}".format(req, call.data, choice))
-
-            titles = ''
-            if "results" in response_json:
-                for i, title in enumerate(response_json["results"]):
-                    description = html.unescape(f"{i + 1}. {title['title']}\n\n"
-                                                f"{title['synopsis']}\n\n"
-                                                f"imdbrating: {title['imdbrating']}")
-                    self.bot.send_photo(call.message.chat.id, photo=title["img"], caption=description)
-                    titles += f"{title['title']}\n"
-            else:
-                self.bot.send_message(call.message.chat.id, text="no results")
-
             self.bot.delete_state(call.from_user.id, call.message.chat.id)
-            self.bot.send_message(call.message.chat.id, text=self.INFO_TEXT, reply_markup=self.gen_inline_menu())
-            self.log_user_action(call.from_user.id,
-                                 "{} {} {}".format(req, call.data, choice), titles)
+            send_results(self.bot, call.message.chat.id, self.action_text(req, query), response_json, self.INFO_TEXT,
+                         self.gen_results_menu(query, response_json), self.posters)
+            self.log_user_action(call.from_user.id, req, query, self.get_results(response_json))
 
         @self.bot.callback_query_handler(state=MyStates.custom_selected,
                                          func=lambda call: call.data in self.oneFive)
@@ -372,7 +555,7 @@ class Bot:
 
             :param call: The callback query from Telegram, which includes the user's selection for the number of results they desire.
             """
-            self.site.set_lim(call.data)
+            self.bot.add_data(call.from_user.id, call.message.chat.id, limit=call.data)
             self.bot.delete_message(call.message.chat.id, call.message.message_id)
             self.bot.set_state(call.from_user.id, MyStates.custom_low_set, call.message.chat.id)
             self.bot.send_message(call.message.chat.id, "Set low:", reply_markup=self.gen_rating_choice())
@@ -387,7 +570,7 @@ class Bot:
 
             :param call: The callback query from Telegram, which includes the user's selection for the high boundary of the rating.
             """
-            self.site.set_low(call.data)
+            self.bot.add_data(call.from_user.id, call.message.chat.id, low=call.data)
             self.bot.delete_message(call.message.chat.id, call.message.message_id)
             self.bot.set_state(call.from_user.id, MyStates.custom_high_set, call.message.chat.id)
             self.bot.send_message(call.message.chat.id, "Set high: (you may have to wait up to 20 seconds)",
@@ -403,25 +586,35 @@ class Bot:
 
             :param call: The callback query from Telegram, which includes the user's selection for the high boundary of the rating.
             """
-            response_json = self.site.get_custom(call.data)
-            choice = 'MOVIES' if self.site.params["type"] == 'movie' else 'SERIES'
-            req = f"CUSTOM [{self.site.params.get('start_rating')}-{call.data}] {self.site.params['limit']} {choice}"
+            data = self.get_user_data(call)
+            query = SearchQuery.custom(data.get("type", "movie"), data.get("limit", 5), data.get("low", 0), call.data)
+            response_json = self.site.search(query)
+            self.prefetch_next_page(query, response_json)
 
             self.bot.delete_message(call.message.chat.id, call.message.message_id)
-            self.bot.send_message(call.message.chat.id, text=req)
-            titles = ''
-            if "results" in response_json:
-                for i, title in enumerate(response_json["results"]):
-                    description = html.unescape(f"{i + 1}. {title['title']}\n\n"
-                                                f"{title['synopsis']}\n\n"
-                                                f"imdbrating: {title['imdbrating']}")
-                    self.bot.send_photo(call.message.chat.id, photo=title["img"], caption=description)
-                    titles += f"{title['title']}\n"
-            else:
-                self.bot.send_message(call.message.chat.id, text="no results")
             self.bot.delete_state(call.from_user.id, call.message.chat.id)
-            self.bot.send_message(call.message.chat.id, text=self.INFO_TEXT, reply_markup=self.gen_inline_menu())
-            self.log_user_action(call.from_user.id, req, titles)
+            send_results(self.bot, call.message.chat.id, self.action_text('CUSTOM', query), response_json,
+                         self.INFO_TEXT, self.gen_results_menu(query, response_json), self.posters)
+            self.log_user_action(call.from_user.id, 'CUSTOM', query, self.get_results(response_json))
+
+        @self.bot.callback_query_handler(func=lambda call: call.data.startswith(SearchQuery.CALLBACK_PREFIX))
+        def cb_next_handler(call):
+            """
+            Sends the next page of a search when the user taps 'next' under the results. The page was usually
+            prefetched while the user was reading the previous one, and the following page is prefetched in turn.
+            The menu under the previous page is replaced by the one under the new page.
+
+            :param call: The callback query from Telegram, whose data encodes the query of the page.
+            """
+            query = SearchQuery.from_callback(call.data)
+            self.bot.delete_message(call.message.chat.id, call.message.message_id)
+            if query is None:
+                self.bot.send_message(call.message.chat.id, text=self.INFO_TEXT, reply_markup=self.gen_inline_menu())
+                return
+            response_json = self.site.search(query)
+            self.prefetch_next_page(query, response_json)
+            send_results(self.bot, call.message.chat.id, self.page_header(query), response_json, self.INFO_TEXT,
+                         self.gen_results_menu(query, response_json), self.posters)
 
         @self.bot.message_handler(func=lambda message: True)
         def handle_default(message):
@@ -434,12 +627,57 @@ class Bot:
             """
             self.bot.delete_message(message.chat.id, message.message_id)
 
+        self.instrument_handlers()
+
+    def instrument_handlers(self):
+        """
+        Wraps every registered message and callback query handler so its calls are timed and counted in the metrics,
+        and records the 'ready' and 'first_update' startup phases.
+
+        :return: None
+        """
+        for handlers in (self.bot.message_handlers, self.bot.callback_query_handlers):
+            for handler in handlers:
+                handler['function'] = metrics.first_call(metrics.instrument(handler['function'], 'handler'),
+                                                         'first_update')
+        metrics.startup_phase('ready')
+
+    def add_filters(self):
+        """
+        Sets up the custom filters used by the handlers to manage state and digit-based data accurately.
+
+        :return: None
+        """
+        self.bot.add_custom_filter(custom_filters.StateFilter(self.bot))
+        self.bot.add_custom_filter(custom_filters.IsDigitFilter())
+
     def run(self):
         """
         Initiates the bot's polling to listen for Telegram updates continuously.
         This method is responsible for keeping the bot responsive to user commands and interactions.
-        It includes the setup of custom filters to manage state and digit-based data accurately.
         """
-        self.bot.add_custom_filter(custom_filters.StateFilter(self.bot))
-        self.bot.add_custom_filter(custom_filters.IsDigitFilter())
+        self.add_filters()
         self.bot.infinity_polling(skip_pending=True)
+
+    def run_webhook(self, url: str, listen: str = "0.0.0.0", port: int = 8443, secret_token: Optional[str] = None,
+                    workers: int = 8, queue_size: int = 100):
+        """
+        Registers the webhook with Telegram and serves updates pushed to it instead of long polling.
+        Updates queued by Telegram while the bot was down are delivered once the webhook is set.
+
+        :param url: Public HTTPS URL Telegram posts updates to; its path is served locally.
+        :param listen: Local address the HTTP server listens on.
+        :param port: Local port the HTTP server listens on.
+        :param secret_token: Secret token Telegram must send with every update.
+        :param workers: Number of threads handling updates.
+        :param queue_size: Number of updates allowed to wait for a free worker.
+        """
+        self.add_filters()
+        server = WebhookServer(self.bot, listen=listen, port=port, path=urlparse(url).path or "/",
+                               secret_token=secret_token, workers=workers, queue_size=queue_size)
+        self.bot.remove_webhook()
+        self.bot.set_webhook(url=url, secret_token=secret_token, max_connections=workers)
+        try:
+            server.serve_forever()
+        finally:
+            self.bot.remove_webhook()
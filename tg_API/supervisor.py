@@ -0,0 +1,316 @@
+# tg_API\supervisor.py
+
+import multiprocessing
+import queue
+import signal
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from telebot import apihelper
+from telebot.types import Update
+
+from log_config import listen, logger
+
+
+def update_user_id(update: Dict) -> int:
+    """
+    Returns the ID updates are sharded by: the user who caused the update, else its chat, else the update ID.
+
+    :param update: The raw update received from Telegram.
+    :return: The sharding ID.
+    """
+    for key, value in update.items():
+        if key == 'update_id' or not isinstance(value, dict):
+            continue
+        user = value.get('from') or value.get('user')
+        if user:
+            return user['id']
+        chat = value.get('chat') or (value.get('message') or {}).get('chat')
+        if chat:
+            return chat['id']
+    return update['update_id']
+
+
+class WorkerChannel:
+    """
+    The link between the supervisor and one worker process: the worker's update queue and the shared values it
+    reports through. It is handed to the worker function, which builds its bot and calls serve().
+
+    Attributes:
+        index (int): Number of the worker.
+        updates (multiprocessing.Queue): Raw updates routed to the worker; None asks it to stop.
+        heartbeat (multiprocessing.Value): Time of the worker's last sign of life, updated by a thread of its own so
+            a long update (HTTP retries, backoff, rate limiter waits) does not count as a hang.
+        busy_since (multiprocessing.Value): Time the worker started handling its current update, 0 while idle.
+        handled (multiprocessing.Value): Number of updates the worker has handled.
+        logs (multiprocessing.Queue): Log records the worker sends to the supervisor, shared by all workers; pass it
+            to log_config.forward_logs() in the worker.
+    """
+    def __init__(self, context, index: int, queue_size: int, logs=None):
+        """
+        Creates the queue and the shared values.
+
+        :param context: The multiprocessing context the worker is started with.
+        :param index: Number of the worker.
+        :param queue_size: Number of updates allowed to wait for the worker.
+        :param logs: The log record queue shared by the workers.
+        """
+        self.index = index
+        self.logs = logs
+        self.updates = context.Queue(maxsize=queue_size)
+        self.heartbeat = context.Value('d', time.time(), lock=False)
+        self.busy_since = context.Value('d', 0.0, lock=False)
+        self.handled = context.Value('q', 0, lock=False)
+
+    def serve(self, bot, interval: float = 1.0):
+        """
+        Handles the queued updates one at a time, in the order they were received, until the supervisor asks the
+        worker to stop. Runs in the worker process; heartbeats are sent by a separate thread, also while an update
+        is being handled.
+
+        :param bot: The TeleBot instance handling the updates; it should not be threaded, so order is kept.
+        :param interval: Seconds between two heartbeats.
+        :return: None
+        """
+        signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C reaches the whole group; the supervisor stops us
+        stopped = threading.Event()
+        threading.Thread(target=self._beat, args=(stopped, interval), name=f"worker-{self.index}-heartbeat",
+                         daemon=True).start()
+        logger.info("Worker %s started", self.index)
+        try:
+            while True:
+                update = self.updates.get()
+                if update is None:
+                    break
+                self.busy_since.value = time.time()
+                try:
+                    bot.process_new_updates([Update.de_json(update)])
+                except Exception as e:
+                    logger.error("Worker %s failed to handle update %s: %s", self.index, update.get('update_id'), e)
+                self.busy_since.value = 0.0
+                self.handled.value += 1
+        finally:
+            stopped.set()
+        logger.info("Worker %s stopped after %s updates", self.index, self.handled.value)
+
+    def _beat(self, stopped: threading.Event, interval: float):
+        """
+        Heartbeat loop executed by a thread of the worker process.
+
+        :param stopped: Event set when the worker stops serving.
+        :param interval: Seconds between two heartbeats.
+        :return: None
+        """
+        while True:
+            self.heartbeat.value = time.time()
+            if stopped.wait(interval):
+                return
+
+    def depth(self) -> Optional[int]:
+        """
+        Returns the number of updates waiting for the worker.
+
+        :return: The queue depth, or None where the platform cannot report it.
+        """
+        try:
+            return self.updates.qsize()
+        except NotImplementedError:
+            return None
+
+
+class Supervisor:
+    """
+    Receives updates once by long polling and fans them out to worker processes, so handlers run on every core
+    instead of sharing one GIL. Updates are sharded by user ID: all updates of a user go to the same worker, which
+    handles them in order, and the user's conversation state and history stay in that worker's caches.
+
+    Workers are started with the 'spawn' method and run target(*args, channel) where channel is their WorkerChannel.
+    A monitor thread restarts workers that died or stopped sending heartbeats, i.e. froze: heartbeats come from a
+    thread of their own, so a slow update does not count. The queue of a restarted worker is kept, so only the update
+    being handled when it failed is lost. Per-worker queue depth and throughput are logged every report_interval
+    seconds. Workers that forward their log records through channel.logs have them written to the supervisor's log
+    file, so a single process writes and rotates it.
+    """
+    def __init__(self, token: str, target: Callable, args: tuple = (), processes: int = 2, queue_size: int = 1000,
+                 heartbeat_timeout: float = 60.0, report_interval: float = 60.0, poll_timeout: int = 20,
+                 log_queue_size: int = 10000):
+        """
+        Initializes the supervisor without starting any process.
+
+        :param token: Telegram API token provided by BotFather.
+        :param target: Module-level function run in every worker process; it must call channel.serve(bot).
+        :param args: Picklable arguments passed to target before the channel.
+        :param processes: Number of worker processes.
+        :param queue_size: Number of updates allowed to wait for each worker.
+        :param heartbeat_timeout: Seconds without a heartbeat after which a worker is considered hung and restarted.
+        :param report_interval: Seconds between two log lines with the worker statistics.
+        :param poll_timeout: Long polling timeout of getUpdates in seconds.
+        :param log_queue_size: Log records of the workers allowed to wait for the supervisor's log writer.
+        """
+        self.token = token
+        self.target = target
+        self.args = args
+        self.heartbeat_timeout = heartbeat_timeout
+        self.report_interval = report_interval
+        self.poll_timeout = poll_timeout
+        self.context = multiprocessing.get_context('spawn')
+        self.logs = self.context.Queue(maxsize=log_queue_size)
+        self.channels = [WorkerChannel(self.context, index, queue_size, self.logs) for index in range(processes)]
+        self.workers: List[Optional[multiprocessing.Process]] = [None] * processes
+        self.restarts = [0] * processes
+        self.received = 0
+        self._stop = threading.Event()
+        self._monitor = threading.Thread(target=self._watch, name="supervisor-monitor", daemon=True)
+        self._last_report = (time.monotonic(), [0] * processes)
+
+    def _spawn(self, index: int):
+        """
+        Starts the worker process of a channel.
+
+        :param index: Number of the worker.
+        :return: None
+        """
+        channel = self.channels[index]
+        channel.heartbeat.value = time.time()  # grace period while the worker starts
+        worker = self.context.Process(target=self.target, args=(*self.args, channel), name=f"bot-worker-{index}",
+                                      daemon=True)
+        worker.start()
+        self.workers[index] = worker
+        logger.info("Started worker %s (pid %s)", index, worker.pid)
+
+    def start(self):
+        """
+        Starts the writer of the workers' log records, every worker process and the monitor thread.
+
+        :return: None
+        """
+        listen(self.logs)
+        for index in range(len(self.channels)):
+            self._spawn(index)
+        self._monitor.start()
+
+    def check_workers(self):
+        """
+        Restarts workers that exited or whose last heartbeat is older than heartbeat_timeout.
+
+        :return: None
+        """
+        for index, worker in enumerate(self.workers):
+            if self._stop.is_set():
+                return
+            age = time.time() - self.channels[index].heartbeat.value
+            if worker.is_alive() and age < self.heartbeat_timeout:
+                continue
+            if worker.is_alive():
+                logger.error("Worker %s sent no heartbeat for %.0f s, restarting it", index, age)
+                worker.terminate()
+                worker.join(5)
+                if worker.is_alive():
+                    worker.kill()
+                    worker.join()
+            else:
+                logger.error("Worker %s exited with code %s, restarting it", index, worker.exitcode)
+            self.restarts[index] += 1
+            self._spawn(index)
+
+    def _watch(self):
+        """
+        Monitor loop executed by the background thread.
+
+        :return: None
+        """
+        while not self._stop.wait(1.0):
+            self.check_workers()
+            if time.monotonic() - self._last_report[0] >= self.report_interval:
+                logger.info("Supervisor stats: %s", self.stats())
+
+    def dispatch(self, update: Dict):
+        """
+        Routes a raw update to the queue of its user's worker. Blocks while that queue is full, which slows polling
+        down instead of letting a backlog grow without bound.
+
+        :param update: The raw update received from Telegram.
+        :return: None
+        """
+        channel = self.channels[update_user_id(update) % len(self.channels)]
+        while not self._stop.is_set():
+            try:
+                channel.updates.put(update, timeout=1.0)
+                self.received += 1
+                return
+            except queue.Full:
+                logger.warning("Queue of worker %s is full, waiting", channel.index)
+
+    def serve_forever(self, skip_pending: bool = True):
+        """
+        Polls Telegram for updates and dispatches them until stop() is called. The webhook, if any, is removed
+        first, since Telegram refuses getUpdates while one is set.
+
+        :param skip_pending: Whether updates sent while the bot was down are dropped, as with infinity_polling.
+        :return: None
+        """
+        apihelper.delete_webhook(self.token, drop_pending_updates=skip_pending)
+        offset = None
+        while not self._stop.is_set():
+            try:
+                updates = apihelper.get_updates(self.token, offset, 100, timeout=self.poll_timeout + 10,
+                                                long_polling_timeout=self.poll_timeout)
+            except Exception as e:
+                logger.error("Failed to get updates: %s", e)
+                self._stop.wait(3)
+                continue
+            for update in updates:
+                self.dispatch(update)
+                offset = update['update_id'] + 1  # acknowledged to Telegram by the next getUpdates
+
+    def stop(self, timeout: float = 30.0):
+        """
+        Stops polling, lets every worker finish its queue and waits for the processes to exit.
+
+        :param timeout: Seconds to wait for each worker before terminating it.
+        :return: None
+        """
+        self._stop.set()
+        if self._monitor.is_alive():
+            self._monitor.join()
+        for channel, worker in zip(self.channels, self.workers):
+            if worker is None:
+                continue
+            try:
+                channel.updates.put(None, timeout=timeout)
+            except queue.Full:
+                pass
+            worker.join(timeout)
+            if worker.is_alive():
+                logger.warning("Worker %s did not stop in time, terminating it", channel.index)
+                worker.terminate()
+                worker.join()
+        logger.info("Supervisor stopped: %s", self.stats())
+
+    def stats(self) -> Dict:
+        """
+        Returns the supervisor counters and, per worker, its queue depth, throughput since the previous call,
+        handled updates, restarts, heartbeat age and how long it has been handling its current update.
+
+        :return: A dictionary with the received updates and a list of worker statistics.
+        """
+        now = time.monotonic()
+        since, handled_before = self._last_report
+        handled = [channel.handled.value for channel in self.channels]
+        self._last_report = (now, handled)
+        elapsed = max(now - since, 1e-9)
+        workers = []
+        for index, channel in enumerate(self.channels):
+            worker = self.workers[index]
+            workers.append({"worker": index,
+                            "pid": worker.pid if worker is not None else None,
+                            "alive": worker is not None and worker.is_alive(),
+                            "queued": channel.depth(),
+                            "handled": handled[index],
+                            "per_second": round((handled[index] - handled_before[index]) / elapsed, 2),
+                            "restarts": self.restarts[index],
+                            "heartbeat_age": round(time.time() - channel.heartbeat.value, 1),
+                            "busy_for": round(time.time() - channel.busy_since.value, 1)
+                            if channel.busy_since.value else 0.0})
+        return {"received": self.received, "workers": workers}
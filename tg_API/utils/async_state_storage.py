@@ -0,0 +1,59 @@
+# tg_API\utils\async_state_storage.py
+
+import asyncio
+import functools
+
+from telebot.asyncio_storage import StateContext, StateStorageBase
+
+from tg_API.utils.state_storage import SqliteStateStorage
+
+
+class AsyncSqliteStateStorage(StateStorageBase):
+    """
+    Conversation state storage for AsyncTeleBot: the asyncio interface of a SqliteStateStorage, so the asyncio bot's
+    conversations survive restarts too. Calls run in the default executor, since a conversation seen for the first
+    time is loaded from the database.
+    """
+    def __init__(self, storage: SqliteStateStorage):
+        """
+        Wraps a storage; starting and closing it remain the caller's job.
+
+        :param storage: The SqliteStateStorage holding the states.
+        """
+        super().__init__()
+        self.storage = storage
+
+    async def _call(self, method: str, *args):
+        """
+        Runs a method of the wrapped storage in the default executor.
+
+        :param method: Name of the SqliteStateStorage method.
+        :param args: Its arguments.
+        :return: The value returned by the method.
+        """
+        return await asyncio.get_running_loop().run_in_executor(
+            None, functools.partial(getattr(self.storage, method), *args))
+
+    async def set_state(self, chat_id, user_id, state):
+        return await self._call('set_state', chat_id, user_id, state)
+
+    async def delete_state(self, chat_id, user_id):
+        return await self._call('delete_state', chat_id, user_id)
+
+    async def get_state(self, chat_id, user_id):
+        return await self._call('get_state', chat_id, user_id)
+
+    async def get_data(self, chat_id, user_id):
+        return await self._call('get_data', chat_id, user_id)
+
+    async def reset_data(self, chat_id, user_id):
+        return await self._call('reset_data', chat_id, user_id)
+
+    async def set_data(self, chat_id, user_id, key, value):
+        return await self._call('set_data', chat_id, user_id, key, value)
+
+    def get_interactive_data(self, chat_id, user_id):
+        return StateContext(self, chat_id, user_id)
+
+    async def save(self, chat_id, user_id, data):
+        return await self._call('save', chat_id, user_id, data)
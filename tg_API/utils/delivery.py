@@ -0,0 +1,155 @@
+# tg_API\utils\delivery.py
+
+from typing import Any, Dict, Generator, List, Optional, Tuple
+
+from telebot.types import InputMediaPhoto
+
+from site_API.common.models import TitleRecord
+
+CAPTION_LIMIT = 1024  # maximum caption length accepted by the Bot API
+MEDIA_GROUP_LIMIT = 10  # maximum number of items in one media group
+
+Call = Tuple[str, str, tuple, Dict[str, Any]]  # (target, method, args, kwargs) yielded by delivery_steps
+
+
+def build_caption(index: int, title: TitleRecord) -> str:
+    """
+    Builds the caption shown under a title's poster. The texts of the record were unescaped when it was parsed.
+
+    :param index: Position of the title in the results, starting at 1.
+    :param title: A single result of the site API.
+    :return: The caption.
+    """
+    return f"{index}. {title.title}\n\n{title.synopsis}\n\nimdbrating: {title.imdbrating}"
+
+
+def _fit(caption: str) -> str:
+    """
+    Shortens a caption to the Bot API limit.
+
+    :param caption: The caption.
+    :return: The caption, cut with an ellipsis if it is too long.
+    """
+    return caption if len(caption) <= CAPTION_LIMIT else caption[:CAPTION_LIMIT - 1] + "…"
+
+
+def render_results(header: str, results: List[TitleRecord],
+                   photos: Optional[List[str]] = None) -> List[List[InputMediaPhoto]]:
+    """
+    Renders search results into media groups. The header (e.g. "TOP 5 MOVIES") is folded into the first caption, so
+    the whole answer is delivered by one media group send instead of a message plus one photo per title.
+
+    :param header: The line describing the request.
+    :param results: The results of the site API.
+    :param photos: What to send as each title's poster (a file_id or a URL); the poster URLs by default.
+    :return: The media groups.
+    """
+    media = []
+    for i, title in enumerate(results):
+        caption = build_caption(i + 1, title)
+        if i == 0:
+            caption = f"{header}\n\n{caption}"
+        media.append(InputMediaPhoto(photos[i] if photos else title.img, caption=_fit(caption)))
+    groups = [media[i:i + MEDIA_GROUP_LIMIT] for i in range(0, len(media), MEDIA_GROUP_LIMIT)]
+    return groups
+
+
+def is_rejected_file(error: Exception) -> bool:
+    """
+    Tells whether Telegram refused a request because of its photos, e.g. an expired or unknown file_id.
+
+    :param error: The ApiTelegramException raised by the send, from telebot's sync or asyncio helper.
+    :return: True for a 400 Bad Request from the Bot API.
+    """
+    return getattr(error, 'error_code', None) == 400
+
+
+def _send_group(chat_id, group: List[InputMediaPhoto]) -> Generator[Call, Any, list]:
+    """
+    Sends one media group, or a photo when the group has a single item (a media group needs at least two).
+
+    :param chat_id: The chat to send the group to.
+    :param group: The photos.
+    :return: The sent messages, as the generator's return value; a list in both cases.
+    """
+    if len(group) == 1:
+        message = yield 'bot', 'send_photo', (chat_id,), {"photo": group[0].media, "caption": group[0].caption}
+        return [message]
+    return (yield 'bot', 'send_media_group', (chat_id, group), {})
+
+
+def delivery_steps(chat_id, header: str, response_json, menu_text: str, reply_markup=None,
+                   posters=None) -> Generator[Call, Any, int]:
+    """
+    The delivery of search results, written once for the threaded and the asyncio bot: a generator yielding every
+    call to make as (target, method, args, kwargs), where target is 'bot' or 'posters', and receiving its result, or
+    its exception through throw(). send_results() runs it on TeleBot, AsyncBot.send_results() awaits the calls.
+
+    Results go out with as few Telegram calls as the Bot API allows: a single photo or one media group per ten
+    titles, followed by the menu. Media groups cannot carry a keyboard, so the menu stays a separate message, except
+    when there are no results and it is attached to the "no results" message. Posters already uploaded are sent by
+    file_id, and by URL again if Telegram rejects the file_id.
+
+    :param chat_id: The chat to send the results to.
+    :param header: The line describing the request.
+    :param response_json: The site API response.
+    :param menu_text: The text of the menu message sent after the results.
+    :param reply_markup: The menu keyboard.
+    :param posters: The PosterCache, or None to always send posters by URL.
+    :return: The number of titles sent, as the generator's return value.
+    """
+    results = response_json.get("results") if isinstance(response_json, dict) else None
+    if not results:
+        yield 'bot', 'send_message', (chat_id,), {"text": f"{header}\nno results\n\n{menu_text}",
+                                                  "reply_markup": reply_markup}
+        return 0
+
+    urls = [title.img for title in results]
+    photos = (yield 'posters', 'resolve_many', (urls,), {}) if posters is not None else None
+    groups = render_results(header, results, photos)
+    start = 0
+    for group in groups:
+        group_urls = urls[start:start + len(group)]
+        start += len(group)
+        try:
+            messages = yield from _send_group(chat_id, group)
+        except Exception as e:  # the sync and asyncio helpers raise different ApiTelegramException classes
+            cached = [url for url, item in zip(group_urls, group) if item.media != url]
+            if not cached or not is_rejected_file(e):
+                raise
+            yield 'posters', 'forget', (cached,), {}
+            for url, item in zip(group_urls, group):
+                item.media = url
+            messages = yield from _send_group(chat_id, group)
+        if posters is not None:
+            yield 'posters', 'remember', (group_urls, messages), {}
+    yield 'bot', 'send_message', (chat_id,), {"text": menu_text, "reply_markup": reply_markup}
+    return len(results)
+
+
+def send_results(bot, chat_id, header: str, response_json, menu_text: str, reply_markup=None, posters=None) -> int:
+    """
+    Delivers search results on the threaded bot, see delivery_steps.
+
+    :param bot: The TeleBot instance.
+    :param chat_id: The chat to send the results to.
+    :param header: The line describing the request.
+    :param response_json: The site API response.
+    :param menu_text: The text of the menu message sent after the results.
+    :param reply_markup: The menu keyboard.
+    :param posters: The PosterCache; posters already uploaded are then sent by file_id instead of by URL.
+    :return: The number of titles sent.
+    """
+    steps = delivery_steps(chat_id, header, response_json, menu_text, reply_markup, posters)
+    targets = {'bot': bot, 'posters': posters}
+    result, error = None, None
+    while True:
+        try:
+            target, method, args, kwargs = steps.throw(error) if error is not None else steps.send(result)
+        except StopIteration as done:
+            return done.value
+        result, error = None, None
+        try:
+            result = getattr(targets[target], method)(*args, **kwargs)
+        except Exception as e:
+            error = e
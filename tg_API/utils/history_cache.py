@@ -0,0 +1,99 @@
+# tg_API\utils\history_cache.py
+
+import threading
+from collections import OrderedDict, deque
+from typing import Callable, Dict, List, NamedTuple, Tuple
+
+
+class HistoryEntry(NamedTuple):
+    """
+    A history record as kept in memory, rendered for display only when the history is shown.
+
+    Attributes:
+        action (str): The search the user made, e.g. "CUSTOM [3-7] 5 MOVIES".
+        titles (tuple): Names of the titles that were sent.
+    """
+    action: str
+    titles: Tuple[str, ...]
+
+
+class HistoryRing:
+    """
+    In-memory ring of every active user's latest history entries (see HistoryEntry). A user's ring is
+    filled from the database on first access and then kept up to date as new actions are logged, so showing the
+    history of an active user costs no query. The number of users kept is capped; the least recently active users
+    are evicted first and reloaded from the database when they come back.
+    """
+    def __init__(self, loader: Callable[[int], List[HistoryEntry]], size: int = 5, max_users: int = 10000):
+        """
+        Initializes an empty cache.
+
+        :param loader: Callable returning a user's latest entries from the database, newest first.
+        :param size: Number of entries kept per user.
+        :param max_users: Maximum number of users kept in memory.
+        """
+        self.loader = loader
+        self.size = size
+        self.max_users = max_users
+        self._rings = OrderedDict()  # user_id -> deque of entries, newest first; least recently active user first
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.loads = 0
+        self.evictions = 0
+
+    def _ring(self, user_id: int) -> deque:
+        """
+        Returns the user's ring, loading it from the database if the user is not in memory.
+
+        :param user_id: The user ID from Telegram.
+        :return: The user's ring.
+        """
+        with self._lock:
+            ring = self._rings.get(user_id)
+            if ring is not None:
+                self._rings.move_to_end(user_id)
+                self.hits += 1
+                return ring
+
+        loaded = deque(self.loader(user_id)[:self.size], maxlen=self.size)  # queried outside the lock
+        with self._lock:
+            ring = self._rings.setdefault(user_id, loaded)  # another thread may have loaded it meanwhile
+            self._rings.move_to_end(user_id)
+            self.loads += 1
+            while len(self._rings) > self.max_users:
+                self._rings.popitem(last=False)
+                self.evictions += 1
+            return ring
+
+    def get(self, user_id: int) -> List[HistoryEntry]:
+        """
+        Returns the user's latest entries.
+
+        :param user_id: The user ID from Telegram.
+        :return: The entries, newest first.
+        """
+        ring = self._ring(user_id)
+        with self._lock:
+            return list(ring)
+
+    def push(self, user_id: int, entry: HistoryEntry):
+        """
+        Records a new entry. Call it before the entry is written to the database, so a first load cannot return it
+        twice.
+
+        :param user_id: The user ID from Telegram.
+        :param entry: The new entry.
+        :return: None
+        """
+        ring = self._ring(user_id)
+        with self._lock:
+            ring.appendleft(entry)
+
+    def stats(self) -> Dict:
+        """
+        Returns the cache counters.
+
+        :return: A dictionary with the number of users kept, hits, database loads and evictions.
+        """
+        with self._lock:
+            return {"users": len(self._rings), "hits": self.hits, "loads": self.loads, "evictions": self.evictions}
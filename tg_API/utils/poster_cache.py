@@ -0,0 +1,152 @@
+# tg_API\utils\poster_cache.py
+
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Iterable, List, Sequence
+
+from database.common.models import PosterFile
+from log_config import logger
+
+
+class PosterCache:
+    """
+    Cache of the file_id Telegram assigns to a poster after its first upload, keyed by the poster URL. Sending a
+    file_id reuses the stored image, while sending a URL makes Telegram download and process it again.
+
+    Recently used entries are kept in memory (LRU) in front of the poster_file table, which survives restarts and
+    is shared by worker processes. The table is trimmed to the most recently used rows. A file_id Telegram rejects
+    is forgotten, and the poster is sent by URL again.
+
+    Attributes:
+        PURGE_EVERY (int): Number of writes between two trims of the table.
+    """
+    PURGE_EVERY = 100
+
+    def __init__(self, max_entries: int = 5000, max_rows: int = 100000):
+        """
+        Initializes an empty memory tier.
+
+        :param max_entries: Maximum number of entries kept in memory.
+        :param max_rows: Maximum number of rows kept in the table.
+        """
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self._entries: OrderedDict = OrderedDict()  # url -> file_id, least recently used first
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.hits = 0
+        self.loads = 0
+        self.misses = 0
+        self.stored = 0
+        self.rejected = 0
+
+    def _insert(self, url: str, file_id: str):
+        """
+        Adds an entry to the memory tier, evicting the least recently used ones. Must be called with the lock held.
+
+        :param url: The poster URL.
+        :param file_id: The Telegram file identifier.
+        :return: None
+        """
+        self._entries[url] = file_id
+        self._entries.move_to_end(url)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def resolve_many(self, urls: Sequence[str]) -> List[str]:
+        """
+        Returns what to send for each poster: its file_id when known, else its URL. URLs missing from memory are
+        looked up in the table with a single query.
+
+        :param urls: The poster URLs.
+        :return: A file_id or the URL, for every URL in order.
+        """
+        resolved = {}
+        with self._lock:
+            for url in urls:
+                file_id = self._entries.get(url)
+                if file_id is not None:
+                    self._entries.move_to_end(url)
+                    resolved[url] = file_id
+            self.hits += len(resolved)
+        missing = [url for url in set(urls) if url and url not in resolved]
+        if missing:
+            try:
+                rows = list(PosterFile.select().where(PosterFile.url.in_(missing)))
+                if rows:
+                    PosterFile.update(used_at=datetime.now()).where(
+                        PosterFile.url.in_([row.url for row in rows])).execute()
+            except Exception as e:
+                logger.error("Failed to load poster file ids: %s", e)
+                rows = []
+            with self._lock:
+                for row in rows:
+                    self._insert(row.url, row.file_id)
+                    resolved[row.url] = row.file_id
+                self.loads += len(rows)
+                self.misses += len(missing) - len(rows)
+        return [resolved.get(url, url) for url in urls]
+
+    def remember(self, urls: Sequence[str], messages: Iterable):
+        """
+        Stores the file_id of every poster Telegram returned, in the order the posters were sent.
+
+        :param urls: The poster URLs.
+        :param messages: The messages returned by send_photo or send_media_group, one per URL.
+        :return: None
+        """
+        rows = []
+        now = datetime.now()
+        with self._lock:
+            for url, message in zip(urls, messages):
+                photo = getattr(message, 'photo', None)
+                if not url or not photo:
+                    continue
+                file_id = photo[-1].file_id  # the largest size
+                if self._entries.get(url) != file_id:
+                    self._insert(url, file_id)
+                    rows.append({"url": url, "file_id": file_id, "used_at": now})
+            self.stored += len(rows)
+        if not rows:
+            return
+        try:
+            PosterFile.insert_many(rows).on_conflict_replace().execute()
+            self._writes += 1
+            if self._writes % self.PURGE_EVERY == 0:
+                recent = PosterFile.select(PosterFile.url).order_by(PosterFile.used_at.desc()).limit(self.max_rows)
+                PosterFile.delete().where(PosterFile.url.not_in(recent)).execute()
+        except Exception as e:
+            logger.error("Failed to store poster file ids: %s", e)
+
+    def forget(self, urls: Sequence[str]):
+        """
+        Drops the file_id of posters Telegram no longer accepts, so they are sent by URL again.
+
+        :param urls: The poster URLs.
+        :return: None
+        """
+        with self._lock:
+            for url in urls:
+                self._entries.pop(url, None)
+            self.rejected += len(urls)
+        try:
+            PosterFile.delete().where(PosterFile.url.in_(list(urls))).execute()
+        except Exception as e:
+            logger.error("Failed to delete poster file ids: %s", e)
+        logger.warning("Telegram rejected %s cached poster file id(s), sending by URL", len(urls))
+
+    def stats(self) -> Dict:
+        """
+        Returns the cache counters.
+
+        :return: A dictionary with memory hits, table loads, misses (sent by URL), stored and rejected file ids,
+                 and the number of entries in memory.
+        """
+        with self._lock:
+            return {"hits": self.hits,
+                    "loads": self.loads,
+                    "misses": self.misses,
+                    "stored": self.stored,
+                    "rejected": self.rejected,
+                    "entries": len(self._entries)}
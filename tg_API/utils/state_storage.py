@@ -0,0 +1,317 @@
+# tg_API\utils\state_storage.py
+
+import json
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from peewee import EXCLUDED
+from telebot.storage import StateStorageBase, StateContext
+
+from database.common.models import ConversationState
+from log_config import logger
+
+
+class SqliteStateStorage(StateStorageBase):
+    """
+    Conversation state storage for TeleBot backed by the application database, with a write-through in-memory cache.
+    Every read is answered from memory; a conversation is loaded from the database only the first time this process
+    sees it. Changes are applied to memory immediately and persisted by a background thread in one transaction per
+    flush interval.
+
+    Conversations that have not changed for ttl seconds are considered abandoned: they read as empty, and are
+    dropped from memory and from the database by the background thread.
+
+    Several bot processes may share the table. Rows are only replaced by a newer change (updated_at), so a slow flush
+    of one process cannot undo the latest step made in another. A shared storage checks the updated_at of the row on
+    every read of a cached conversation (a primary key lookup of one column) and reloads it when another process
+    changed or deleted it. A change waits up to flush_interval before it is visible to the other processes. Without
+    shared, the cache is trusted, which is only safe when each conversation is handled by a single process, as in
+    multiprocess mode where the supervisor routes every update of a user to the same worker.
+
+    Attributes:
+        PURGE_EVERY (float): Seconds between two removals of expired conversations.
+    """
+    PURGE_EVERY = 60.0
+
+    def __init__(self, ttl: float = 86400.0, flush_interval: float = 1.0, shared: bool = True):
+        """
+        Initializes an empty storage without starting the background thread.
+
+        :param ttl: Seconds after the last change a conversation expires.
+        :param flush_interval: Maximum number of seconds a change waits before being persisted.
+        :param shared: Whether other processes may change the same conversations; cached ones are then checked
+                       against the database on every read.
+        """
+        super().__init__()
+        self.model = ConversationState
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.shared = shared
+        self._entries = {}  # (chat_id, user_id) -> {'state', 'data', 'updated_at'}, or None if known to be absent
+        self._dirty = set()  # keys changed since the last flush; a None entry is a pending deletion
+        self._deleted_at = {}  # key -> time of a pending deletion
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="state-writer", daemon=True)
+        self._last_purge = time.monotonic()
+        self.hits = 0
+        self.loads = 0
+        self.reloads = 0
+        self.flushed = 0
+        self.expired = 0
+
+    def start(self):
+        """
+        Starts the background writer.
+
+        :return: None
+        """
+        self._thread.start()
+
+    def close(self):
+        """
+        Persists every pending change and stops the background writer. Call it on shutdown.
+
+        :return: None
+        """
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        self.flush()
+        logger.info("Conversation state storage closed: %s", self.stats())
+
+    def _load(self, key: Tuple[int, int]) -> Optional[Dict]:
+        """
+        Reads a conversation from the database.
+
+        :param key: The (chat_id, user_id) pair.
+        :return: The entry, or None if there is no live conversation.
+        """
+        try:
+            row = (self.model.select()
+                   .where((self.model.chat_id == key[0]) & (self.model.user_id == key[1]) &
+                          (self.model.updated_at > time.time() - self.ttl))
+                   .first())
+        except Exception as e:
+            logger.error("Failed to load conversation state: %s", e)
+            return None
+        if row is None:
+            return None
+        return {'state': row.state, 'data': json.loads(row.data), 'updated_at': row.updated_at}
+
+    def _entry(self, chat_id, user_id) -> Optional[Dict]:
+        """
+        Returns the live entry of a conversation, loading it from the database on the first access.
+
+        :param chat_id: The chat ID.
+        :param user_id: The user ID.
+        :return: The entry, or None if there is no live conversation.
+        """
+        key = (chat_id, user_id)
+        with self._lock:
+            cached = key in self._entries
+            if cached:
+                self.hits += 1
+                entry = self._entries[key]
+                if entry is not None and entry['updated_at'] <= time.time() - self.ttl:
+                    self._entries[key] = entry = None  # abandoned; the row is removed by the next purge
+                if not self.shared:
+                    return entry
+        if cached:
+            return self._current(key)
+
+        loaded = self._load(key)  # queried outside the lock, unless called from a change
+        with self._lock:
+            self.loads += 1
+            return self._entries.setdefault(key, loaded)  # a change made meanwhile wins
+
+    def _current(self, key: Tuple[int, int]) -> Optional[Dict]:
+        """
+        Returns a cached conversation of a shared storage, reloaded if another process changed or deleted its row
+        since this one last read or wrote it. A change not yet flushed is kept unless the row is newer.
+
+        :param key: The (chat_id, user_id) pair.
+        :return: The entry, or None if there is no live conversation.
+        """
+        try:
+            stored = (self.model.select(self.model.updated_at)
+                      .where((self.model.chat_id == key[0]) & (self.model.user_id == key[1]))
+                      .scalar())
+        except Exception as e:
+            logger.error("Failed to check conversation state: %s", e)
+            with self._lock:
+                return self._entries.get(key)  # the cache is the best answer left
+        if stored is not None and stored <= time.time() - self.ttl:
+            stored = None  # abandoned, as if already purged
+        with self._lock:
+            entry = self._entries.get(key)
+            known = entry['updated_at'] if entry is not None else self._deleted_at.get(key)
+            if stored == known or (key in self._dirty and (stored is None or known is None or stored < known)):
+                return entry
+        loaded = self._load(key)
+        with self._lock:
+            if self._entries.get(key) is not entry:
+                return self._entries.get(key)  # changed by this process meanwhile
+            self.reloads += 1
+            self._entries[key] = loaded
+            self._dirty.discard(key)  # the newer row replaces a change not yet flushed
+            self._deleted_at.pop(key, None)
+            return loaded
+
+    def _changed(self, key: Tuple[int, int], entry: Optional[Dict]):
+        """
+        Records a change in memory and schedules it for persistence. Must be called with the lock held.
+
+        :param key: The (chat_id, user_id) pair.
+        :param entry: The new entry, None to delete the conversation.
+        :return: None
+        """
+        now = time.time()
+        if entry is None:
+            self._deleted_at[key] = now
+        else:
+            entry['updated_at'] = now
+            self._deleted_at.pop(key, None)
+        self._entries[key] = entry
+        self._dirty.add(key)
+
+    def set_state(self, chat_id, user_id, state):
+        if hasattr(state, 'name'):
+            state = state.name
+        with self._lock:
+            entry = self._entry(chat_id, user_id)
+            entry = {'state': state, 'data': entry['data'] if entry is not None else {}}
+            self._changed((chat_id, user_id), entry)
+        return True
+
+    def delete_state(self, chat_id, user_id):
+        with self._lock:
+            if self._entry(chat_id, user_id) is None:
+                return False
+            self._changed((chat_id, user_id), None)
+        return True
+
+    def get_state(self, chat_id, user_id):
+        entry = self._entry(chat_id, user_id)
+        return entry['state'] if entry is not None else None
+
+    def get_data(self, chat_id, user_id):
+        entry = self._entry(chat_id, user_id)
+        return entry['data'] if entry is not None else None
+
+    def reset_data(self, chat_id, user_id):
+        with self._lock:
+            entry = self._entry(chat_id, user_id)
+            if entry is None:
+                return False
+            self._changed((chat_id, user_id), {'state': entry['state'], 'data': {}})
+        return True
+
+    def set_data(self, chat_id, user_id, key, value):
+        with self._lock:
+            entry = self._entry(chat_id, user_id)
+            if entry is None:
+                raise RuntimeError('chat_id {} and user_id {} does not exist'.format(chat_id, user_id))
+            self._changed((chat_id, user_id), {'state': entry['state'], 'data': dict(entry['data'], **{key: value})})
+        return True
+
+    def get_interactive_data(self, chat_id, user_id):
+        return StateContext(self, chat_id, user_id)
+
+    def save(self, chat_id, user_id, data):
+        with self._lock:
+            entry = self._entry(chat_id, user_id)
+            if entry is None:
+                return False
+            self._changed((chat_id, user_id), {'state': entry['state'], 'data': data})
+        return True
+
+    def flush(self):
+        """
+        Persists every change made since the last flush in a single transaction.
+
+        :return: None
+        """
+        with self._lock:
+            if not self._dirty:
+                return
+            dirty, self._dirty = self._dirty, set()
+            upserts = [{'chat_id': key[0], 'user_id': key[1], 'state': entry['state'],
+                        'data': json.dumps(entry['data']), 'updated_at': entry['updated_at']}
+                       for key, entry in ((key, self._entries.get(key)) for key in dirty) if entry is not None]
+            deletions = {key: self._deleted_at.pop(key) for key in dirty if key in self._deleted_at}
+
+        model = self.model
+        try:
+            with model._meta.database.atomic():
+                if upserts:
+                    (model.insert_many(upserts)
+                     .on_conflict(conflict_target=[model.chat_id, model.user_id],
+                                  preserve=[model.state, model.data, model.updated_at],
+                                  where=(model.updated_at <= EXCLUDED.updated_at))
+                     .execute())
+                for (chat_id, user_id), deleted_at in deletions.items():
+                    (model.delete()
+                     .where((model.chat_id == chat_id) & (model.user_id == user_id) &
+                            (model.updated_at <= deleted_at))
+                     .execute())
+        except Exception as e:
+            logger.error("Failed to persist conversation states: %s", e)
+            with self._lock:
+                for key, deleted_at in deletions.items():
+                    self._deleted_at.setdefault(key, deleted_at)  # unless changed again meanwhile
+                self._dirty |= dirty
+            return
+        with self._lock:
+            self.flushed += len(dirty)
+
+    def purge(self):
+        """
+        Removes abandoned conversations from memory and from the database.
+
+        :return: The number of deleted rows.
+        """
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            stale = [key for key, entry in self._entries.items()
+                     if key not in self._dirty and (entry is None or entry['updated_at'] <= cutoff)]
+            for key in stale:
+                del self._entries[key]
+        try:
+            deleted = self.model.delete().where(self.model.updated_at <= cutoff).execute()
+        except Exception as e:
+            logger.error("Failed to purge conversation states: %s", e)
+            return 0
+        with self._lock:
+            self.expired += deleted
+        return deleted
+
+    def _run(self):
+        """
+        Writer loop executed by the background thread.
+
+        :return: None
+        """
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+            if time.monotonic() - self._last_purge >= self.PURGE_EVERY:
+                self._last_purge = time.monotonic()
+                self.purge()
+
+    def stats(self) -> Dict:
+        """
+        Returns the storage counters.
+
+        :return: A dictionary with cached conversations, memory hits, database loads, reloads of conversations
+                 changed by another process, persisted changes, pending changes and expired rows.
+        """
+        with self._lock:
+            return {"cached": len(self._entries),
+                    "hits": self.hits,
+                    "loads": self.loads,
+                    "reloads": self.reloads,
+                    "flushed": self.flushed,
+                    "pending": len(self._dirty),
+                    "expired": self.expired}
+
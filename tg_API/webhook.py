@@ -0,0 +1,164 @@
+# tg_API\webhook.py
+
+import hmac
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+from telebot.types import Update
+
+from log_config import logger
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    """
+    Threading HTTP server with a listen backlog large enough for Telegram's parallel webhook connections.
+    """
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class WebhookServer:
+    """
+    Small HTTP server receiving Telegram updates pushed to the bot's webhook. Each update is dispatched to a bounded
+    worker pool; when the pool and its queue are full the server answers 503 so Telegram retries the delivery later
+    instead of the backlog growing without bound.
+
+    Attributes:
+        SECRET_HEADER (str): Header in which Telegram sends the secret token set with set_webhook.
+    """
+    SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+    def __init__(self, bot, listen: str = "0.0.0.0", port: int = 8443, path: str = "/webhook",
+                 secret_token: Optional[str] = None, workers: int = 8, queue_size: int = 100):
+        """
+        Initializes the server without starting it.
+
+        :param bot: The TeleBot instance (or any object with process_new_updates) handling the updates.
+        :param listen: Address to listen on.
+        :param port: Port to listen on; 0 picks a free port.
+        :param path: URL path Telegram posts updates to.
+        :param secret_token: Token every request must carry in the secret header, if set.
+        :param workers: Number of threads handling updates.
+        :param queue_size: Number of updates allowed to wait for a free worker.
+        """
+        self.bot = bot
+        self.path = path
+        self.secret_token = secret_token
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="webhook")
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self._lock = threading.Lock()
+        self.received = 0
+        self.rejected = 0
+        self.handled = 0
+        self.httpd = _HTTPServer((listen, port), self._make_handler())
+
+    @property
+    def address(self):
+        """
+        The address the server is bound to, useful when it was started on port 0.
+
+        :return: A tuple (host, port).
+        """
+        return self.httpd.server_address
+
+    def _make_handler(self):
+        """
+        Builds the request handler class bound to this server.
+
+        :return: A BaseHTTPRequestHandler subclass.
+        """
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if self.path != server.path:
+                    self.send_error(404)
+                    return
+                if server.secret_token is not None and not hmac.compare_digest(
+                        self.headers.get(server.SECRET_HEADER, ""), server.secret_token):
+                    self.send_error(403)
+                    return
+                try:
+                    body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                    update = Update.de_json(json.loads(body))
+                except (ValueError, TypeError, KeyError, AttributeError):  # not JSON, or not an update object
+                    update = None
+                if update is None:
+                    self.send_error(400)
+                    return
+                if not server.submit(update):
+                    self.send_error(503)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass  # requests are counted instead of logged one by one
+
+        return Handler
+
+    def submit(self, update: Update) -> bool:
+        """
+        Queues an update for the worker pool.
+
+        :param update: The update received from Telegram.
+        :return: False if the pool is saturated and the update was rejected.
+        """
+        with self._lock:
+            self.received += 1
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            return False
+        self.pool.submit(self._handle, update)
+        return True
+
+    def _handle(self, update: Update):
+        """
+        Runs the bot's handlers for one update in a worker thread.
+
+        :param update: The update received from Telegram.
+        :return: None
+        """
+        try:
+            self.bot.process_new_updates([update])
+            with self._lock:
+                self.handled += 1
+        except Exception as e:
+            logger.error("Failed to handle update %s: %s", update.update_id, e)
+        finally:
+            self._slots.release()
+
+    def serve_forever(self):
+        """
+        Serves requests until shutdown() is called.
+
+        :return: None
+        """
+        logger.info("Webhook server listening on %s:%s%s", *self.address, self.path)
+        try:
+            self.httpd.serve_forever()
+        finally:
+            self.httpd.server_close()
+            self.pool.shutdown(wait=True)
+            logger.info("Webhook server stopped: %s", self.stats())
+
+    def shutdown(self):
+        """
+        Stops serve_forever() from another thread.
+
+        :return: None
+        """
+        self.httpd.shutdown()
+
+    def stats(self):
+        """
+        Returns the update counters.
+
+        :return: A dictionary with received, rejected and handled updates.
+        """
+        return {"received": self.received, "rejected": self.rejected, "handled": self.handled}